@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Elastic Security Agent Mesh — Endpoint Action Poller
+
+Tracks every outstanding Elastic Defend response action (execute, isolate,
+release, ...) and writes a completion record to the endpoint-action-results
+index as soon as each one finishes. The document ID is the action ID.
+
+Without it, every workflow that submits an action polls
+/api/endpoint/action/{id} on its own fixed ladder of waits. That ladder
+wastes time after a fast action completes and gives up before a slow one
+does, and ten concurrent actions run ten ladders. The poller replaces them
+with one batched loop:
+
+  - Each poll is a single paged call to the action list API
+    (/api/endpoint/action), limited to the window since the oldest
+    outstanding action. Outputs are requested only for the actions that
+    were still outstanding, so the batch stays small.
+  - Every action that has finished and has not been recorded yet is written
+    with _bulk using the "create" op, so any number of pollers can run and
+    a record is never overwritten. Bulk Contain Hosts tracking documents
+    still "submitted" for any finished action in the window, whether its
+    record was created now, already existed (409) or was created by an
+    earlier poll, are updated in the same pass, so a tracking document
+    written after its action was recorded is still caught up. One action
+    can cover a chunk of hosts; each document takes its own endpoint's
+    entry from the record's agent_state.
+  - The interval adapts. It drops to --min-interval whenever an action is
+    submitted or finishes, doubles while outstanding actions stay quiet,
+    and caps at --max-interval.
+
+Workflows wait on the completion record with a cheap Elasticsearch GET.
+It returns 404 until the record exists, so a step retried with
+`on-failure.retry` resumes within one retry delay of the action finishing
+(see workflows/utilities/execute-and-retrieve.yaml). Agents read the same
+record through Get Action Status.
+
+Uses the same environment variables as setup.py:
+    export ELASTIC_CLOUD_URL=https://your-deployment.es.region.gcp.cloud.es.io
+    export KIBANA_URL=https://your-deployment.kb.region.gcp.cloud.es.io
+    export ES_API_KEY=your-es-api-key
+    export KIBANA_API_KEY=your-kibana-api-key
+
+Usage:
+    python scripts/action_poller.py                       # Run until interrupted
+    python scripts/action_poller.py --once                # Record what has finished, then exit
+    python scripts/action_poller.py --lookback-minutes 240  # Also catch up on older actions at start
+"""
+
+import argparse
+import json
+import os
+import signal
+import threading
+from datetime import datetime, timedelta, timezone
+
+from dispatch_worker import _now, log
+from setup import (
+    DEFAULT_MAX_RPS,
+    api_request,
+    configure_api_client,
+    es_headers,
+    kibana_base_url,
+    kibana_headers,
+    send_bulk_chunk,
+    validate_env,
+)
+
+RESULTS_INDEX = "endpoint-action-results"
+ACTION_PAGE_SIZE = 100
+MAX_ACTION_PAGES = 20
+DEFAULT_MIN_INTERVAL = 1.0
+DEFAULT_MAX_INTERVAL = 10.0
+DEFAULT_LOOKBACK_MINUTES = 60
+WINDOW_OVERLAP_SECONDS = 60
+ENDPOINT_API_VERSION = "2023-10-31"
+
+# Copies a finished action's outcome onto the Bulk Contain Hosts tracking
+# documents ("bulk_target") that reference it. One action covers a chunk of
+# hosts, so each document takes its own endpoint's entry from the action's
+# per-agent state when there is one.
+BULK_TARGET_SCRIPT = (
+    "def r = params.results[ctx._source.action_id]; "
+    "if (r == null) { ctx.op = 'noop'; return; } "
+    "if (r.agents != null && r.agents[ctx._source.endpoint_id] != null) { r = r.agents[ctx._source.endpoint_id]; } "
+    "if (ctx._source.status == r.status) { ctx.op = 'noop'; return; } "
+    "ctx._source.status = r.status; ctx._source.was_successful = r.was_successful; "
+    "ctx._source.completed_at = r.completed_at;"
+)
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def _iso(moment):
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+def is_finished(action):
+    return bool(action.get("isCompleted") or action.get("isExpired"))
+
+
+def _outcome(is_completed, was_successful, is_expired):
+    if is_expired and not is_completed:
+        return "expired"
+    return "successful" if was_successful else "failed"
+
+
+def completion_record(action):
+    """The endpoint-action-results document for a finished action.
+
+    agent_state holds each endpoint's own outcome, for actions that cover
+    several hosts (Bulk Contain Hosts submits one per chunk).
+    """
+    status = _outcome(action.get("isCompleted"), action.get("wasSuccessful"), action.get("isExpired"))
+    agent_state = {
+        agent_id: {
+            "status": _outcome(state.get("isCompleted"), state.get("wasSuccessful"), action.get("isExpired")),
+            "was_successful": bool(state.get("wasSuccessful")),
+            "completed_at": state.get("completedAt") or action.get("completedAt"),
+        }
+        for agent_id, state in (action.get("agentState") or {}).items()
+    }
+    hosts = action.get("hosts") or {}
+    errors = action.get("errors") or []
+    return {
+        "action_id": action.get("id"),
+        "command": action.get("command"),
+        "agent_ids": action.get("agents") or [],
+        "host_names": [host.get("name") for host in hosts.values() if host.get("name")],
+        "status": status,
+        "was_successful": bool(action.get("wasSuccessful")),
+        "is_expired": bool(action.get("isExpired")),
+        "created_by": action.get("createdBy"),
+        "comment": action.get("comment"),
+        "started_at": action.get("startedAt"),
+        "completed_at": action.get("completedAt"),
+        "recorded_at": _now(),
+        "hosts": hosts,
+        "agent_state": agent_state,
+        "outputs": action.get("outputs") or {},
+        "errors": "\n".join(str(error) for error in errors) if isinstance(errors, list) else str(errors),
+    }
+
+
+class ActionPoller:
+    """Records finished endpoint response actions, polling all outstanding ones in one batch."""
+
+    def __init__(self, min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL,
+                 lookback_minutes=DEFAULT_LOOKBACK_MINUTES):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.window_start = datetime.now(timezone.utc) - timedelta(minutes=lookback_minutes)
+        self.outstanding = {}
+        self.recorded = set()
+        self.stopping = threading.Event()
+        self.counts = {"recorded": 0, "polls": 0}
+
+    def list_actions(self, with_outputs=None):
+        """Every response action started since the window start, newest first. None on error.
+
+        with_outputs lists the action IDs whose outputs should be included.
+        """
+        actions = []
+        params = {
+            "startDate": _iso(self.window_start),
+            "pageSize": ACTION_PAGE_SIZE,
+        }
+        if with_outputs:
+            params["withOutputs"] = sorted(with_outputs)
+        for page in range(1, MAX_ACTION_PAGES + 1):
+            resp = api_request(
+                "GET",
+                f"{kibana_base_url()}/api/endpoint/action",
+                headers={**kibana_headers(), "elastic-api-version": ENDPOINT_API_VERSION},
+                params={**params, "page": page},
+            )
+            if not resp.ok:
+                log(f"[WARN] Could not list endpoint actions: {resp.status_code} — {resp.text[:200]}")
+                return None
+            batch = resp.json().get("data", [])
+            actions.extend(batch)
+            if len(batch) < ACTION_PAGE_SIZE:
+                break
+        return actions
+
+    def record(self, actions):
+        """Create completion records for finished actions. Returns how many were new."""
+        records = {action["id"]: completion_record(action) for action in actions}
+        items = [
+            (RESULTS_INDEX, action_id, (json.dumps({"create": {"_index": RESULTS_INDEX, "_id": action_id}}) + "\n"
+                                        + json.dumps(doc) + "\n").encode("utf-8"))
+            for action_id, doc in records.items()
+        ]
+        if not items:
+            return 0
+        results, failures, _ = send_bulk_chunk(items)
+        for _, action_id, _ in results:
+            self.recorded.add(action_id)
+            log(f"[{records[action_id]['status']}] {records[action_id]['command']} {action_id}")
+        for _, action_id, reason in failures:
+            if reason.startswith("409"):
+                self.recorded.add(action_id)
+            else:
+                log(f"[WARN] Could not record action {action_id}: {reason}")
+        return len(results)
+
+    def mark_bulk_targets(self, records):
+        """Update still-submitted bulk_target documents of recorded actions in one _update_by_query."""
+        if not records:
+            return
+        resp = api_request(
+            "POST",
+            f"{os.environ['ELASTIC_CLOUD_URL'].rstrip('/')}/{RESULTS_INDEX}/_update_by_query",
+            headers=es_headers(),
+            params={"conflicts": "proceed", "refresh": "true"},
+            json={
+                "query": {"bool": {"filter": [
+                    {"term": {"kind": "bulk_target"}},
+                    {"term": {"status": "submitted"}},
+                    {"terms": {"action_id": sorted(records)}},
+                ]}},
+                "script": {"source": BULK_TARGET_SCRIPT, "params": {"results": {
+                    action_id: {**{key: doc[key] for key in ("status", "was_successful", "completed_at")},
+                                "agents": doc["agent_state"]}
+                    for action_id, doc in records.items()
+                }}},
+            },
+        )
+        if not resp.ok:
+            log(f"[WARN] Could not update bulk containment targets: {resp.status_code} — {resp.text[:200]}")
+
+    def poll(self):
+        """One batch: list, record what finished, track the rest. Returns True if anything changed."""
+        self.counts["polls"] += 1
+        polled_at = datetime.now(timezone.utc)
+        actions = self.list_actions(self.outstanding)
+        if actions is None:
+            return False
+        finished = {}
+        still_open = {}
+        settled = {}
+        for action in actions:
+            action_id = action.get("id")
+            if not action_id:
+                continue
+            if action_id in self.recorded:
+                settled[action_id] = action
+                continue
+            if is_finished(action):
+                finished[action_id] = action
+            else:
+                still_open[action_id] = action
+        # Actions that finished before a poll ever saw them open had no
+        # outputs requested; fetch those in one more batch.
+        missing = [action_id for action_id, action in finished.items()
+                   if action_id not in self.outstanding and not action.get("outputs")]
+        if missing:
+            for action in self.list_actions(missing) or []:
+                if action.get("id") in finished and action.get("outputs"):
+                    finished[action["id"]] = action
+        new_ids = set(still_open) - set(self.outstanding)
+        recorded = self.record(list(finished.values()))
+        self.counts["recorded"] += recorded
+        self.mark_bulk_targets({
+            action_id: completion_record(action)
+            for action_id, action in {**settled, **finished}.items()
+            if action_id in self.recorded
+        })
+        self.outstanding = still_open
+        self.recorded &= {action.get("id") for action in actions}
+
+        # Next window: from the oldest action still open, but never later
+        # than this poll minus an overlap for clock skew with Kibana.
+        starts = [_parse_time(action.get("startedAt")) for action in still_open.values()]
+        oldest = min([start for start in starts if start], default=None)
+        horizon = polled_at - timedelta(seconds=WINDOW_OVERLAP_SECONDS)
+        self.window_start = min(oldest, horizon) if oldest else horizon
+        return bool(recorded or new_ids)
+
+    def run(self, once=False):
+        """Poll until stopped. With once, record what has already finished and exit."""
+        interval = self.min_interval
+        while not self.stopping.is_set():
+            changed = self.poll()
+            if once:
+                break
+            if changed:
+                interval = self.min_interval
+            elif self.outstanding:
+                interval = min(self.max_interval, interval * 2)
+            else:
+                interval = self.max_interval
+            self.stopping.wait(interval)
+        return self.counts
+
+    def stop(self, *_):
+        self.stopping.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Elastic Security Agent Mesh endpoint action poller")
+    parser.add_argument("--once", action="store_true",
+                        help="Record every action that has already finished, then exit")
+    parser.add_argument("--min-interval", type=float, default=DEFAULT_MIN_INTERVAL, metavar="S",
+                        help=f"Poll interval right after a change (default: {DEFAULT_MIN_INTERVAL:g})")
+    parser.add_argument("--max-interval", type=float, default=DEFAULT_MAX_INTERVAL, metavar="S",
+                        help=f"Longest poll interval, used when nothing is outstanding (default: {DEFAULT_MAX_INTERVAL:g})")
+    parser.add_argument("--lookback-minutes", type=int, default=DEFAULT_LOOKBACK_MINUTES, metavar="M",
+                        help=f"On start, also record actions from the last M minutes (default: {DEFAULT_LOOKBACK_MINUTES})")
+    parser.add_argument("--max-rps", type=float, default=DEFAULT_MAX_RPS, metavar="RPS",
+                        help=f"Upper bound on API requests per second (default: {DEFAULT_MAX_RPS:g})")
+    args = parser.parse_args()
+    if args.min_interval < 0.5 or args.max_interval < args.min_interval:
+        parser.error("--min-interval must be at least 0.5 and no larger than --max-interval")
+
+    validate_env()
+    configure_api_client(args.max_rps, 1)
+    poller = ActionPoller(args.min_interval, args.max_interval, args.lookback_minutes)
+    signal.signal(signal.SIGTERM, poller.stop)
+    signal.signal(signal.SIGINT, poller.stop)
+    log(f"Endpoint action poller started (every {args.min_interval:g}–{args.max_interval:g}s)")
+    counts = poller.run(once=args.once)
+    log(f"Endpoint action poller stopped: {counts['recorded']} results recorded in {counts['polls']} polls")
+
+
+if __name__ == "__main__":
+    main()
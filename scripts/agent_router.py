@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Elastic Security Agent Mesh — Agent Router
+
+In-memory routing index for the Orchestrator Router workflow
+(workflows/mesh/orchestrator-router.yaml). The workflow's fallback path runs
+a semantic query against agent-registry for every request. That query
+embeds the request with a fresh inference call and then scores a handful
+of documents, about 8 of them (one per register_agents_in_mesh() entry).
+
+The router keeps that small registry in memory instead:
+
+  - Each active agent's semantic_description is embedded once, in a single
+    inference call. The vectors are L2-normalised and stored row-major in
+    one flat float array (one row per agent), so scoring a request is one
+    dot product per row.
+  - The score is cosine similarity plus keyword boosting. Each of the
+    agent's registry keywords found in the request adds KEYWORD_BOOST, and
+    each capability adds CAPABILITY_BOOST. Both are capped, so keywords
+    refine the semantic ranking rather than override it.
+  - Routes are returned as ranked top-k candidates. Each has a confidence:
+    a softmax over the candidates' scores, so it sums to 1 across agents.
+  - Routes for repeated requests (same text after case and whitespace
+    folding) come from an LRU cache, without any inference call.
+  - The registry's fingerprint (document IDs and updated_at) is checked
+    every --refresh-seconds. Any change, such as a re-run of setup.py,
+    rebuilds the matrix and clears the cache.
+
+If the inference endpoint cannot produce dense embeddings (e.g. an ELSER
+sparse endpoint), the router ranks on keywords and capabilities alone.
+
+Run it as a small HTTP service and set ROUTER_URL before importing
+workflows; the Orchestrator Router then calls POST {ROUTER_URL}/route and
+falls back to the semantic registry search if the router is unreachable.
+
+Uses the same environment variables as setup.py:
+    export ELASTIC_CLOUD_URL=https://your-deployment.es.region.gcp.cloud.es.io
+    export ES_API_KEY=your-es-api-key
+    export INFERENCE_ENDPOINT_ID=.multilingual-e5-small-elasticsearch   # optional
+    export ROUTER_TOKEN=shared-secret                                     # optional, required on requests if set
+
+Usage:
+    python scripts/agent_router.py --serve                 # HTTP service on 127.0.0.1:8765
+    python scripts/agent_router.py --serve --host 0.0.0.0  # Reachable from Kibana
+    python scripts/agent_router.py --route "is this hash malicious?"  # Rank agents for one request
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import signal
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from dispatch_worker import log
+from setup import DEFAULT_MAX_RPS, api_request, configure_api_client, es_headers, validate_env
+
+REGISTRY_INDEX = "agent-registry"
+DEFAULT_INFERENCE_ID = ".multilingual-e5-small-elasticsearch"
+DEFAULT_TOP_K = 3
+DEFAULT_REFRESH_SECONDS = 30
+DEFAULT_PORT = 8765
+ROUTE_CACHE_SIZE = 1024
+KEYWORD_BOOST = 0.08
+MAX_KEYWORD_BOOST = 0.24
+CAPABILITY_BOOST = 0.04
+MAX_CAPABILITY_BOOST = 0.08
+CONFIDENCE_TEMPERATURE = 0.05
+MAX_REQUEST_BYTES = 65536
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalise(text):
+    """Lowercase words joined by single spaces, used as the cache key and for keyword matching."""
+    return " ".join(WORD_RE.findall((text or "").lower()))
+
+
+def _unit(vector):
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector] if norm else list(vector)
+
+
+def _phrase_in(phrase, padded_text):
+    phrase = normalise(phrase)
+    return bool(phrase) and f" {phrase} " in padded_text
+
+
+class RoutingIndex:
+    """The active agents of agent-registry as a normalised embedding matrix plus keyword sets."""
+
+    def __init__(self, inference_id=None, refresh_seconds=DEFAULT_REFRESH_SECONDS, cache_size=ROUTE_CACHE_SIZE):
+        self.es_url = os.environ["ELASTIC_CLOUD_URL"].rstrip("/")
+        self.inference_id = inference_id or os.environ.get("INFERENCE_ENDPOINT_ID", DEFAULT_INFERENCE_ID)
+        self.refresh_seconds = refresh_seconds
+        self.cache_size = cache_size
+        self.agents = []
+        self.matrix = array("f")
+        self.dims = 0
+        self.fingerprint = None
+        self.checked_at = 0.0
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.background = False
+        self.stats = {"routes": 0, "cache_hits": 0, "refreshes": 0, "embed_failures": 0}
+
+    def embed(self, texts, input_type="search"):
+        """Dense embeddings for texts in one inference call, or None if unavailable.
+
+        input_type is "ingest" for agent descriptions and "search" for
+        requests, as semantic_text does, so asymmetric models such as E5
+        get the right prefixes. Endpoints that reject the field are asked
+        again without it.
+        """
+        url = f"{self.es_url}/_inference/text_embedding/{self.inference_id}"
+        try:
+            resp = api_request("POST", url, headers=es_headers(),
+                               json={"input": list(texts), "input_type": input_type})
+            if resp.status_code == 400:
+                resp = api_request("POST", url, headers=es_headers(), json={"input": list(texts)})
+        except requests.RequestException as exc:
+            log(f"[WARN] Inference call failed: {exc}")
+            return None
+        if not resp.ok:
+            log(f"[WARN] Inference endpoint {self.inference_id}: {resp.status_code} — {resp.text[:200]}")
+            return None
+        rows = resp.json().get("text_embedding", [])
+        if len(rows) != len(texts):
+            return None
+        return [_unit(row["embedding"]) for row in rows]
+
+    def _fetch_registry(self):
+        resp = api_request(
+            "POST",
+            f"{self.es_url}/{REGISTRY_INDEX}/_search",
+            headers=es_headers(),
+            json={
+                "size": 100,
+                "_source": ["agent_id", "agent_name", "domain", "capabilities", "keywords",
+                            "description", "updated_at"],
+                "query": {"term": {"status": "active"}},
+                "sort": [{"_doc": "asc"}],
+            },
+        )
+        if not resp.ok:
+            log(f"[WARN] Could not read {REGISTRY_INDEX}: {resp.status_code} — {resp.text[:200]}")
+            return None
+        return resp.json().get("hits", {}).get("hits", [])
+
+    def refresh(self, force=False):
+        """Rebuild the index if the registry changed since the last check. Returns True if rebuilt."""
+        now = time.monotonic()
+        if not force and not self.background and now - self.checked_at < self.refresh_seconds:
+            return False
+        self.checked_at = now
+        hits = self._fetch_registry()
+        if hits is None:
+            return False
+        fingerprint = tuple(sorted((hit["_id"], hit["_source"].get("updated_at", "")) for hit in hits))
+        if fingerprint == self.fingerprint and not force:
+            return False
+        agents = []
+        for hit in hits:
+            source = hit["_source"]
+            agents.append({
+                "agent_id": source.get("agent_id") or hit["_id"],
+                "agent_name": source.get("agent_name", ""),
+                "domain": source.get("domain", ""),
+                "keywords": [kw for kw in source.get("keywords", []) if normalise(kw)],
+                "capabilities": [cap for cap in source.get("capabilities", []) if normalise(cap)],
+                # Same text register_agents_in_mesh() puts in semantic_description.
+                "text": f"{source.get('agent_name', '')}. {source.get('description', '')}".strip(),
+            })
+        vectors = self.embed([agent["text"] for agent in agents], "ingest") if agents else []
+        matrix = array("f")
+        dims = 0
+        if vectors:
+            dims = len(vectors[0])
+            for vector in vectors:
+                matrix.extend(vector)
+        else:
+            self.stats["embed_failures"] += 1
+        with self.lock:
+            self.agents, self.matrix, self.dims = agents, matrix, dims
+            # Without vectors the fingerprint stays unset, so the next check
+            # rebuilds (and embeds again) even if the registry is unchanged.
+            self.fingerprint = fingerprint if vectors or not agents else None
+            self.cache.clear()
+        self.stats["refreshes"] += 1
+        log(f"[refresh] {len(agents)} agents, "
+            + (f"{dims}-dim vectors" if dims else "keyword scoring only (no dense embeddings)"))
+        return True
+
+    def start_refresher(self):
+        """Check the registry on a background thread, so requests never wait on a refresh."""
+        def loop():
+            while not self.stopping.wait(self.refresh_seconds):
+                try:
+                    self.refresh(force=False)
+                except requests.RequestException as exc:
+                    log(f"[WARN] Registry refresh failed: {exc}")
+        self.background = True
+        threading.Thread(target=loop, name="registry-refresh", daemon=True).start()
+
+    def score(self, text, query_vector=None):
+        """Score every agent for text. Returns [(score, agent, matched keywords)], best first."""
+        padded = f" {normalise(text)} "
+        with self.lock:
+            agents, matrix, dims = self.agents, self.matrix, self.dims
+        scored = []
+        for row, agent in enumerate(agents):
+            similarity = 0.0
+            if query_vector is not None and dims:
+                offset = row * dims
+                similarity = sum(q * m for q, m in zip(query_vector, matrix[offset:offset + dims]))
+            matched = [kw for kw in agent["keywords"] if _phrase_in(kw, padded)]
+            capabilities = sum(1 for cap in agent["capabilities"] if _phrase_in(cap.replace("-", " "), padded))
+            boost = (min(MAX_KEYWORD_BOOST, KEYWORD_BOOST * len(matched))
+                     + min(MAX_CAPABILITY_BOOST, CAPABILITY_BOOST * capabilities))
+            scored.append((similarity + boost, agent, matched))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored
+
+    def route(self, text, top_k=DEFAULT_TOP_K):
+        """Ranked top-k candidates for text: [{agent_id, agent_name, domain, score, confidence, matched_keywords}].
+
+        Returns (candidates, cached).
+        """
+        if not self.background:
+            self.refresh()
+        self.stats["routes"] += 1
+        key = normalise(text)
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cache.move_to_end(key)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            return cached[:top_k], True
+        query_vector = None
+        if self.dims:
+            vectors = self.embed([text])
+            if vectors:
+                query_vector = vectors[0]
+            else:
+                self.stats["embed_failures"] += 1
+        scored = self.score(text, query_vector)
+        if not scored:
+            return [], False
+        best = scored[0][0]
+        weights = [math.exp((score - best) / CONFIDENCE_TEMPERATURE) for score, _, _ in scored]
+        total = sum(weights)
+        candidates = [
+            {
+                "agent_id": agent["agent_id"],
+                "agent_name": agent["agent_name"],
+                "domain": agent["domain"],
+                "score": round(score, 4),
+                "confidence": round(weight / total, 4),
+                "matched_keywords": matched,
+            }
+            for (score, agent, matched), weight in zip(scored, weights)
+        ]
+        # Only cache routes that used the semantic score, so an inference
+        # failure (here or at the last refresh) is not remembered.
+        if query_vector is not None:
+            with self.lock:
+                self.cache[key] = candidates
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return candidates[:top_k], False
+
+
+def make_handler(index, token=None):
+    class RouteHandler(BaseHTTPRequestHandler):
+        def _reply(self, status, body):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _authorised(self):
+            if token and self.headers.get("Authorization", "") != f"Bearer {token}":
+                self._reply(401, {"error": "missing or invalid bearer token"})
+                return False
+            return True
+
+        def do_GET(self):
+            if self.path != "/health":
+                self._reply(404, {"error": "not found"})
+                return
+            if not self._authorised():
+                return
+            self._reply(200, {"agents": len(index.agents), "dims": index.dims, **index.stats})
+
+        def do_POST(self):
+            if self.path != "/route":
+                self._reply(404, {"error": "not found"})
+                return
+            if not self._authorised():
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_REQUEST_BYTES:
+                self._reply(413, {"error": "request too large"})
+                return
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+                text = str(body.get("request", ""))
+                top_k = max(1, int(body.get("top_k", DEFAULT_TOP_K)))
+            except (ValueError, TypeError, AttributeError):
+                self._reply(400, {"error": "body must be JSON with a request string"})
+                return
+            if not text.strip():
+                self._reply(400, {"error": "request is empty"})
+                return
+            started = time.perf_counter()
+            candidates, cached = index.route(text, top_k)
+            self._reply(200, {
+                "candidates": candidates,
+                "cached": cached,
+                "took_us": int((time.perf_counter() - started) * 1_000_000),
+            })
+
+        def log_message(self, *_):
+            pass
+
+    return RouteHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Elastic Security Agent Mesh in-memory agent router")
+    parser.add_argument("--serve", action="store_true", help="Run the routing HTTP service")
+    parser.add_argument("--route", metavar="TEXT", help="Print the ranked agents for one request and exit")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K, metavar="K",
+                        help=f"Candidates returned by --route (default: {DEFAULT_TOP_K})")
+    parser.add_argument("--refresh-seconds", type=float, default=DEFAULT_REFRESH_SECONDS, metavar="S",
+                        help=f"How often to check agent-registry for changes (default: {DEFAULT_REFRESH_SECONDS})")
+    parser.add_argument("--max-rps", type=float, default=DEFAULT_MAX_RPS, metavar="RPS",
+                        help=f"Upper bound on API requests per second (default: {DEFAULT_MAX_RPS:g})")
+    args = parser.parse_args()
+    if args.serve == bool(args.route):
+        parser.error("give exactly one of --serve or --route")
+
+    validate_env()
+    configure_api_client(args.max_rps, 4)
+    index = RoutingIndex(refresh_seconds=args.refresh_seconds)
+    index.refresh(force=True)
+
+    if args.route:
+        started = time.perf_counter()
+        candidates, _ = index.route(args.route, args.top_k)
+        took = (time.perf_counter() - started) * 1000
+        for rank, candidate in enumerate(candidates, 1):
+            keywords = f"  [{', '.join(candidate['matched_keywords'])}]" if candidate["matched_keywords"] else ""
+            print(f"  {rank}. {candidate['agent_name']} ({candidate['agent_id']}) "
+                  f"score {candidate['score']:.3f}, confidence {candidate['confidence']:.0%}{keywords}")
+        print(f"\n  Routed in {took:.1f} ms")
+        return
+
+    index.start_refresher()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(index, os.environ.get("ROUTER_TOKEN")))
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    log(f"Agent router listening on http://{args.host}:{args.port} ({len(index.agents)} agents)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        index.stopping.set()
+        server.server_close()
+    log(f"Agent router stopped: {index.stats['routes']} routes, {index.stats['cache_hits']} from cache")
+
+
+if __name__ == "__main__":
+    main()
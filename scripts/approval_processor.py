@@ -0,0 +1,536 @@
+#!/usr/bin/env python3
+"""
+Elastic Security Agent Mesh — Approval Processor
+
+Long-running replacement for the Approval Monitor workflow
+(workflows/governance/approval-monitor.yaml). The workflow wakes every 2
+minutes, takes at most 10 pending approvals and fetches the latest comment
+of each one's case, so both approval latency and Kibana load grow with the
+number of outstanding approvals. The processor polls every few seconds
+and does the same work in batches:
+
+  1. One search for every pending approval (paged).
+  2. Approvals older than their policy's ttl_minutes (action-policies) are
+     expired in a single _bulk request, with a comment on each case.
+  3. One paged Cases API query, sorted by updatedAt, returns every case
+     updated since the last checkpoint. Comments are only fetched for the
+     cases in that batch that have pending approvals, once per case no
+     matter how many approvals it holds.
+  4. Every decision found is applied with _bulk: approvals are resolved
+     with conditional updates (if_seq_no/if_primary_term), approved ones
+     get their dispatch request created (_create, same ID as the workflow
+     uses), and each case gets one comment summarising its decisions.
+
+A human's "APPROVED" comment therefore becomes a queued dispatch within one
+poll interval (default 5 seconds). A decision that could not be written is
+read again on the next poll, and an approved approval whose dispatch could
+not be created (still "approved", no execution_result) is queued again. The checkpoint starts at the oldest
+pending approval, because no earlier case update can hold a decision on
+it, and then follows the newest case update seen, minus an overlap for
+clock skew between Kibana and this host. Case updates the processor has
+already looked at are skipped even inside the overlap.
+
+A decision comment is the newest comment on the case, newer than the
+approval, that contains APPROVED or DENIED as a word (APPROVED wins if
+both appear, as in the workflow) and was not written by the mesh itself.
+If it names approval IDs (apr-...), it only applies to those.
+
+Because every status change is conditional and the dispatch ID is derived
+from the approval ID, the processor can run alongside the workflow (or a
+second processor) without an approval being dispatched twice.
+
+Uses the same environment variables as setup.py:
+    export ELASTIC_CLOUD_URL=https://your-deployment.es.region.gcp.cloud.es.io
+    export KIBANA_URL=https://your-deployment.kb.region.gcp.cloud.es.io
+    export ES_API_KEY=your-es-api-key
+    export KIBANA_API_KEY=your-kibana-api-key
+
+Usage:
+    python scripts/approval_processor.py                     # Run until interrupted
+    python scripts/approval_processor.py --once              # One pass, then exit
+    python scripts/approval_processor.py --poll-seconds 2    # Poll every 2 seconds
+"""
+
+import argparse
+import os
+import re
+import signal
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from dispatch_worker import DISPATCH_INDEX, PRIORITY_RANK, _now, comment_on_case, log
+from setup import (
+    DEFAULT_MAX_RPS,
+    api_request,
+    bulk_write,
+    configure_api_client,
+    es_headers,
+    kibana_base_url,
+    kibana_headers,
+    validate_env,
+)
+
+APPROVAL_INDEX = "approval-requests"
+POLICY_INDEX = "action-policies"
+DEFAULT_POLL_SECONDS = 5.0
+PENDING_PAGE_SIZE = 1000
+CASES_PAGE_SIZE = 100
+COMMENTS_PAGE_SIZE = 50
+MAX_COMMENT_PAGES = 5
+CHECKPOINT_OVERLAP_SECONDS = 60
+POLICY_REFRESH_SECONDS = 300
+CASES_API_VERSION = "2023-10-31"
+
+APPROVED_RE = re.compile(r"\bAPPROVED\b")
+DENIED_RE = re.compile(r"\bDENIED\b")
+APPROVAL_ID_RE = re.compile(r"\bapr-\d+\b")
+
+# Approvals the processor still has work on: pending ones, and approved ones
+# whose dispatch was never queued (no execution_result yet).
+OPEN_APPROVALS_QUERY = {"bool": {
+    "should": [
+        {"term": {"status": "pending"}},
+        {"bool": {
+            "filter": [{"term": {"status": "approved"}}],
+            "must_not": [{"exists": {"field": "execution_result"}}],
+        }},
+    ],
+    "minimum_should_match": 1,
+}}
+
+# Comments the mesh itself posts on a case; never read as a human decision.
+MESH_COMMENT_MARKERS = (
+    "Human Approval Required",
+    "## Action Approved and Dispatched",
+    "## Action Denied",
+    "## Approval Expired",
+)
+
+
+def _parse_time(value):
+    """Parse an ES / Kibana timestamp ("...Z", with or without millis) to an aware datetime."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def find_decision(comments, approval):
+    """Return ("approved" | "denied", comment) for the newest human decision on approval, or None.
+
+    comments must be newest first. Only comments newer than the approval
+    count; a comment naming approval IDs only decides those.
+    """
+    created = _parse_time(approval.get("created_at"))
+    for comment in comments:
+        text = comment.get("comment") or ""
+        at = _parse_time(comment.get("created_at"))
+        if created and at and at < created:
+            break
+        if any(marker in text for marker in MESH_COMMENT_MARKERS):
+            continue
+        named = set(APPROVAL_ID_RE.findall(text))
+        if named and approval.get("approval_id") not in named:
+            continue
+        if APPROVED_RE.search(text):
+            return "approved", comment
+        if DENIED_RE.search(text):
+            return "denied", comment
+    return None
+
+
+def approval_dispatch(approval):
+    """The dispatch request for an approved action — same document the workflow writes."""
+    return {
+        "dispatch_id": f"apr-dispatch-{approval.get('approval_id')}",
+        "requesting_agent": "approval-monitor",
+        "target_agent": approval.get("target_agent", ""),
+        "case_id": approval.get("case_id", ""),
+        "investigation_id": approval.get("investigation_id", ""),
+        "dedupe_key": f"{approval.get('case_id', '')}:{approval.get('target_agent', '')}",
+        "priority": "urgent",
+        "priority_rank": PRIORITY_RANK["urgent"],
+        "context": (
+            "APPROVED ACTION — Execute the following approved action.\n\n"
+            f"Approval ID: {approval.get('approval_id')}\n"
+            f"Case ID: {approval.get('case_id')}\n"
+            f"Investigation ID: {approval.get('investigation_id')}\n"
+            f"Action: {approval.get('action_type')}\n"
+            f"Target: {approval.get('target')}\n"
+            f"Risk Tier: {approval.get('risk_tier')}\n\n"
+            "Context from the requesting agent:\n"
+            f"{approval.get('context', '')}\n\n"
+            "Instructions:\n"
+            "1. Execute the approved action described above\n"
+            f"2. Add a case comment to {approval.get('case_id')} documenting what was done and the result\n"
+            "3. If the action completes successfully, update the case with your findings\n"
+            "4. If the action fails, add a case comment explaining the failure\n"
+        ),
+        "status": "pending",
+        "created_at": _now(),
+    }
+
+
+def _dispatched_note(source):
+    """The case comment posted when an approved action's dispatch is queued."""
+    return (
+        "## Action Approved and Dispatched\n\n"
+        f"**Approval ID:** {source.get('approval_id')}\n"
+        f"**Action:** {source.get('action_type')} on {source.get('target')}\n"
+        f"**Dispatched to:** {source.get('target_agent')}\n\n"
+        "The approved action has been queued for dispatch. Results will be posted as follow-up comments."
+    )
+
+
+class ApprovalProcessor:
+    """Resolves pending approvals in batches from case updates since a checkpoint."""
+
+    def __init__(self, poll_seconds=DEFAULT_POLL_SECONDS):
+        self.es_url = os.environ["ELASTIC_CLOUD_URL"].rstrip("/")
+        self.poll_seconds = poll_seconds
+        self.checkpoint = None
+        self.case_seen = {}
+        self.ttl_minutes = {}
+        self.policies_loaded_at = 0.0
+        self.stopping = threading.Event()
+        self.counts = {"approved": 0, "denied": 0, "expired": 0}
+
+    def load_policies(self):
+        """Refresh {action_type: ttl_minutes} from action-policies every POLICY_REFRESH_SECONDS."""
+        if time.monotonic() - self.policies_loaded_at < POLICY_REFRESH_SECONDS and self.ttl_minutes:
+            return
+        resp = api_request(
+            "POST",
+            f"{self.es_url}/{POLICY_INDEX}/_search",
+            headers=es_headers(),
+            json={"size": 1000, "_source": ["action_type", "ttl_minutes"],
+                  "query": {"exists": {"field": "ttl_minutes"}}},
+        )
+        if not resp.ok:
+            log(f"[WARN] Could not load action policies: {resp.status_code} — {resp.text[:200]}")
+            return
+        self.ttl_minutes = {
+            hit["_source"]["action_type"]: int(hit["_source"]["ttl_minutes"])
+            for hit in resp.json().get("hits", {}).get("hits", [])
+            if hit["_source"].get("action_type") and hit["_source"].get("ttl_minutes")
+        }
+        self.policies_loaded_at = time.monotonic()
+
+    def fetch_pending(self):
+        """Every open approval (OPEN_APPROVALS_QUERY), oldest first, paged with search_after."""
+        hits = []
+        search_after = None
+        while True:
+            body = {
+                "size": PENDING_PAGE_SIZE,
+                "seq_no_primary_term": True,
+                "query": OPEN_APPROVALS_QUERY,
+                "sort": [{"created_at": {"order": "asc", "unmapped_type": "date"}},
+                         {"approval_id": {"order": "asc", "unmapped_type": "keyword"}}],
+            }
+            if search_after:
+                body["search_after"] = search_after
+            resp = api_request("POST", f"{self.es_url}/{APPROVAL_INDEX}/_search",
+                               headers=es_headers(), json=body)
+            if not resp.ok:
+                if resp.status_code != 404:
+                    log(f"[WARN] Could not search approvals: {resp.status_code} — {resp.text[:200]}")
+                return hits
+            page = resp.json().get("hits", {}).get("hits", [])
+            hits.extend(page)
+            if len(page) < PENDING_PAGE_SIZE:
+                return hits
+            search_after = page[-1].get("sort")
+
+    def updated_cases(self):
+        """Cases updated at or after the checkpoint: {case_id: updated_at}, newest first.
+
+        Pages through the Cases API sorted by updatedAt and stops at the
+        first case older than the checkpoint.
+        """
+        updated = {}
+        page = 1
+        while True:
+            resp = api_request(
+                "GET",
+                f"{kibana_base_url()}/api/cases/_find",
+                headers={**kibana_headers(), "elastic-api-version": CASES_API_VERSION},
+                params={"sortField": "updatedAt", "sortOrder": "desc", "perPage": CASES_PAGE_SIZE,
+                        "page": page, "owner": "securitySolution"},
+            )
+            if not resp.ok:
+                log(f"[WARN] Could not list updated cases: {resp.status_code} — {resp.text[:200]}")
+                return None
+            cases = resp.json().get("cases", [])
+            for case in cases:
+                stamp = case.get("updated_at") or case.get("created_at")
+                at = _parse_time(stamp)
+                if at is None or at < self.checkpoint:
+                    return updated
+                updated[case["id"]] = stamp
+            if len(cases) < CASES_PAGE_SIZE:
+                return updated
+            page += 1
+
+    def case_comments(self, case_id, since):
+        """The case's comments, newest first, back to `since` (bounded by MAX_COMMENT_PAGES)."""
+        comments = []
+        for page in range(1, MAX_COMMENT_PAGES + 1):
+            resp = api_request(
+                "GET",
+                f"{kibana_base_url()}/api/cases/{case_id}/comments/_find",
+                headers={**kibana_headers(), "elastic-api-version": CASES_API_VERSION},
+                params={"sortOrder": "desc", "perPage": COMMENTS_PAGE_SIZE, "page": page},
+            )
+            if not resp.ok:
+                log(f"[WARN] Could not read comments on case {case_id}: {resp.status_code}")
+                return None
+            batch = resp.json().get("comments", [])
+            comments.extend(batch)
+            oldest = _parse_time(batch[-1].get("created_at")) if batch else None
+            if len(batch) < COMMENTS_PAGE_SIZE or (oldest and since and oldest < since):
+                break
+        return comments
+
+    def expire(self, pending):
+        """Expire approvals past their policy's TTL. Returns the hits still pending."""
+        now = datetime.now(timezone.utc)
+        expired = []
+        remaining = []
+        for hit in pending:
+            source = hit["_source"]
+            ttl = self.ttl_minutes.get(source.get("action_type"))
+            created = _parse_time(source.get("created_at"))
+            if ttl and created and created + timedelta(minutes=ttl) < now:
+                expired.append(hit)
+            else:
+                remaining.append(hit)
+        if not expired:
+            return remaining
+        ok, _ = bulk_write([
+            (hit["_index"], hit["_id"], "update", {
+                "seq_no": hit.get("_seq_no"), "primary_term": hit.get("_primary_term"),
+                "source": {"doc": {"status": "expired", "resolved_at": _now(), "resolved_by": "ttl"}},
+            })
+            for hit in expired
+        ])
+        for hit in expired:
+            if hit["_id"] not in ok:
+                continue
+            source = hit["_source"]
+            self.counts["expired"] += 1
+            log(f"[expired] {source.get('approval_id')} ({source.get('action_type')} on {source.get('target')})")
+            comment_on_case(source.get("case_id"), (
+                "## Approval Expired\n\n"
+                f"**Approval ID:** {source.get('approval_id')}\n"
+                f"**Action:** {source.get('action_type')} on {source.get('target')}\n\n"
+                f"No APPROVED/DENIED response within {self.ttl_minutes.get(source.get('action_type'))} minutes. "
+                "No action has been taken; request approval again if it is still needed."
+            ))
+        return remaining
+
+    def resolve(self, pending):
+        """Find decisions on updated cases and apply them. Returns how many approvals were resolved."""
+        by_case = {}
+        for hit in pending:
+            by_case.setdefault(hit["_source"].get("case_id"), []).append(hit)
+        oldest = min((_parse_time(hit["_source"].get("created_at")) for hit in pending
+                      if hit["_source"].get("created_at")), default=None)
+        if self.checkpoint is None:
+            self.checkpoint = (oldest or datetime.now(timezone.utc)) - timedelta(seconds=CHECKPOINT_OVERLAP_SECONDS)
+        updated = self.updated_cases()
+        if updated is None:
+            return 0
+
+        decisions = []
+        seen = {}
+        for case_id, stamp in updated.items():
+            hits = by_case.get(case_id)
+            if not hits or self.case_seen.get(case_id) == stamp:
+                continue
+            since = min(_parse_time(hit["_source"].get("created_at")) or self.checkpoint for hit in hits)
+            comments = self.case_comments(case_id, since)
+            if comments is None:
+                continue
+            seen[case_id] = stamp
+            for hit in hits:
+                found = find_decision(comments, hit["_source"])
+                if found:
+                    decisions.append((hit, found[0], found[1]))
+        resolved = self.apply(decisions, seen)
+
+        # A case counts as seen only once all of its decisions are applied,
+        # and the checkpoint stays behind any case that still needs another
+        # look, so a failed read or write is retried on the next poll
+        # instead of waiting for the case to change again.
+        self.case_seen.update(seen)
+        self.case_seen = {case_id: stamp for case_id, stamp in self.case_seen.items() if case_id in by_case}
+        retry = [_parse_time(stamp) for case_id, stamp in updated.items()
+                 if case_id in by_case and self.case_seen.get(case_id) != stamp]
+        if updated:
+            newest = min([max(_parse_time(stamp) for stamp in updated.values()), *retry])
+            self.checkpoint = max(self.checkpoint, newest - timedelta(seconds=CHECKPOINT_OVERLAP_SECONDS))
+        return resolved
+
+    def apply(self, decisions, seen):
+        """Resolve approvals, queue dispatches for approved ones and comment on each case.
+
+        Cases with a decision that could not be written (anything but a
+        409, which means someone else resolved it first) are removed from
+        `seen` so the next poll reads them again. Returns how many
+        approvals were resolved.
+        """
+        if not decisions:
+            return 0
+
+        # 1. Resolve: conditional, so an approval someone else resolved first is skipped.
+        ok, failed = bulk_write([
+            (hit["_index"], hit["_id"], "update", {
+                "seq_no": hit.get("_seq_no"), "primary_term": hit.get("_primary_term"),
+                "source": {"doc": {
+                    "status": "approved" if decision == "approved" else "rejected",
+                    "resolved_at": _now(),
+                    "resolved_by": "human",
+                    "decision_comment_id": comment.get("id"),
+                }},
+            })
+            for hit, decision, comment in decisions
+        ])
+        resolved = [(hit, decision) for hit, decision, _ in decisions if hit["_id"] in ok]
+        for hit, _, _ in decisions:
+            if hit["_id"] not in ok and not failed.get(hit["_id"], "").startswith("409"):
+                log(f"[WARN] Could not resolve {hit['_source'].get('approval_id')}: {failed.get(hit['_id'])}")
+                seen.pop(hit["_source"].get("case_id"), None)
+
+        # 2. Queue dispatches for the approved ones.
+        queued, _ = self.queue([hit for hit, decision in resolved if decision == "approved"])
+
+        # 3. One comment per case covering all of its decisions.
+        notes = {}
+        for hit, decision in resolved:
+            source = hit["_source"]
+            if decision == "approved" and hit not in queued:
+                continue
+            self.counts[decision] += 1
+            log(f"[{decision}] {source.get('approval_id')} → {source.get('target_agent')} "
+                f"({source.get('action_type')} on {source.get('target')})")
+            if decision == "approved":
+                notes.setdefault(source.get("case_id"), []).append(_dispatched_note(source))
+            else:
+                notes.setdefault(source.get("case_id"), []).append(
+                    "## Action Denied\n\n"
+                    f"**Approval ID:** {source.get('approval_id')}\n"
+                    f"**Action:** {source.get('action_type')} on {source.get('target')}\n\n"
+                    "This action was denied by a human reviewer. No action has been taken."
+                )
+        for case_id, parts in notes.items():
+            comment_on_case(case_id, "\n\n---\n\n".join(parts))
+        return len(resolved)
+
+    def queue(self, approved):
+        """Create the dispatch request for each approved approval and mark it executed.
+
+        A 409 on create means the dispatch already exists (the workflow or an
+        earlier pass queued it). An approval whose dispatch could not be
+        created stays "approved" with no execution_result, so fetch_pending()
+        returns it again and the next poll retries. Returns (queued hits,
+        IDs of the dispatches created by this call).
+        """
+        created, failed = bulk_write([
+            (DISPATCH_INDEX, f"apr-dispatch-{hit['_source'].get('approval_id')}", "create",
+             {"source": approval_dispatch(hit["_source"])})
+            for hit in approved
+        ])
+        queued = [hit for hit in approved
+                  if f"apr-dispatch-{hit['_source'].get('approval_id')}" in created
+                  or failed.get(f"apr-dispatch-{hit['_source'].get('approval_id')}", "").startswith("409")]
+        for hit in approved:
+            if hit not in queued:
+                log(f"[WARN] Approval {hit['_source'].get('approval_id')} approved but its dispatch could not be "
+                    f"queued, retrying next poll: {failed.get('apr-dispatch-' + str(hit['_source'].get('approval_id')))}")
+        bulk_write([
+            (hit["_index"], hit["_id"], "update", {"source": {"doc": {
+                "status": "executed",
+                "execution_result": f"Dispatch request queued for {hit['_source'].get('target_agent')}.",
+            }}})
+            for hit in queued
+        ])
+        return queued, set(created)
+
+    def requeue(self, approved):
+        """Queue dispatches for approvals resolved earlier whose dispatch was never created.
+
+        Only dispatches created now are reported and commented on; a 409
+        means whoever created it already did both. Returns how many were queued.
+        """
+        _, created = self.queue(approved)
+        count = 0
+        for hit in approved:
+            source = hit["_source"]
+            if f"apr-dispatch-{source.get('approval_id')}" not in created:
+                continue
+            count += 1
+            self.counts["approved"] += 1
+            log(f"[approved] {source.get('approval_id')} → {source.get('target_agent')} "
+                f"({source.get('action_type')} on {source.get('target')}, dispatch queued on retry)")
+            comment_on_case(source.get("case_id"), _dispatched_note(source))
+        return count
+
+    def poll(self):
+        """One pass: requeue, expire, then resolve. Returns how many approvals changed state."""
+        self.load_policies()
+        open_approvals = self.fetch_pending()
+        pending = [hit for hit in open_approvals if hit["_source"].get("status") == "pending"]
+        changed = self.requeue([hit for hit in open_approvals if hit["_source"].get("status") == "approved"])
+        if not pending:
+            self.checkpoint = None
+            self.case_seen = {}
+            return changed
+        before = self.counts["expired"]
+        remaining = self.expire(pending)
+        changed += self.counts["expired"] - before
+        if remaining:
+            changed += self.resolve(remaining)
+        return changed
+
+    def run(self, once=False):
+        """Poll until stopped (or once)."""
+        while not self.stopping.is_set():
+            self.poll()
+            if once:
+                break
+            self.stopping.wait(self.poll_seconds)
+        return self.counts
+
+    def stop(self, *_):
+        self.stopping.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Elastic Security Agent Mesh approval processor")
+    parser.add_argument("--once", action="store_true",
+                        help="Process pending approvals once, then exit")
+    parser.add_argument("--poll-seconds", type=float, default=DEFAULT_POLL_SECONDS, metavar="S",
+                        help=f"Seconds between polls (default: {DEFAULT_POLL_SECONDS:g})")
+    parser.add_argument("--max-rps", type=float, default=DEFAULT_MAX_RPS, metavar="RPS",
+                        help=f"Upper bound on API requests per second (default: {DEFAULT_MAX_RPS:g})")
+    args = parser.parse_args()
+    if args.poll_seconds < 0.5:
+        parser.error("--poll-seconds must be at least 0.5")
+
+    validate_env()
+    configure_api_client(args.max_rps, 1)
+    processor = ApprovalProcessor(args.poll_seconds)
+    signal.signal(signal.SIGTERM, processor.stop)
+    signal.signal(signal.SIGINT, processor.stop)
+    log(f"Approval processor started (polling every {args.poll_seconds:g}s)")
+    counts = processor.run(once=args.once)
+    log(f"Approval processor stopped: {counts['approved']} approved, {counts['denied']} denied, "
+        f"{counts['expired']} expired")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,798 @@
+#!/usr/bin/env python3
+"""
+Elastic Security Agent Mesh — Dispatch Worker
+
+Long-running replacement for the Dispatch Monitor workflow
+(workflows/mesh/dispatch-monitor.yaml). Instead of waking once a minute and
+invoking at most 3 agents one after another, the worker polls the
+dispatch-requests index every 0.5–2 seconds, claims pending
+dispatches in priority order, and runs the agent converse calls in parallel
+with a cap per target agent.
+
+Scheduling: dispatches are ordered by priority_rank (urgent 0, high 1,
+normal 2, low 3), then age. A waiting dispatch gains one rank per
+--aging-seconds (default 300) so low and normal work can't starve, but aging
+never lifts anything above "high" — urgent dispatches always go first. Within
+a rank, agents take turns, and each poll fetches candidates per target agent,
+so one agent with a deep backlog can't crowd the others out.
+
+Retries: a failed agent call is put back in the queue with exponential
+backoff and jitter (attempts / next_attempt_at), and only becomes claimable
+again once next_attempt_at has passed. After --max-attempts (default 4) the
+dispatch moves to status "dead_letter" with the last error recorded, and the
+case gets a comment. `setup.py --redrive-dispatches` puts dead-lettered
+dispatches back in the queue.
+
+Coalescing: dispatches written with a dedupe_key (case_id:target_agent) are
+merged on write into the pending dispatch for the same case and agent. When
+a worker claims one, it also supersedes any other pending dispatch with the
+same key (status "superseded") and merges their context into the one it
+runs, so a burst of identical requests costs one agent call.
+
+Dispatch groups (workflows/mesh/write-dispatch-group.yaml): one request
+fans out to several child dispatches that run concurrently, plus a join
+record (kind "join", status "waiting") addressed to the parent agent. Each
+child that completes or is dead-lettered adds its result to the join; the
+last one flips the join to "pending" with the results appended to its
+context, so the parent is woken once, with everything. Joins whose
+deadline_at passes are released with whatever results arrived.
+
+Uses the same environment variables as setup.py, plus LLM_CONNECTOR_ID:
+    export ELASTIC_CLOUD_URL=https://your-deployment.es.region.gcp.cloud.es.io
+    export KIBANA_URL=https://your-deployment.kb.region.gcp.cloud.es.io
+    export ES_API_KEY=your-es-api-key
+    export KIBANA_API_KEY=your-kibana-api-key
+    export LLM_CONNECTOR_ID=your-connector-id
+
+Usage:
+    python scripts/dispatch_worker.py                          # Run until interrupted
+    python scripts/dispatch_worker.py --once                   # Drain the queue, then exit
+    python scripts/dispatch_worker.py --max-workers 16         # Up to 16 agent calls at once
+    python scripts/dispatch_worker.py --agent-concurrency 2    # At most 2 concurrent calls per agent
+    python scripts/dispatch_worker.py --agent-limit security-mesh.threat-intelligence-agent=4
+    python scripts/dispatch_worker.py --lease-seconds 300     # Reclaim after 5 min without a heartbeat
+    python scripts/dispatch_worker.py --show-queue             # Print the queue in pick order and exit
+    python scripts/dispatch_worker.py --show-queue --dispatch dsp-123   # Where is this dispatch?
+
+Claims are atomic: a dispatch is taken with a conditional update
+(if_seq_no/if_primary_term) that records a lease owner and expiry, so any
+number of workers — and the Dispatch Monitor workflow — can run side by side
+without invoking an agent twice. Workers renew their leases while the agent
+call runs, including while a stopping worker waits for its last calls; a
+dispatch whose lease expires (its worker crashed) is picked up again by the
+next poll.
+
+The worker only talks to the URLs in the environment, so it can be run
+against a local fake Elasticsearch/Kibana (tests/fake_elastic.py, used by
+`python -m pytest tests`); DispatchWorker also accepts an `invoke` callable
+in place of the converse call.
+"""
+
+import argparse
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from setup import (
+    DEFAULT_MAX_RPS,
+    api_request,
+    configure_api_client,
+    es_headers,
+    kibana_base_url,
+    kibana_headers,
+    validate_env,
+)
+
+DISPATCH_INDEX = "dispatch-requests"
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_AGENT_CONCURRENCY = 2
+MIN_POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 2.0
+FETCH_MULTIPLIER = 4
+DEFAULT_LEASE_SECONDS = 120
+DEFAULT_AGING_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 4
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 1800
+RESULT_SUMMARY_MAX_CHARS = 4000
+JOIN_SWEEP_SECONDS = 15
+DEDUPE_ABSORB_LIMIT = 20
+QUEUE_SHOW_LIMIT = 1000
+
+# Applies params.doc, then sets (lease_ms > 0) or clears the lease expiry
+# from the cluster clock, so workers with skewed clocks agree on expiry.
+LEASE_SCRIPT = (
+    "for (e in params.doc.entrySet()) { ctx._source[e.getKey()] = e.getValue(); } "
+    "if (params.lease_ms > 0) { ctx._source.lease_expires_at = ctx._now + params.lease_ms; } "
+    "else { ctx._source.remove('lease_expires_at'); }"
+)
+
+# Lower rank is picked first; unknown priorities sort with "normal".
+PRIORITY_RANK = {"urgent": 0, "high": 1, "normal": 2, "low": 3}
+
+# Aging never lifts a dispatch above this rank, so urgent work stays first.
+AGING_FLOOR_RANK = PRIORITY_RANK["high"]
+
+# Pending dispatches that are due (no retry scheduled in the future), plus
+# dispatched ones whose claim lease has expired.
+CLAIMABLE_QUERY = {"bool": {
+    "should": [
+        {"bool": {
+            "filter": [{"term": {"status": "pending"}}],
+            "must_not": [{"range": {"next_attempt_at": {"gt": "now"}}}],
+        }},
+        {"bool": {"filter": [
+            {"term": {"status": "dispatched"}},
+            {"range": {"lease_expires_at": {"lt": "now"}}},
+        ]}},
+    ],
+    "minimum_should_match": 1,
+}}
+
+# Records a failed attempt. Below params.max_attempts the dispatch goes back
+# to pending with next_attempt_at = now + backoff, where backoff doubles per
+# attempt from base_ms up to max_ms and the second half is random ("equal
+# jitter") so retries after a shared outage spread out. The last attempt
+# moves it to dead_letter instead. The Dispatch Monitor workflow carries a copy.
+RETRY_SCRIPT = (
+    "long attempts = 1; if (ctx._source.attempts != null) { attempts = ((Number) ctx._source.attempts).longValue() + 1; } "
+    "long max_attempts = params.max_attempts; long base = params.base_ms; long cap = params.max_ms; "
+    "ctx._source.attempts = attempts; ctx._source.last_error = params.error; "
+    "ctx._source.remove('lease_expires_at'); "
+    "if (attempts >= max_attempts) { ctx._source.status = 'dead_letter'; ctx._source.dead_lettered_at = params.now; "
+    "ctx._source.completed_at = params.now; ctx._source.remove('next_attempt_at'); } "
+    "else { long delay = Math.min(cap, base << Math.min(attempts - 1, 20)); "
+    "delay = delay / 2 + (long) (Math.random() * (delay / 2)); "
+    "ctx._source.status = 'pending'; ctx._source.next_attempt_at = ctx._now + delay; }"
+)
+
+# Adds a child's result to a waiting join (params.result, once per child)
+# and releases the join as a pending dispatch when every child has reported,
+# or unconditionally when params.result is null (deadline sweep). Releasing
+# appends the results to the join's context for the parent agent. The
+# Dispatch Monitor workflow carries a copy.
+JOIN_SCRIPT = (
+    "if (ctx._source.status != 'waiting') { ctx.op = 'noop'; return; } "
+    "if (ctx._source.results == null) { ctx._source.results = []; } "
+    "long expected = Long.parseLong(ctx._source.expected_children.toString()); "
+    "if (params.result != null) { "
+    "for (r in ctx._source.results) { if (r.dispatch_id == params.result.dispatch_id) { ctx.op = 'noop'; return; } } "
+    "ctx._source.results.add(params.result); "
+    "if (ctx._source.results.size() < expected) { return; } "
+    "ctx._source.join_reason = 'all_finished'; "
+    "} else { ctx._source.join_reason = 'deadline'; } "
+    "String nl = String.valueOf((char) 10); "
+    "String text = nl + nl + '## Specialist results (' + ctx._source.results.size() + ' of ' + expected + ' reported)' + nl; "
+    "for (r in ctx._source.results) { text += nl + '### ' + r.target_agent + ' (' + r.status + ')' + nl + r.summary + nl; } "
+    "if (ctx._source.join_reason == 'deadline') { text += nl + 'The deadline passed before every specialist reported; "
+    "late results will only appear as case comments.' + nl; } "
+    "ctx._source.context = (ctx._source.context == null ? '' : ctx._source.context) + text; "
+    "ctx._source.status = 'pending'; ctx._source.released_at = params.now;"
+)
+
+# Effective rank: priority_rank (or the priority keyword, for documents
+# written before priority_rank existed) minus one per aging_ms waited,
+# floored at min(rank, floor). The Dispatch Monitor workflow carries a copy.
+QUEUE_SORT_SCRIPT = (
+    "long rank = params.rank['normal']; "
+    "if (doc['priority_rank'].size() > 0) { rank = doc['priority_rank'].value; } "
+    "else if (doc['priority'].size() > 0 && params.rank.containsKey(doc['priority'].value)) "
+    "{ rank = params.rank[doc['priority'].value]; } "
+    "if (doc['created_at'].size() == 0) { return rank; } "
+    "long aging = params.aging_ms; long floor = params.floor; "
+    "long waited = Long.parseLong(params.now.toString()) - doc['created_at'].value.toInstant().toEpochMilli(); "
+    "return Math.max(rank - waited / aging, Math.min(rank, floor));"
+)
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def log(message):
+    print(f"{datetime.now().strftime('%H:%M:%S')} {message}", flush=True)
+
+
+def queue_sort(aging_seconds=DEFAULT_AGING_SECONDS):
+    """Sort clause for pick order: effective (aged) rank, then oldest first."""
+    return [
+        {"_script": {
+            "type": "number",
+            "order": "asc",
+            "script": {
+                "source": QUEUE_SORT_SCRIPT,
+                "params": {
+                    "rank": PRIORITY_RANK,
+                    "floor": AGING_FLOOR_RANK,
+                    "aging_ms": int(aging_seconds * 1000),
+                    "now": int(time.time() * 1000),
+                },
+            },
+        }},
+        {"created_at": {"order": "asc", "unmapped_type": "date"}},
+    ]
+
+
+def fair_order(hits, running=None):
+    """Order hits by effective rank, with target agents taking turns within each rank.
+
+    Hits must carry the `sort` values of queue_sort(). Within a rank, each
+    agent's oldest dispatch comes before any agent's second one; `running`
+    ({agent: calls in flight}) counts as turns already taken, so an agent
+    that is busy goes behind idle ones.
+    """
+    running = running or {}
+    turns = {}
+    keyed = []
+    for position, hit in enumerate(sorted(hits, key=lambda h: h.get("sort", []))):
+        rank = hit.get("sort", [0])[0]
+        agent = hit["_source"].get("target_agent", "")
+        turn = turns.get((rank, agent), running.get(agent, 0))
+        turns[(rank, agent)] = turn + 1
+        keyed.append(((rank, turn, position), hit))
+    return [hit for _, hit in sorted(keyed, key=lambda item: item[0])]
+
+
+def converse(source):
+    """Invoke the dispatch's target agent. Returns (ok, summary)."""
+    resp = api_request(
+        "POST",
+        f"{kibana_base_url()}/api/agent_builder/converse",
+        headers=kibana_headers(),
+        json={
+            "agent_id": source.get("target_agent", ""),
+            "connector_id": os.environ.get("LLM_CONNECTOR_ID", ""),
+            "input": source.get("context", ""),
+        },
+    )
+    if resp.status_code == 200:
+        try:
+            message = (resp.json().get("response") or {}).get("message") or ""
+        except ValueError:
+            message = ""
+        return True, message[:RESULT_SUMMARY_MAX_CHARS] or "Agent responded successfully."
+    return False, f"Agent call failed: {resp.status_code} — {resp.text[:200]}"
+
+
+def merge_context(context, extra, requesting_agent=None, requested_at=None):
+    """Append another request's context to a dispatch context, unless it is already there.
+
+    Same layout as the merge script in workflows/mesh/write-dispatch-request.yaml.
+    """
+    if not extra or extra in context:
+        return context
+    return (f"{context}\n\n---\nAdditional request from {requesting_agent or 'unknown'} "
+            f"at {requested_at or _now()}:\n\n{extra}")
+
+
+def record_join_result(source, status, summary):
+    """Report a finished child dispatch to its group's join record.
+
+    Returns the join's status afterwards ("pending" once this was the last
+    child), or None if the update failed.
+    """
+    join_index = source.get("join_index") or DISPATCH_INDEX
+    resp = api_request(
+        "POST",
+        f"{os.environ['ELASTIC_CLOUD_URL'].rstrip('/')}/{join_index}/_update/{source['join_id']}",
+        headers=es_headers(),
+        params={"retry_on_conflict": 5, "_source": "status"},
+        json={"script": {"source": JOIN_SCRIPT, "params": {
+            "result": {
+                "dispatch_id": source.get("dispatch_id", ""),
+                "target_agent": source.get("target_agent", ""),
+                "status": status,
+                "summary": summary[:RESULT_SUMMARY_MAX_CHARS],
+            },
+            "now": _now(),
+        }}},
+    )
+    if not resp.ok:
+        log(f"[WARN] Could not report {source.get('dispatch_id')} to join {source['join_id']}: "
+            f"{resp.status_code} — {resp.text[:200]}")
+        return None
+    return resp.json().get("get", {}).get("_source", {}).get("status")
+
+
+def release_expired_joins():
+    """Release every waiting join whose deadline has passed. Returns how many were released."""
+    resp = api_request(
+        "POST",
+        f"{os.environ['ELASTIC_CLOUD_URL'].rstrip('/')}/{DISPATCH_INDEX}/_update_by_query",
+        headers=es_headers(),
+        params={"conflicts": "proceed"},
+        json={
+            "query": {"bool": {"filter": [
+                {"term": {"kind": "join"}},
+                {"term": {"status": "waiting"}},
+                {"range": {"deadline_at": {"lt": "now"}}},
+            ]}},
+            "script": {"source": JOIN_SCRIPT, "params": {"result": None, "now": _now()}},
+        },
+    )
+    if not resp.ok:
+        log(f"[WARN] Could not release expired joins: {resp.status_code} — {resp.text[:200]}")
+        return 0
+    return resp.json().get("updated", 0)
+
+
+def comment_on_case(case_id, comment):
+    """Add a user comment to a Kibana case (best effort)."""
+    if not case_id:
+        return
+    api_request(
+        "POST",
+        f"{kibana_base_url()}/api/cases/{case_id}/comments",
+        headers={**kibana_headers(), "elastic-api-version": "2023-10-31"},
+        json={"type": "user", "comment": comment, "owner": "securitySolution"},
+    )
+
+
+class DispatchWorker:
+    """Claims pending dispatches and runs them on a bounded thread pool.
+
+    max_workers caps concurrent agent calls overall; agent_concurrency (or
+    an agent_limits override) caps them per target agent so one busy
+    specialist can't take every slot. `invoke(source) -> (ok, summary)`
+    defaults to converse().
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, agent_concurrency=DEFAULT_AGENT_CONCURRENCY,
+                 agent_limits=None, invoke=None, lease_seconds=DEFAULT_LEASE_SECONDS,
+                 aging_seconds=DEFAULT_AGING_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.max_workers = max_workers
+        self.aging_seconds = aging_seconds
+        self.max_attempts = max_attempts
+        self.agent_concurrency = agent_concurrency
+        self.agent_limits = agent_limits or {}
+        self.invoke = invoke or converse
+        self.lease_ms = int(lease_seconds * 1000)
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.es_url = os.environ["ELASTIC_CLOUD_URL"].rstrip("/")
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.per_agent = {}
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.counts = {"completed": 0, "retried": 0, "dead_lettered": 0}
+
+    def agent_limit(self, agent):
+        return self.agent_limits.get(agent, self.agent_concurrency)
+
+    def fetch_pending(self, agents):
+        """Return claimable dispatch hits for up to `agents` target agents, in pick order.
+
+        Claimable means pending, or dispatched under a lease that has expired.
+        Results are collapsed on target_agent, so each agent contributes at
+        most as many candidates as it could run at once — an agent with
+        thousands of queued dispatches can't fill the whole fetch window.
+        Hits carry _seq_no/_primary_term for the conditional claim.
+        """
+        sort = queue_sort(self.aging_seconds)
+        per_agent = max([self.agent_concurrency, *self.agent_limits.values()])
+        resp = api_request(
+            "POST",
+            f"{self.es_url}/{DISPATCH_INDEX}/_search",
+            headers=es_headers(),
+            json={
+                "size": agents,
+                "_source": False,
+                "query": CLAIMABLE_QUERY,
+                "sort": sort,
+                "collapse": {
+                    "field": "target_agent",
+                    "inner_hits": {"name": "queue", "size": per_agent, "sort": sort, "seq_no_primary_term": True},
+                },
+            },
+        )
+        if not resp.ok:
+            log(f"[WARN] Could not search {DISPATCH_INDEX}: {resp.status_code} — {resp.text[:200]}")
+            return []
+        with self.lock:
+            running = dict(self.per_agent)
+        return fair_order([
+            inner
+            for group in resp.json().get("hits", {}).get("hits", [])
+            for inner in group.get("inner_hits", {}).get("queue", {}).get("hits", {}).get("hits", [])
+        ], running)
+
+    def _leased_update(self, lease, doc=None, lease_ms=0, script=None):
+        """Conditionally update a leased dispatch.
+
+        Runs LEASE_SCRIPT with doc and lease_ms, or the given
+        {"source", "params"} script. The update only applies if the document
+        is unchanged since this worker's last write
+        (if_seq_no/if_primary_term); on success the new sequence numbers are
+        kept for the next write. Returns the updated status fields
+        (status, attempts, next_attempt_at), or None if this worker no
+        longer held the dispatch.
+        """
+        hit = lease["hit"]
+        script = script or {"source": LEASE_SCRIPT, "params": {"doc": doc or {}, "lease_ms": lease_ms}}
+        with lease["lock"]:
+            resp = api_request(
+                "POST",
+                f"{self.es_url}/{hit['_index']}/_update/{hit['_id']}",
+                headers=es_headers(),
+                params={
+                    "if_seq_no": lease["seq_no"],
+                    "if_primary_term": lease["primary_term"],
+                    "_source": "status,attempts,next_attempt_at",
+                },
+                json={"script": script},
+            )
+            if resp.ok:
+                body = resp.json()
+                lease["seq_no"] = body.get("_seq_no", lease["seq_no"])
+                lease["primary_term"] = body.get("_primary_term", lease["primary_term"])
+                return body.get("get", {}).get("_source", {})
+            if resp.status_code != 409:
+                log(f"[WARN] Update of {hit['_id']} failed: {resp.status_code} — {resp.text[:200]}")
+            return None
+
+    def claim(self, hit):
+        """Take a lease on a dispatch. Returns the lease, or None if another worker got it first."""
+        lease = {
+            "hit": hit,
+            "seq_no": hit.get("_seq_no"),
+            "primary_term": hit.get("_primary_term"),
+            "lock": threading.Lock(),
+        }
+        doc = {"status": "dispatched", "dispatched_at": _now(), "lease_owner": self.owner}
+        return lease if self._leased_update(lease, doc, self.lease_ms) is not None else None
+
+    def renew_leases(self):
+        """Push out the lease expiry of every dispatch this worker is running."""
+        with self.lock:
+            leases = list(self.in_flight.values())
+        for lease in leases:
+            if not lease.get("lost") and self._leased_update(lease, {}, self.lease_ms) is None:
+                lease["lost"] = True
+                log(f"[WARN] Lost lease on {lease['hit']['_id']} — another worker may re-run it")
+
+    def select(self, hits, capacity):
+        """Pick hits to claim, in pick order, within free slots and per-agent limits.
+
+        Only one dispatch per dedupe_key is picked (or run) at a time; its
+        run absorbs the others.
+        """
+        selected = []
+        with self.lock:
+            planned = dict(self.per_agent)
+            keys = {lease["hit"]["_source"].get("dedupe_key") for lease in self.in_flight.values()}
+            for hit in hits:
+                if len(selected) >= capacity:
+                    break
+                if hit["_id"] in self.in_flight:
+                    continue
+                key = hit["_source"].get("dedupe_key")
+                if key and key in keys:
+                    continue
+                agent = hit["_source"].get("target_agent", "")
+                if planned.get(agent, 0) >= self.agent_limit(agent):
+                    continue
+                planned[agent] = planned.get(agent, 0) + 1
+                keys.add(key)
+                selected.append(hit)
+        return selected
+
+    def absorb_duplicates(self, lease):
+        """Supersede other pending dispatches with this one's dedupe_key, merging their context in.
+
+        Writers merge into an existing pending dispatch for the same case and
+        target agent, but two writers can still race; this collapses whatever
+        got through so the agent is invoked once. Each duplicate is taken
+        with a conditional update, so one that another claimer got first is left
+        alone. Returns how many were absorbed.
+        """
+        hit = lease["hit"]
+        source = hit["_source"]
+        key = source.get("dedupe_key")
+        if not key:
+            return 0
+        resp = api_request(
+            "POST",
+            f"{self.es_url}/{DISPATCH_INDEX}/_search",
+            headers=es_headers(),
+            json={
+                "size": DEDUPE_ABSORB_LIMIT,
+                "seq_no_primary_term": True,
+                "query": {"bool": {
+                    "filter": [{"term": {"dedupe_key": key}}, {"term": {"status": "pending"}}],
+                    "must_not": [{"ids": {"values": [hit["_id"]]}}],
+                }},
+                "sort": [{"created_at": {"order": "asc", "unmapped_type": "date"}}],
+            },
+        )
+        if not resp.ok:
+            return 0
+        dispatch_id = source.get("dispatch_id", hit["_id"])
+        context = source.get("context", "")
+        absorbed = 0
+        for dup in resp.json().get("hits", {}).get("hits", []):
+            dup_lease = {
+                "hit": dup,
+                "seq_no": dup.get("_seq_no"),
+                "primary_term": dup.get("_primary_term"),
+                "lock": threading.Lock(),
+            }
+            doc = {"status": "superseded", "superseded_by": dispatch_id, "completed_at": _now()}
+            if self._leased_update(dup_lease, doc) is None:
+                continue
+            dup_source = dup["_source"]
+            context = merge_context(context, dup_source.get("context", ""),
+                                    dup_source.get("requesting_agent"), dup_source.get("created_at"))
+            absorbed += 1
+        if absorbed:
+            source["context"] = context
+            source["merged_count"] = int(source.get("merged_count") or 0) + absorbed
+            self._leased_update(lease, {"context": context, "merged_count": source["merged_count"]}, self.lease_ms)
+        return absorbed
+
+    def run_dispatch(self, lease):
+        hit = lease["hit"]
+        source = hit["_source"]
+        dispatch_id = source.get("dispatch_id", hit["_id"])
+        agent = source.get("target_agent", "")
+        try:
+            absorbed = self.absorb_duplicates(lease)
+            if absorbed:
+                log(f"[coalesced] {dispatch_id} → {agent}: absorbed {absorbed} duplicate dispatch(es)")
+            ok, summary = self.invoke(source)
+        except Exception as exc:  # a crashed call must still release its slot
+            ok, summary = False, f"Agent call raised {type(exc).__name__}: {exc}"
+        outcome = "completed" if ok else "retried"
+        try:
+            if ok:
+                doc = {"status": "completed", "completed_at": _now(), "result_summary": summary}
+                updated = self._leased_update(lease, doc)
+            else:
+                updated = self._leased_update(lease, script={"source": RETRY_SCRIPT, "params": {
+                    "error": summary,
+                    "now": _now(),
+                    "max_attempts": self.max_attempts,
+                    "base_ms": RETRY_BASE_SECONDS * 1000,
+                    "max_ms": RETRY_MAX_SECONDS * 1000,
+                }})
+            if updated is None:
+                log(f"[lost lease] {dispatch_id} → {agent}: {'completed' if ok else 'failed'} result not recorded")
+            elif ok:
+                log(f"[completed] {dispatch_id} → {agent}")
+            elif updated.get("status") == "pending":
+                # next_attempt_at comes back as epoch millis (set from ctx._now).
+                wait = max(0.0, float(updated.get("next_attempt_at") or 0) / 1000 - time.time())
+                log(f"[retry] {dispatch_id} → {agent}: attempt {updated.get('attempts')}/{self.max_attempts} "
+                    f"failed, retrying in {wait:.0f}s: {summary}")
+            else:
+                outcome = "dead_lettered"
+                log(f"[dead-letter] {dispatch_id} → {agent} after {updated.get('attempts')} attempts: {summary}")
+                comment_on_case(
+                    source.get("case_id"),
+                    "## Agent Dispatch Failed\n\n"
+                    f"**Dispatch ID:** {dispatch_id}\n"
+                    f"**Target Agent:** {agent}\n"
+                    f"**Attempts:** {updated.get('attempts')}\n"
+                    f"**Last error:** {summary}\n\n"
+                    "Every retry failed and the dispatch was moved to the dead-letter queue. "
+                    "Investigate manually, or re-queue it with `python scripts/setup.py --redrive-dispatches`.",
+                )
+            if source.get("join_id") and outcome != "retried" and updated is not None:
+                if record_join_result(source, "completed" if ok else "dead_letter", summary) == "pending":
+                    log(f"[join] {source['join_id']} released: every dispatch in the group has reported")
+        finally:
+            with self.lock:
+                self.in_flight.pop(hit["_id"], None)
+                self.per_agent[agent] -= 1
+                self.counts[outcome] += 1
+            self.wake.set()
+
+    def fill(self, pool):
+        """Claim as much pending work as there are free slots. Returns how many were started."""
+        with self.lock:
+            capacity = self.max_workers - len(self.in_flight)
+        if capacity <= 0:
+            return 0
+        started = 0
+        for hit in self.select(self.fetch_pending(capacity * FETCH_MULTIPLIER), capacity):
+            if self.stopping.is_set():
+                break
+            lease = self.claim(hit)
+            if lease is None:
+                continue
+            agent = hit["_source"].get("target_agent", "")
+            with self.lock:
+                self.in_flight[hit["_id"]] = lease
+                self.per_agent[agent] = self.per_agent.get(agent, 0) + 1
+            verb = "reclaimed" if hit["_source"].get("status") == "dispatched" else "claimed"
+            log(f"[{verb}] {hit['_source'].get('dispatch_id', hit['_id'])} → {agent} "
+                f"({hit['_source'].get('priority', 'normal')})")
+            pool.submit(self.run_dispatch, lease)
+            started += 1
+        return started
+
+    def run(self, once=False):
+        """Poll and dispatch until stopped (or, with once, until the queue is drained)."""
+        interval = MIN_POLL_INTERVAL
+        renew_every = self.lease_ms / 3000
+        last_renewal = time.monotonic()
+        last_join_sweep = 0.0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while not self.stopping.is_set():
+                self.wake.clear()
+                if time.monotonic() - last_renewal >= renew_every:
+                    self.renew_leases()
+                    last_renewal = time.monotonic()
+                if time.monotonic() - last_join_sweep >= JOIN_SWEEP_SECONDS:
+                    released = release_expired_joins()
+                    if released:
+                        log(f"[join] released {released} group(s) whose deadline passed")
+                    last_join_sweep = time.monotonic()
+                started = self.fill(pool)
+                with self.lock:
+                    busy = len(self.in_flight)
+                if once and not started and not busy:
+                    break
+                if started:
+                    interval = MIN_POLL_INTERVAL
+                elif not busy:
+                    interval = min(MAX_POLL_INTERVAL, interval * 2)
+                # A finishing dispatch frees a slot, so look again straight away.
+                self.wake.wait(interval)
+            self.drain(renew_every, last_renewal)
+        return self.counts
+
+    def drain(self, renew_every, last_renewal):
+        """Wait for in-flight dispatches to finish, renewing their leases meanwhile.
+
+        A stopping worker still holds its claims until each agent call
+        returns. Without renewals the leases would lapse during a long call,
+        and another worker would reclaim the dispatch and invoke the agent
+        a second time.
+        """
+        with self.lock:
+            busy = len(self.in_flight)
+        if busy:
+            log(f"Waiting for {busy} in-flight dispatch(es) to finish...")
+        while busy:
+            self.wake.clear()
+            if time.monotonic() - last_renewal >= renew_every:
+                self.renew_leases()
+                last_renewal = time.monotonic()
+            self.wake.wait(min(MAX_POLL_INTERVAL, renew_every))
+            with self.lock:
+                busy = len(self.in_flight)
+
+    def stop(self, *_):
+        self.stopping.set()
+        self.wake.set()
+
+
+def show_queue(dispatch_id=None, aging_seconds=DEFAULT_AGING_SECONDS, limit=QUEUE_SHOW_LIMIT):
+    """Print claimable dispatches in pick order, or just the line for dispatch_id.
+
+    "pos" counts every claimable dispatch ahead of it plus one; "agent" counts
+    only those for the same target agent, which is the wait that matters once
+    that agent is at its concurrency limit. Returns False if dispatch_id is
+    not among the first `limit` claimable dispatches.
+    """
+    resp = api_request(
+        "POST",
+        f"{os.environ['ELASTIC_CLOUD_URL'].rstrip('/')}/{DISPATCH_INDEX}/_search",
+        headers=es_headers(),
+        json={
+            "size": limit,
+            "track_total_hits": True,
+            "_source": ["dispatch_id", "target_agent", "priority", "status", "created_at"],
+            "query": CLAIMABLE_QUERY,
+            "sort": queue_sort(aging_seconds),
+        },
+    )
+    if not resp.ok:
+        print(f"ERROR: Could not search {DISPATCH_INDEX}: {resp.status_code} — {resp.text[:200]}")
+        return False
+    hits = resp.json().get("hits", {})
+    total = hits.get("total", {}).get("value", 0)
+    now = datetime.now(timezone.utc)
+    agent_positions = {}
+    found = dispatch_id is None
+    print(f"{'pos':>5} {'agent':>5} {'rank':>4}  {'priority':<8} {'waited':>7}  {'target agent':<45} dispatch")
+    for position, hit in enumerate(fair_order(hits.get("hits", [])), 1):
+        source = hit["_source"]
+        agent = source.get("target_agent", "")
+        agent_positions[agent] = agent_positions.get(agent, 0) + 1
+        this_id = source.get("dispatch_id", hit["_id"])
+        if dispatch_id is not None and dispatch_id not in (this_id, hit["_id"]):
+            continue
+        found = True
+        try:
+            created = datetime.strptime(source.get("created_at", ""), "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+            waited = f"{int((now - created).total_seconds() // 60)}m"
+        except ValueError:
+            waited = "?"
+        reclaim = " (lease expired)" if source.get("status") == "dispatched" else ""
+        print(f"{position:>5} {agent_positions[agent]:>5} {int(hit['sort'][0]):>4}  "
+              f"{source.get('priority', 'normal'):<8} {waited:>7}  {agent:<45} {this_id}{reclaim}")
+    shown = min(total, limit)
+    print(f"\n{total} claimable dispatches" + (f" (first {shown} shown)" if total > shown else ""))
+    if not found:
+        print(f"{dispatch_id} is not among the first {shown} claimable dispatches (already claimed, or further back).")
+    return found
+
+
+def _parse_agent_limits(values):
+    limits = {}
+    for value in values or []:
+        agent, _, limit = value.partition("=")
+        if not agent or not limit.isdigit() or int(limit) < 1:
+            raise argparse.ArgumentTypeError(f"invalid --agent-limit {value!r} (expected AGENT=N)")
+        limits[agent] = int(limit)
+    return limits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Elastic Security Agent Mesh dispatch worker")
+    parser.add_argument("--once", action="store_true",
+                        help="Process everything currently pending, then exit")
+    parser.add_argument("--max-workers", type=int, default=DEFAULT_MAX_WORKERS, metavar="N",
+                        help=f"Maximum concurrent agent calls (default: {DEFAULT_MAX_WORKERS})")
+    parser.add_argument("--agent-concurrency", type=int, default=DEFAULT_AGENT_CONCURRENCY, metavar="N",
+                        help=f"Maximum concurrent calls per target agent (default: {DEFAULT_AGENT_CONCURRENCY})")
+    parser.add_argument("--agent-limit", action="append", metavar="AGENT=N",
+                        help="Override the per-agent limit for one agent (repeatable)")
+    parser.add_argument("--lease-seconds", type=int, default=DEFAULT_LEASE_SECONDS, metavar="S",
+                        help=f"Claim lease length, renewed every S/3 seconds (default: {DEFAULT_LEASE_SECONDS})")
+    parser.add_argument("--aging-seconds", type=int, default=DEFAULT_AGING_SECONDS, metavar="S",
+                        help=f"A waiting dispatch moves up one priority per S seconds, "
+                             f"never above high (default: {DEFAULT_AGING_SECONDS})")
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS, metavar="N",
+                        help=f"Attempts before a failing dispatch is dead-lettered (default: {DEFAULT_MAX_ATTEMPTS})")
+    parser.add_argument("--show-queue", action="store_true",
+                        help="Print claimable dispatches in pick order with their queue position, then exit")
+    parser.add_argument("--dispatch", metavar="ID",
+                        help="With --show-queue, show only this dispatch_id")
+    parser.add_argument("--max-rps", type=float, default=DEFAULT_MAX_RPS, metavar="RPS",
+                        help=f"Upper bound on API requests per second (default: {DEFAULT_MAX_RPS:g})")
+    args = parser.parse_args()
+    if args.max_workers < 1 or args.agent_concurrency < 1:
+        parser.error("--max-workers and --agent-concurrency must be at least 1")
+    if args.lease_seconds < 10:
+        parser.error("--lease-seconds must be at least 10")
+    if args.max_attempts < 1:
+        parser.error("--max-attempts must be at least 1")
+    if args.aging_seconds < 1:
+        parser.error("--aging-seconds must be at least 1")
+    if args.dispatch and not args.show_queue:
+        parser.error("--dispatch requires --show-queue")
+    try:
+        agent_limits = _parse_agent_limits(args.agent_limit)
+    except argparse.ArgumentTypeError as exc:
+        parser.error(str(exc))
+
+    validate_env()
+    if args.show_queue:
+        configure_api_client(args.max_rps, 1)
+        sys.exit(0 if show_queue(args.dispatch, args.aging_seconds) else 1)
+    if not os.environ.get("LLM_CONNECTOR_ID"):
+        print("ERROR: LLM_CONNECTOR_ID must be set for the worker to invoke agents.")
+        sys.exit(1)
+    configure_api_client(args.max_rps, args.max_workers)
+
+    worker = DispatchWorker(args.max_workers, args.agent_concurrency, agent_limits,
+                            lease_seconds=args.lease_seconds, aging_seconds=args.aging_seconds,
+                            max_attempts=args.max_attempts)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    log(f"Dispatch worker {worker.owner} started ({args.max_workers} workers, {args.agent_concurrency} per agent)")
+    counts = worker.run(once=args.once)
+    log(f"Dispatch worker stopped: {counts['completed']} completed, {counts['retried']} scheduled for retry, "
+        f"{counts['dead_lettered']} dead-lettered")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,720 @@
+#!/usr/bin/env python3
+"""
+Elastic Security Agent Mesh — Batch Enrichment Worker
+
+Serves the Batch Enrich IOCs workflow
+(workflows/security/enrichment/batch-enrich-iocs.yaml). Forensics and
+Threat Intelligence often collect 20–200 IOCs from one host, and the
+single-IOC enrichment workflows need one agent tool call per IOC. The
+workflow instead writes the whole list to the enrichment-batches index as
+one request, and this worker enriches it:
+
+  1. The list is split, refanged (hxxp, [.]) and classified as file hash,
+     IP address, domain or URL. Duplicates collapse to one lookup. Private
+     and reserved IPs are not sent to any provider.
+  2. Every IOC is looked up in the shared enrichment-cache index with one
+     _mget. Fresh entries are used as they are, and their hits are added
+     to one counter document per source and IOC type.
+  3. The rest are looked up concurrently. Each provider has its own token
+     bucket, set to its quota (VirusTotal 4/min and 500/day on the public
+     tier; AbuseIPDB 30/min and 1000/day). A lookup takes a token, then
+     claims the cache entry with the same filling_until lease the
+     workflows use, so a workflow and the worker never pay for the same IOC
+     twice. Results go straight into the cache.
+  4. One result document (<batch>:result) with a compact table, sorted
+     malicious first, is created for the workflow to return.
+
+Up to --batch-concurrency batches (default 4) run at once. The provider
+buckets are shared, so the quota holds across batches, and a 200-IOC
+VirusTotal batch (about 50 minutes on the public tier) no longer blocks a
+fully cached or AbuseIPDB-only batch queued behind it. The worker renews
+the lease of every batch it is running, including while it stops.
+
+File hashes, domains and URLs go to VirusTotal. IPs go to AbuseIPDB plus
+IP-API geolocation, the same pair IP Reputation Check uses, so cache
+entries written here serve that workflow too. An IOC type whose provider
+key is not set, or whose daily quota is used up, is reported in the table
+and not looked up.
+
+Uses the same environment variables as setup.py, plus the provider keys:
+    export ELASTIC_CLOUD_URL=https://your-deployment.es.region.gcp.cloud.es.io
+    export ES_API_KEY=your-es-api-key
+    export VIRUSTOTAL_API_KEY=your-virustotal-key
+    export ABUSEIPDB_API_KEY=your-abuseipdb-key
+
+Usage:
+    python scripts/enrichment_worker.py                  # Run until interrupted
+    python scripts/enrichment_worker.py --once           # Process pending batches, then exit
+    python scripts/enrichment_worker.py --batch-concurrency 8  # Up to 8 batches at once
+    python scripts/enrichment_worker.py --vt-per-minute 500 --vt-per-day 0  # Premium VirusTotal key
+"""
+
+import argparse
+import base64
+import ipaddress
+import json
+import os
+import re
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+from dispatch_worker import _now, log
+from setup import (
+    DEFAULT_MAX_RPS,
+    ENRICHMENT_CACHE_INDEX,
+    TokenBucket,
+    _retry_after_seconds,
+    api_request,
+    bulk_write,
+    configure_api_client,
+    es_headers,
+    get_session,
+    validate_env,
+)
+
+BATCH_INDEX = "enrichment-batches"
+DEFAULT_POLL_SECONDS = 2.0
+DEFAULT_BATCH_CONCURRENCY = 4
+BATCH_PAGE_SIZE = 10
+MAX_BATCH_IOCS = 500
+LEASE_SECONDS = 120
+PROGRESS_SECONDS = 10
+FILL_WAIT_SECONDS = 60
+FILL_CHECK_SECONDS = 5
+
+VT_URL = "https://www.virustotal.com/api/v3"
+ABUSEIPDB_URL = "https://api.abuseipdb.com/api/v2/check"
+IPAPI_URL = "http://ip-api.com/json"
+IPAPI_FIELDS = ("status,message,country,countryCode,region,regionName,city,zip,lat,lon,timezone,"
+                "isp,org,as,asname,mobile,proxy,hosting")
+IPAPI_PER_MINUTE = 45
+PROVIDER_TIMEOUT = 30
+PROVIDER_THROTTLE_RETRIES = 2
+
+# Same TTLs as consts.cache_ttl_seconds in the single-IOC workflows, and
+# their not_found_ttl_seconds (VirusTotal 404s) and error_ttl_seconds
+# (failed AbuseIPDB checks: its quota is daily, so retrying sooner fails
+# the same way). Other failed lookups are not cached.
+CACHE_TTL_SECONDS = {"file": 604800, "domain": 86400, "url": 43200, "ip": 21600}
+NOT_FOUND_TTL_SECONDS = 3600
+ERROR_TTL_SECONDS = 900
+
+# The cache protocol of workflows/security/enrichment/vt-*.yaml and
+# ip-reputation-check.yaml: claim takes the fetch lease (noop when the entry
+# is fresh or another lookup holds the lease), store writes the response
+# with its verdict (found, not_found or error) and drops the lease, release
+# drops it after a failed lookup that is not cached. Hits are added to one
+# counter document per source and IOC type (hits:<source>:<ioc type>), so
+# a hit never rewrites a cached response.
+CACHE_COUNT_SCRIPT = (
+    "ctx._source.kind = 'hit_counter'; ctx._source.source = params.source; ctx._source.ioc_type = params.ioc_type; "
+    "ctx._source.hit_count = (ctx._source.hit_count ?: 0) + params.count; ctx._source.last_hit_at = ctx._now;"
+)
+CACHE_COUNT_RETRIES = 5
+CACHE_CLAIM_SCRIPT = (
+    "if ((ctx._source.expires_at != null && ctx._source.expires_at > ctx._now) || "
+    "(ctx._source.filling_until != null && ctx._source.filling_until > ctx._now)) { ctx.op = 'noop'; return; } "
+    "ctx._source.source = params.source; ctx._source.ioc_type = params.ioc_type; "
+    "ctx._source.ioc_value = params.ioc_value; ctx._source.filling_until = ctx._now + 60000L; "
+    "ctx._source.miss_count = (ctx._source.miss_count ?: 0) + 1; "
+    "if (ctx._source.hit_count == null) { ctx._source.hit_count = 0; }"
+)
+CACHE_STORE_SCRIPT = (
+    "ctx._source.response_json = params.response_json; ctx._source.verdict = params.verdict; "
+    "ctx._source.fetched_at = ctx._now; "
+    "ctx._source.expires_at = ctx._now + Long.parseLong(params.ttl_seconds) * 1000L; "
+    "ctx._source.remove('filling_until');"
+)
+CACHE_RELEASE_SCRIPT = "ctx._source.remove('filling_until');"
+
+HASH_LENGTHS = {32, 40, 64}
+HEX_RE = re.compile(r"^[0-9a-f]+$")
+DOMAIN_RE = re.compile(r"^(?=.{4,253}$)([a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z][a-z0-9-]{1,62}$")
+URL_RE = re.compile(r"^[a-z][a-z0-9+.-]*://", re.IGNORECASE)
+SPLIT_RE = re.compile(r"[\s,;|]+")
+VERDICT_ORDER = ("malicious", "suspicious", "clean", "unknown", "not_found", "internal", "skipped", "error")
+
+
+def refang(token):
+    """Undo the usual defanging (hxxp://, [.], (.), [:]) and strip wrapping quotes/brackets."""
+    token = token.strip().strip("\"'<>")
+    token = re.sub(r"^hxxp", "http", token, flags=re.IGNORECASE)
+    for fanged, plain in (("[.]", "."), ("(.)", "."), ("{.}", "."), ("[:]", ":"), ("[://]", "://")):
+        token = token.replace(fanged, plain)
+    return token.strip("()[]")
+
+
+def classify(token):
+    """Return (ioc_type, normalised value) for one token, or None if it is not an IOC."""
+    value = refang(token)
+    if not value:
+        return None
+    if URL_RE.match(value):
+        return "url", value
+    try:
+        return "ip", str(ipaddress.ip_address(value))
+    except ValueError:
+        pass
+    lowered = value.lower().rstrip(".")
+    if len(lowered) in HASH_LENGTHS and HEX_RE.match(lowered):
+        return "file", lowered
+    if DOMAIN_RE.match(lowered):
+        return "domain", lowered
+    return None
+
+
+def parse_iocs(text):
+    """Split a free-form IOC list into unique (type, value) pairs, in input order.
+
+    Returns (iocs, rejected) where rejected lists tokens that are not IOCs.
+    """
+    iocs = []
+    seen = set()
+    rejected = []
+    for token in SPLIT_RE.split(text or ""):
+        if not token:
+            continue
+        ioc = classify(token)
+        if ioc is None:
+            rejected.append(token)
+        elif ioc not in seen:
+            seen.add(ioc)
+            iocs.append(ioc)
+    return iocs, rejected
+
+
+def vt_url_id(url):
+    """VirusTotal's URL identifier: unpadded base64url of the URL."""
+    return base64.urlsafe_b64encode(url.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def source_for(ioc_type):
+    return "abuseipdb" if ioc_type == "ip" else "virustotal"
+
+
+def cache_key(ioc_type, value):
+    """Same document IDs as the single-IOC workflows' cache_key step."""
+    if ioc_type == "url":
+        return f"virustotal:url:{vt_url_id(value)}"
+    return f"{source_for(ioc_type)}:{ioc_type}:{value}"
+
+
+def summarise(ioc_type, response):
+    """Reduce a provider response to (verdict, detection, detail) for the table."""
+    if response.get("not_found"):
+        return "not_found", "—", "no VirusTotal report"
+    if response.get("error"):
+        return "error", "—", response["error"]
+    if ioc_type == "ip":
+        abuse = (response.get("abuseipdb") or {}).get("data") or {}
+        geo = response.get("geolocation") or {}
+        score = abuse.get("abuseConfidenceScore")
+        if score is None:
+            return "unknown", "—", ""
+        verdict = "malicious" if score > 75 else "suspicious" if score > 25 else "clean"
+        where = ", ".join(part for part in (geo.get("countryCode") or abuse.get("countryCode"),
+                                            geo.get("isp") or abuse.get("isp")) if part)
+        return verdict, f"{score}% abuse, {abuse.get('totalReports', 0)} reports", where
+    attributes = (response.get("data") or {}).get("attributes") or {}
+    stats = attributes.get("last_analysis_stats") or {}
+    if not stats:
+        return "unknown", "—", ""
+    malicious = stats.get("malicious", 0)
+    threshold = 5 if ioc_type == "file" else 3
+    verdict = "malicious" if malicious > threshold else "suspicious" if malicious > 0 else "clean"
+    if ioc_type == "file":
+        names = attributes.get("names") or []
+        detail = ", ".join(part for part in (attributes.get("type_description"), names[0] if names else None) if part)
+    elif ioc_type == "domain":
+        detail = attributes.get("registrar") or ""
+    elif ioc_type == "url":
+        detail = ", ".join(sorted(set((attributes.get("categories") or {}).values()))[:3])
+    else:
+        detail = ""
+    return verdict, f"{malicious}/{malicious + stats.get('undetected', 0)} engines", detail
+
+
+def render_table(rows, rejected):
+    lines = ["| IOC | Type | Verdict | Detection | Detail | Source |",
+             "|-----|------|---------|-----------|--------|--------|"]
+    for row in sorted(rows, key=lambda r: VERDICT_ORDER.index(r["verdict"])):
+        lines.append(f"| {row['ioc']} | {row['type']} | {row['verdict']} | {row['detection']} | "
+                     f"{row['detail'].replace('|', '/')} | {row['source']} |")
+    if rejected:
+        lines.append("")
+        lines.append(f"Not recognised as IOCs ({len(rejected)}): {', '.join(rejected[:20])}"
+                     + (" …" if len(rejected) > 20 else ""))
+    return "\n".join(lines)
+
+
+class Provider:
+    """Per-provider quota: a token bucket for the per-minute rate plus a daily cap.
+
+    The daily count is kept in memory and resets at midnight UTC. A
+    per_day of 0 means no daily cap.
+    """
+
+    def __init__(self, name, api_key, per_minute, per_day, concurrency):
+        self.name = name
+        self.api_key = api_key
+        self.bucket = TokenBucket(per_minute / 60.0, capacity=per_minute, min_rate=per_minute / 240.0)
+        self.per_day = per_day
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=name)
+        self.day = None
+        self.used_today = 0
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Wait for a token. Returns False, without waiting, once the daily quota is used up."""
+        today = datetime.now(timezone.utc).date()
+        with self.lock:
+            if today != self.day:
+                self.day, self.used_today = today, 0
+            if self.per_day and self.used_today >= self.per_day:
+                return False
+            self.used_today += 1
+        self.bucket.acquire()
+        return True
+
+    def refund(self):
+        """Give back the daily quota of a take() that did not lead to a call."""
+        with self.lock:
+            self.used_today = max(0, self.used_today - 1)
+
+    def call(self, url, **kwargs):
+        """GET url under this provider's quota only. Returns the response or None.
+
+        The request goes straight through the pooled session, not
+        api_request: its 429 retries and the shared Elasticsearch limiter
+        know nothing of a third-party quota. A 429 slows this provider's
+        bucket (honouring Retry-After), gives back the daily count and takes
+        a fresh token before each of up to PROVIDER_THROTTLE_RETRIES retries.
+        The caller has already taken the first token.
+        """
+        for attempt in range(PROVIDER_THROTTLE_RETRIES + 1):
+            try:
+                resp = get_session(url).request("GET", url, timeout=PROVIDER_TIMEOUT, **kwargs)
+            except requests.RequestException as exc:
+                log(f"[WARN] {self.name} request failed: {exc}")
+                return None
+            if resp.status_code != 429:
+                self.bucket.on_success()
+                return resp
+            retry_after = _retry_after_seconds(resp)
+            self.bucket.on_throttle(retry_after if retry_after is not None else 60.0)
+            self.refund()
+            if attempt == PROVIDER_THROTTLE_RETRIES or not self.take():
+                return resp
+        return resp
+
+
+class EnrichmentWorker:
+    """Enriches IOC batches from enrichment-batches through the cache and per-provider quotas."""
+
+    def __init__(self, providers, poll_seconds=DEFAULT_POLL_SECONDS, batch_concurrency=DEFAULT_BATCH_CONCURRENCY):
+        self.es_url = os.environ["ELASTIC_CLOUD_URL"].rstrip("/")
+        self.providers = providers
+        self.geo_bucket = TokenBucket(IPAPI_PER_MINUTE / 60.0, capacity=IPAPI_PER_MINUTE)
+        self.poll_seconds = poll_seconds
+        self.batch_concurrency = batch_concurrency
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self.lock = threading.Lock()
+        self.active = set()
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.counts = {"batches": 0, "iocs": 0, "cached": 0, "fetched": 0}
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.counts[key] += n
+
+    # ── Batch queue ────────────────────────────────────────────────────────
+
+    def fetch_pending(self):
+        """Pending batches, plus running ones whose worker's lease has expired, oldest first."""
+        resp = api_request(
+            "POST",
+            f"{self.es_url}/{BATCH_INDEX}/_search",
+            headers=es_headers(),
+            json={
+                "size": BATCH_PAGE_SIZE,
+                "seq_no_primary_term": True,
+                "query": {"bool": {
+                    "filter": [{"term": {"kind": "request"}}],
+                    "should": [
+                        {"term": {"status": "pending"}},
+                        {"bool": {"filter": [{"term": {"status": "running"}},
+                                             {"range": {"lease_expires_at": {"lt": "now"}}}]}},
+                    ],
+                    "minimum_should_match": 1,
+                }},
+                "sort": [{"submitted_at": "asc"}],
+            },
+        )
+        if not resp.ok:
+            log(f"[WARN] Could not search {BATCH_INDEX}: {resp.status_code} — {resp.text[:200]}")
+            return []
+        return resp.json().get("hits", {}).get("hits", [])
+
+    def claim(self, hit):
+        """Mark a batch running under this worker's lease. False if another worker got it first."""
+        resp = api_request(
+            "POST",
+            f"{self.es_url}/{BATCH_INDEX}/_update/{hit['_id']}",
+            headers=es_headers(),
+            params={"if_seq_no": hit["_seq_no"], "if_primary_term": hit["_primary_term"]},
+            json={"doc": {"status": "running", "worker": self.worker_id, "started_at": _now(),
+                          "lease_expires_at": int((time.time() + LEASE_SECONDS) * 1000)}},
+        )
+        return resp.ok
+
+    def progress(self, batch_id, doc):
+        """Record progress on the request document and extend the lease."""
+        doc = dict(doc, lease_expires_at=int((time.time() + LEASE_SECONDS) * 1000))
+        resp = api_request("POST", f"{self.es_url}/{BATCH_INDEX}/_update/{batch_id}",
+                           headers=es_headers(), json={"doc": doc})
+        if not resp.ok:
+            log(f"[WARN] Could not update batch {batch_id}: {resp.status_code} — {resp.text[:200]}")
+
+    # ── Cache ──────────────────────────────────────────────────────────────
+
+    def cached(self, keys):
+        """{key: response} for every key with a fresh cache entry (one _mget)."""
+        if not keys:
+            return {}
+        resp = api_request(
+            "POST",
+            f"{self.es_url}/{ENRICHMENT_CACHE_INDEX}/_mget",
+            headers=es_headers(),
+            params={"_source": "expires_at,response_json,verdict"},
+            json={"ids": sorted(keys)},
+        )
+        if not resp.ok:
+            log(f"[WARN] Could not read {ENRICHMENT_CACHE_INDEX}: {resp.status_code} — {resp.text[:200]}")
+            return {}
+        now_ms = time.time() * 1000
+        fresh = {}
+        for doc in resp.json().get("docs", []):
+            source = doc.get("_source") or {}
+            expires_at = source.get("expires_at")
+            if doc.get("found") and isinstance(expires_at, (int, float)) and expires_at > now_ms:
+                try:
+                    response = json.loads(source.get("response_json") or "{}")
+                except ValueError:
+                    continue
+                if source.get("verdict") == "error":
+                    response.setdefault("error", "lookup failed recently, not retried yet")
+                fresh[doc["_id"]] = response
+        return fresh
+
+    def count_hits(self, keys):
+        """Add the hits to each source and IOC type's counter document."""
+        counts = {}
+        for key in keys:
+            source, ioc_type, _ = key.split(":", 2)
+            counts[(source, ioc_type)] = counts.get((source, ioc_type), 0) + 1
+        for (source, ioc_type), count in counts.items():
+            self._cache_update(f"hits:{source}:{ioc_type}", CACHE_COUNT_SCRIPT, upsert=True,
+                               retry_on_conflict=CACHE_COUNT_RETRIES,
+                               params={"source": source, "ioc_type": ioc_type, "count": count})
+
+    def _cache_update(self, key, script, params=None, upsert=False, retry_on_conflict=0):
+        body = {"script": {"source": script, "params": params or {}}}
+        if upsert:
+            body.update(scripted_upsert=True, upsert={})
+        try:
+            resp = api_request("POST", f"{self.es_url}/{ENRICHMENT_CACHE_INDEX}/_update/{key}",
+                               headers=es_headers(), json=body,
+                               params={"retry_on_conflict": retry_on_conflict} if retry_on_conflict else None)
+        except requests.RequestException as exc:
+            log(f"[WARN] Cache update failed for {key}: {exc}")
+            return None
+        return resp.json().get("result") if resp.ok else None
+
+    # ── Lookups ────────────────────────────────────────────────────────────
+
+    def fetch(self, provider, ioc_type, value):
+        """Call the provider. Returns (response dict, None) or (None, error)."""
+        if ioc_type == "ip":
+            resp = provider.call(ABUSEIPDB_URL, headers={"Key": provider.api_key, "Accept": "application/json"},
+                                 params={"ipAddress": value, "maxAgeInDays": 90, "verbose": "true"})
+            if resp is None or resp.status_code != 200:
+                return None, f"AbuseIPDB {resp.status_code if resp is not None else 'unreachable'}"
+            self.geo_bucket.acquire()
+            try:
+                geo = get_session(IPAPI_URL).request("GET", f"{IPAPI_URL}/{value}", params={"fields": IPAPI_FIELDS},
+                                                     timeout=15)
+                geolocation = geo.json() if geo.ok else {}
+            except (requests.RequestException, ValueError):
+                geolocation = {}
+            return {"abuseipdb": resp.json(), "geolocation": geolocation}, None
+        path = {"file": "files", "domain": "domains", "url": "urls"}[ioc_type]
+        resp = provider.call(f"{VT_URL}/{path}/{vt_url_id(value) if ioc_type == 'url' else value}",
+                             headers={"x-apikey": provider.api_key, "Accept": "application/json"})
+        if resp is None:
+            return None, "VirusTotal unreachable"
+        if resp.status_code == 404:
+            return {"not_found": True}, None
+        if resp.status_code != 200:
+            return None, f"VirusTotal {resp.status_code}"
+        return resp.json(), None
+
+    def lookup(self, ioc_type, value):
+        """One cache miss: take a quota token, claim the entry, fetch and store.
+
+        Returns (status, response or error) with status "fetched", "waiting"
+        (another lookup holds the entry's lease), "quota" or "error".
+        """
+        provider = self.providers[source_for(ioc_type)]
+        if not provider.take():
+            return "quota", f"{provider.name} daily quota used up"
+        key = cache_key(ioc_type, value)
+        claim = self._cache_update(key, CACHE_CLAIM_SCRIPT, upsert=True, params={
+            "source": provider.name, "ioc_type": ioc_type, "ioc_value": value})
+        if claim == "noop":
+            provider.refund()
+            return "waiting", None
+        response, error = self.fetch(provider, ioc_type, value)
+        if response is not None:
+            not_found = bool(response.get("not_found"))
+            self._cache_update(key, CACHE_STORE_SCRIPT, {
+                "response_json": json.dumps(response), "verdict": "not_found" if not_found else "found",
+                "ttl_seconds": str(NOT_FOUND_TTL_SECONDS if not_found else CACHE_TTL_SECONDS[ioc_type])})
+        elif ioc_type == "ip":
+            self._cache_update(key, CACHE_STORE_SCRIPT, {
+                "response_json": json.dumps({"abuseipdb": {}, "geolocation": {}, "error": error}),
+                "verdict": "error", "ttl_seconds": str(ERROR_TTL_SECONDS)})
+        else:
+            self._cache_update(key, CACHE_RELEASE_SCRIPT)
+        if error:
+            return "error", error
+        return "fetched", response
+
+    def enrich(self, batch_id, iocs):
+        """Enrich unique (type, value) pairs. Returns a table row per IOC, in input order."""
+        rows = {}
+
+        def row(ioc, verdict, detection="—", detail="", source="—"):
+            rows[ioc] = {"ioc": ioc[1], "type": ioc[0], "verdict": verdict,
+                         "detection": detection, "detail": detail, "source": source}
+
+        keys = {}
+        for ioc in iocs:
+            if ioc[0] == "ip" and not ipaddress.ip_address(ioc[1]).is_global:
+                row(ioc, "internal", detail="private or reserved address, not looked up")
+            else:
+                keys[cache_key(*ioc)] = ioc
+
+        def take_cached(keys):
+            fresh = self.cached(keys)
+            if fresh:
+                self.count_hits(fresh)
+                self.count("cached", len(fresh))
+            for key, response in fresh.items():
+                ioc = keys.pop(key)
+                row(ioc, *summarise(ioc[0], response), source="cache")
+
+        take_cached(keys)
+        futures = {}
+        for key, ioc in keys.items():
+            provider = self.providers.get(source_for(ioc[0]))
+            if provider:
+                futures[key] = provider.pool.submit(self.lookup, *ioc)
+            else:
+                row(ioc, "skipped", detail=f"{source_for(ioc[0])} API key not configured")
+        waiting = {}
+        last_progress = time.monotonic()
+        for key, future in futures.items():
+            ioc = keys[key]
+            status, result = future.result()
+            if status == "fetched":
+                self.count("fetched")
+                row(ioc, *summarise(ioc[0], result), source="live")
+            elif status == "waiting":
+                waiting[key] = ioc
+            elif status == "quota":
+                row(ioc, "skipped", detail=result)
+            else:
+                row(ioc, "error", detail=result)
+            if time.monotonic() - last_progress >= PROGRESS_SECONDS:
+                last_progress = time.monotonic()
+                self.progress(batch_id, {"done": len(rows)})
+
+        # Another workflow or worker was already fetching these; wait for
+        # its result rather than paying for the same IOC again.
+        deadline = time.monotonic() + FILL_WAIT_SECONDS
+        while waiting and time.monotonic() < deadline and not self.stopping.wait(FILL_CHECK_SECONDS):
+            take_cached(waiting)
+        for ioc in waiting.values():
+            row(ioc, "unknown", detail="lookup in progress elsewhere — retry shortly")
+        return [rows[ioc] for ioc in iocs]
+
+    def process(self, hit):
+        """Enrich one batch and create its result document."""
+        batch_id = hit["_id"]
+        source = hit["_source"]
+        iocs, rejected = parse_iocs(source.get("iocs", ""))
+        truncated = len(iocs) > MAX_BATCH_IOCS
+        iocs = iocs[:MAX_BATCH_IOCS]
+        log(f"[batch] {batch_id}: {len(iocs)} unique IOCs"
+            + (f", {len(rejected)} unrecognised" if rejected else ""))
+        self.progress(batch_id, {"total": len(iocs), "done": 0})
+        started = time.monotonic()
+        rows = self.enrich(batch_id, iocs)
+        by_verdict = {}
+        for row in rows:
+            by_verdict[row["verdict"]] = by_verdict.get(row["verdict"], 0) + 1
+        table = render_table(rows, rejected)
+        if truncated:
+            table += f"\nOnly the first {MAX_BATCH_IOCS} unique IOCs were enriched."
+        result = {
+            "kind": "result",
+            "batch_id": batch_id,
+            "case_id": source.get("case_id", ""),
+            "status": "completed",
+            "total": len(rows),
+            "from_cache": sum(1 for row in rows if row["source"] == "cache"),
+            "fetched": sum(1 for row in rows if row["source"] == "live"),
+            "verdicts": by_verdict,
+            "table": table,
+            "results": rows,
+            "completed_at": _now(),
+        }
+        created, failed = bulk_write([(BATCH_INDEX, f"{batch_id}:result", "create", {"source": result})])
+        if failed:
+            log(f"[WARN] Could not write result for {batch_id}: {next(iter(failed.values()))}")
+        self.progress(batch_id, {"status": "completed", "done": len(rows), "completed_at": _now()})
+        self.count("batches")
+        self.count("iocs", len(rows))
+        log(f"[completed] {batch_id}: {result['from_cache']} cached, {result['fetched']} fetched "
+            f"in {time.monotonic() - started:.1f}s — "
+            + ", ".join(f"{count} {verdict}" for verdict, count in sorted(by_verdict.items())))
+
+    def run_batch(self, hit):
+        try:
+            self.process(hit)
+        except Exception as exc:  # a crashed batch must still free its slot
+            log(f"[WARN] Batch {hit['_id']} failed: {type(exc).__name__}: {exc}")
+        finally:
+            with self.lock:
+                self.active.discard(hit["_id"])
+            self.wake.set()
+
+    def renew_leases(self):
+        """Extend the lease of every batch this worker is processing."""
+        with self.lock:
+            active = list(self.active)
+        for batch_id in active:
+            self.progress(batch_id, {})
+
+    def poll(self, pool):
+        """Claim batches for the free slots and start them on the pool. Returns how many were started.
+
+        Batches run side by side: the per-provider buckets already hold
+        every lookup to its quota, so a long VirusTotal batch does not hold
+        up a cached or AbuseIPDB-only batch submitted after it.
+        """
+        with self.lock:
+            free = self.batch_concurrency - len(self.active)
+        started = 0
+        if free <= 0:
+            return 0
+        for hit in self.fetch_pending():
+            if self.stopping.is_set() or started >= free:
+                break
+            if hit["_id"] in self.active or not self.claim(hit):
+                continue
+            with self.lock:
+                self.active.add(hit["_id"])
+            pool.submit(self.run_batch, hit)
+            started += 1
+        return started
+
+    def run(self, once=False):
+        """Poll until stopped (or, with once, until the queue is drained)."""
+        renew_every = LEASE_SECONDS / 3
+        last_renewal = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.batch_concurrency) as pool:
+            while not self.stopping.is_set():
+                self.wake.clear()
+                if time.monotonic() - last_renewal >= renew_every:
+                    self.renew_leases()
+                    last_renewal = time.monotonic()
+                started = self.poll(pool)
+                with self.lock:
+                    busy = len(self.active)
+                if once and not started and not busy:
+                    break
+                if not started:
+                    # A finishing batch frees a slot, so look again straight away.
+                    self.wake.wait(min(self.poll_seconds, renew_every))
+            # Batches still running keep their leases until they finish.
+            with self.lock:
+                busy = len(self.active)
+            while busy:
+                self.wake.clear()
+                if time.monotonic() - last_renewal >= renew_every:
+                    self.renew_leases()
+                    last_renewal = time.monotonic()
+                self.wake.wait(min(self.poll_seconds, renew_every))
+                with self.lock:
+                    busy = len(self.active)
+        for provider in self.providers.values():
+            provider.pool.shutdown(wait=True)
+        return self.counts
+
+    def stop(self, *_):
+        self.stopping.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Elastic Security Agent Mesh batch enrichment worker")
+    parser.add_argument("--once", action="store_true", help="Process pending batches, then exit")
+    parser.add_argument("--poll-seconds", type=float, default=DEFAULT_POLL_SECONDS, metavar="S",
+                        help=f"Seconds between queue polls when idle (default: {DEFAULT_POLL_SECONDS:g})")
+    parser.add_argument("--vt-per-minute", type=float, default=4, metavar="N",
+                        help="VirusTotal lookups per minute (default: 4, the public tier)")
+    parser.add_argument("--vt-per-day", type=int, default=500, metavar="N",
+                        help="VirusTotal lookups per day, 0 for no cap (default: 500)")
+    parser.add_argument("--abuseipdb-per-minute", type=float, default=30, metavar="N",
+                        help="AbuseIPDB checks per minute (default: 30)")
+    parser.add_argument("--abuseipdb-per-day", type=int, default=1000, metavar="N",
+                        help="AbuseIPDB checks per day, 0 for no cap (default: 1000, the free tier)")
+    parser.add_argument("--concurrency", type=int, default=4, metavar="N",
+                        help="Concurrent lookups per provider (default: 4)")
+    parser.add_argument("--batch-concurrency", type=int, default=DEFAULT_BATCH_CONCURRENCY, metavar="N",
+                        help=f"Batches processed at once (default: {DEFAULT_BATCH_CONCURRENCY})")
+    parser.add_argument("--max-rps", type=float, default=DEFAULT_MAX_RPS, metavar="RPS",
+                        help=f"Upper bound on API requests per second (default: {DEFAULT_MAX_RPS:g})")
+    args = parser.parse_args()
+    if min(args.vt_per_minute, args.abuseipdb_per_minute) <= 0 or min(args.concurrency, args.batch_concurrency) < 1:
+        parser.error("per-minute rates must be positive and --concurrency and --batch-concurrency at least 1")
+
+    validate_env()
+    configure_api_client(args.max_rps, 2 * args.concurrency + args.batch_concurrency + 2)
+    providers = {}
+    if os.environ.get("VIRUSTOTAL_API_KEY", "").strip():
+        providers["virustotal"] = Provider("virustotal", os.environ["VIRUSTOTAL_API_KEY"].strip(),
+                                           args.vt_per_minute, args.vt_per_day, args.concurrency)
+    if os.environ.get("ABUSEIPDB_API_KEY", "").strip():
+        providers["abuseipdb"] = Provider("abuseipdb", os.environ["ABUSEIPDB_API_KEY"].strip(),
+                                          args.abuseipdb_per_minute, args.abuseipdb_per_day, args.concurrency)
+    if not providers:
+        log("[WARN] Neither VIRUSTOTAL_API_KEY nor ABUSEIPDB_API_KEY is set — only cached results can be returned")
+    worker = EnrichmentWorker(providers, args.poll_seconds, args.batch_concurrency)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    log(f"Batch enrichment worker started ({', '.join(providers) or 'cache only'})")
+    counts = worker.run(once=args.once)
+    log(f"Batch enrichment worker stopped: {counts['batches']} batches, {counts['iocs']} IOCs "
+        f"({counts['cached']} from cache, {counts['fetched']} fetched)")
+
+
+if __name__ == "__main__":
+    main()
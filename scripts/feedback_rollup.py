@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Elastic Security Agent Mesh — Detection Feedback Rollup
+
+Keeps the detection-feedback-rollup index up to date: one document per
+detection rule per day (ID <rule uuid>:<YYYY-MM-DD>) with that day's alert
+total and its True Positive / False Positive tag counts. Aggregate
+Detection Feedback and Flag Noisy Rules read this compact index instead of
+aggregating weeks of raw alerts on every run, so they no longer stop at the
+top 500 (or 100) rules.
+
+Each update is incremental:
+
+  1. The checkpoint document (ID "checkpoint") records settled_through.
+     Days before it are final and are never counted again.
+  2. Everything from settled_through to now is counted in one composite
+     aggregation over the alerts index (rule uuid x UTC day, with TP and FP
+     filter sub-aggregations), paged with after_key. There is no bucket cap.
+  3. Each page is written with one _bulk request. Rollup documents in the
+     recounted window that were not rewritten (their alerts are gone) are
+     deleted.
+  4. settled_through moves up to today minus --settle-days.
+
+Alerts are tagged TP/FP after they fire, and the tag API records no
+modification time, so the last --settle-days days (default 7) are counted
+again on every update. Older days cost nothing. A tag added to an alert
+older than that is not picked up; --rebuild recounts from --backfill-days.
+The first run, and a run after a long pause, catch up from the checkpoint.
+
+Uses the same environment variables as setup.py:
+    export ELASTIC_CLOUD_URL=https://your-deployment.es.region.gcp.cloud.es.io
+    export ES_API_KEY=your-es-api-key
+
+Usage:
+    python scripts/feedback_rollup.py                    # Update every hour until interrupted
+    python scripts/feedback_rollup.py --once             # One update, then exit (e.g. from cron)
+    python scripts/feedback_rollup.py --once --rebuild   # Recount the last --backfill-days days
+"""
+
+import argparse
+import os
+import signal
+import threading
+from datetime import datetime, timedelta, timezone
+
+from dispatch_worker import _now, log
+from setup import DEFAULT_MAX_RPS, api_request, bulk_write, configure_api_client, es_headers, validate_env
+
+ROLLUP_INDEX = "detection-feedback-rollup"
+ALERTS_INDEX = ".alerts-security.alerts-default"
+CHECKPOINT_ID = "checkpoint"
+TP_TAG = "Triaged as True Positive by AI"
+FP_TAG = "Triaged as False Positive by AI"
+PAGE_SIZE = 1000
+DEFAULT_SETTLE_DAYS = 7
+DEFAULT_BACKFILL_DAYS = 90
+DEFAULT_INTERVAL_MINUTES = 60
+
+
+def _day(moment):
+    return moment.strftime("%Y-%m-%d")
+
+
+def rollup_doc(bucket, updated_at):
+    """The rollup document for one composite bucket (one rule, one day)."""
+    names = bucket["rule_name"]["buckets"]
+    return {
+        "kind": "daily",
+        "rule_id": bucket["key"]["rule_id"],
+        "rule_name": names[0]["key"] if names else bucket["key"]["rule_id"],
+        "day": bucket["key"]["day"],
+        "total": bucket["doc_count"],
+        "true_positives": bucket["tp"]["doc_count"],
+        "false_positives": bucket["fp"]["doc_count"],
+        "updated_at": updated_at,
+    }
+
+
+class FeedbackRollup:
+    """Counts alerts per rule per day into detection-feedback-rollup, from a checkpoint."""
+
+    def __init__(self, settle_days=DEFAULT_SETTLE_DAYS, backfill_days=DEFAULT_BACKFILL_DAYS,
+                 alerts_index=ALERTS_INDEX):
+        self.es_url = os.environ["ELASTIC_CLOUD_URL"].rstrip("/")
+        self.settle_days = settle_days
+        self.backfill_days = backfill_days
+        self.alerts_index = alerts_index
+        self.stopping = threading.Event()
+
+    def read_checkpoint(self):
+        """The checkpoint document's source: {} if there is none yet, None on error."""
+        resp = api_request("GET", f"{self.es_url}/{ROLLUP_INDEX}/_doc/{CHECKPOINT_ID}", headers=es_headers())
+        if resp.status_code == 404:
+            return {}
+        if not resp.ok:
+            log(f"[WARN] Could not read the rollup checkpoint: {resp.status_code} — {resp.text[:200]}")
+            return None
+        return resp.json()["_source"]
+
+    def composite_query(self, since, after=None):
+        composite = {
+            "size": PAGE_SIZE,
+            "sources": [
+                {"rule_id": {"terms": {"field": "kibana.alert.rule.uuid"}}},
+                {"day": {"date_histogram": {"field": "@timestamp", "calendar_interval": "1d",
+                                            "format": "yyyy-MM-dd", "time_zone": "UTC"}}},
+            ],
+        }
+        if after:
+            composite["after"] = after
+        return {
+            "size": 0,
+            "query": {"range": {"@timestamp": {"gte": since, "format": "yyyy-MM-dd"}}},
+            "aggregations": {"by_rule_day": {
+                "composite": composite,
+                "aggregations": {
+                    "rule_name": {"terms": {"field": "kibana.alert.rule.name", "size": 1}},
+                    "tp": {"filter": {"term": {"kibana.alert.workflow_tags": TP_TAG}}},
+                    "fp": {"filter": {"term": {"kibana.alert.workflow_tags": FP_TAG}}},
+                },
+            }},
+        }
+
+    def count_since(self, since, updated_at):
+        """Recount every rule-day from since (YYYY-MM-DD), one _bulk per page.
+
+        Returns (rule-days written, alerts counted), or None if a page could
+        not be counted or written.
+        """
+        docs = alerts = 0
+        after = None
+        while True:
+            resp = api_request(
+                "POST",
+                f"{self.es_url}/{self.alerts_index}/_search",
+                headers=es_headers(),
+                json=self.composite_query(since, after),
+            )
+            if not resp.ok:
+                log(f"[WARN] Could not aggregate alerts: {resp.status_code} — {resp.text[:200]}")
+                return None
+            agg = resp.json()["aggregations"]["by_rule_day"]
+            lines = []
+            for bucket in agg["buckets"]:
+                doc = rollup_doc(bucket, updated_at)
+                lines.append((ROLLUP_INDEX, f"{doc['rule_id']}:{doc['day']}", "index", {"source": doc}))
+                alerts += doc["total"]
+            _, failures = bulk_write(lines)
+            for doc_id, reason in failures.items():
+                log(f"[WARN] Could not write rollup {doc_id}: {reason}")
+            if failures:
+                return None
+            docs += len(lines)
+            after = agg.get("after_key")
+            if not after or len(agg["buckets"]) < PAGE_SIZE:
+                return docs, alerts
+
+    def prune(self, since, updated_at):
+        """Delete rollup documents from since onwards that this update did not rewrite."""
+        resp = api_request(
+            "POST",
+            f"{self.es_url}/{ROLLUP_INDEX}/_delete_by_query",
+            headers=es_headers(),
+            params={"conflicts": "proceed", "refresh": "true"},
+            json={"query": {"bool": {"filter": [
+                {"term": {"kind": "daily"}},
+                {"range": {"day": {"gte": since, "format": "yyyy-MM-dd"}}},
+                {"range": {"updated_at": {"lt": updated_at}}},
+            ]}}},
+        )
+        if not resp.ok:
+            log(f"[WARN] Could not prune rollup: {resp.status_code} — {resp.text[:200]}")
+            return 0
+        return resp.json().get("deleted", 0)
+
+    def update(self, rebuild=False):
+        """Recount from the checkpoint and move it forward. Returns the new checkpoint, or None."""
+        today = datetime.now(timezone.utc)
+        checkpoint = {} if rebuild else self.read_checkpoint()
+        if checkpoint is None:
+            return None
+        since = checkpoint.get("settled_through") or _day(today - timedelta(days=self.backfill_days))
+        updated_at = _now()
+        counted = self.count_since(since, updated_at)
+        if counted is None:
+            # The checkpoint stays put, so the next update recounts the same days.
+            return None
+        docs, alerts = counted
+        pruned = self.prune(since, updated_at)
+        checkpoint = {
+            "kind": "checkpoint",
+            "settled_through": max(since, _day(today - timedelta(days=self.settle_days))),
+            "updated_at": updated_at,
+            "last_counted_from": since,
+            "last_rule_days": docs,
+            "last_alerts": alerts,
+        }
+        resp = api_request(
+            "PUT",
+            f"{self.es_url}/{ROLLUP_INDEX}/_doc/{CHECKPOINT_ID}",
+            headers=es_headers(),
+            params={"refresh": "true"},
+            json=checkpoint,
+        )
+        if not resp.ok:
+            log(f"[WARN] Could not write the rollup checkpoint: {resp.status_code} — {resp.text[:200]}")
+            return None
+        log(f"[rollup] {alerts} alerts since {since} -> {docs} rule-days"
+            f"{f', {pruned} pruned' if pruned else ''}; settled through {checkpoint['settled_through']}")
+        return checkpoint
+
+    def run(self, interval_minutes=DEFAULT_INTERVAL_MINUTES, once=False, rebuild=False):
+        """Update until stopped. With once, update one time and return."""
+        while not self.stopping.is_set():
+            if self.update(rebuild=rebuild):
+                rebuild = False
+            if once:
+                break
+            self.stopping.wait(interval_minutes * 60)
+
+    def stop(self, *_):
+        self.stopping.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Elastic Security Agent Mesh detection feedback rollup")
+    parser.add_argument("--once", action="store_true", help="Update the rollup once, then exit")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Ignore the checkpoint and recount the last --backfill-days days")
+    parser.add_argument("--interval-minutes", type=float, default=DEFAULT_INTERVAL_MINUTES, metavar="M",
+                        help=f"Minutes between updates (default: {DEFAULT_INTERVAL_MINUTES})")
+    parser.add_argument("--settle-days", type=int, default=DEFAULT_SETTLE_DAYS, metavar="D",
+                        help=f"Recount the last D days on every update, for late TP/FP tags (default: {DEFAULT_SETTLE_DAYS})")
+    parser.add_argument("--backfill-days", type=int, default=DEFAULT_BACKFILL_DAYS, metavar="D",
+                        help=f"Days counted when there is no checkpoint yet (default: {DEFAULT_BACKFILL_DAYS})")
+    parser.add_argument("--alerts-index", default=ALERTS_INDEX,
+                        help=f"Security alerts index or alias (default: {ALERTS_INDEX})")
+    parser.add_argument("--max-rps", type=float, default=DEFAULT_MAX_RPS, metavar="RPS",
+                        help=f"Upper bound on API requests per second (default: {DEFAULT_MAX_RPS:g})")
+    args = parser.parse_args()
+    if args.settle_days < 1 or args.backfill_days < args.settle_days:
+        parser.error("--settle-days must be at least 1 and no larger than --backfill-days")
+
+    validate_env()
+    configure_api_client(args.max_rps, 1)
+    rollup = FeedbackRollup(args.settle_days, args.backfill_days, args.alerts_index)
+    signal.signal(signal.SIGTERM, rollup.stop)
+    signal.signal(signal.SIGINT, rollup.stop)
+    rollup.run(args.interval_minutes, once=args.once, rebuild=args.rebuild)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Elastic Security Agent Mesh — MITRE ATT&CK Coverage Engine
+
+Builds the detection coverage report behind the Evaluate MITRE Coverage
+workflow (workflows/security/detection/evaluate-mitre-coverage.yaml). The
+workflow used to fetch at most 1000 rules in one call and leave the set
+arithmetic to the agent, over the raw rule JSON. This script does it
+offline:
+
+  1. Every detection rule is read, 500 per page, from the detection
+     engine's _find API. Nothing is truncated.
+  2. The ATT&CK techniques and tactics are read from kb-mitre-attack (as
+     loaded by `setup.py --load-knowledge enterprise-attack.json`).
+  3. Techniques x rules become a bitmap matrix: one integer per technique
+     or subtechnique, with bit i set when rule i maps to it, plus one mask
+     each for enabled rules and for every severity. Coverage, gaps and
+     "covered only by disabled rules" are mask operations.
+  4. The report gives per-tactic coverage percentages and gap lists, and
+     its diff against the previous report: techniques newly covered, those
+     that lost coverage, and per-tactic percentage changes.
+  5. The report is stored in the mitre-coverage index, one document per
+     run, with a compact rendering the workflow returns as is.
+
+A technique counts as covered when an enabled rule maps to it or to one of
+its subtechniques. A subtechnique counts as covered only when a rule maps
+to it directly. Rule mappings to IDs that are not in kb-mitre-attack
+(revoked or deprecated techniques) are listed separately.
+
+Uses the same environment variables as setup.py:
+    export ELASTIC_CLOUD_URL=https://your-deployment.es.region.gcp.cloud.es.io
+    export KIBANA_URL=https://your-deployment.kb.region.gcp.cloud.es.io
+    export ES_API_KEY=your-es-api-key
+    export KIBANA_API_KEY=your-kibana-api-key
+
+Usage:
+    python scripts/mitre_coverage.py                          # Build, store and print a report
+    python scripts/mitre_coverage.py --tactic "Initial Access"  # Print one tactic's gaps
+    python scripts/mitre_coverage.py --no-store --json        # Print the report as JSON only
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from dispatch_worker import _now
+from setup import (
+    DEFAULT_MAX_RPS,
+    api_request,
+    configure_api_client,
+    es_headers,
+    iter_kibana_objects,
+    validate_env,
+)
+
+COVERAGE_INDEX = "mitre-coverage"
+MITRE_INDEX = "kb-mitre-attack"
+RULES_PATH = "/api/detection_engine/rules/_find"
+RULES_PAGE_SIZE = 500
+# Enterprise, mobile and ICS ATT&CK together hold about 1,500 techniques
+# and tactics, well inside one search.
+MITRE_MAX_DOCS = 10000
+SEVERITIES = ("low", "medium", "high", "critical")
+
+# Enterprise ATT&CK matrix order. Tactics from other domains (ICS, mobile)
+# follow in alphabetical order.
+TACTIC_ORDER = (
+    "reconnaissance", "resource-development", "initial-access", "execution",
+    "persistence", "privilege-escalation", "defense-evasion", "credential-access",
+    "discovery", "lateral-movement", "collection", "command-and-control",
+    "exfiltration", "impact",
+)
+
+
+def _shortname(tactic_name):
+    return tactic_name.strip().lower().replace(" ", "-")
+
+
+def _split_title(title, fallback):
+    """("T1059.001", "PowerShell") from a kb-mitre-attack title like "T1059.001: PowerShell"."""
+    external_id, _, name = (title or "").partition(": ")
+    return (external_id, name) if name else (fallback, title or fallback)
+
+
+def _popcount(mask):
+    """Set bits in mask (int.bit_count() needs Python 3.10)."""
+    return bin(mask).count("1")
+
+
+def _pct(part, whole):
+    return round(part * 100.0 / whole, 1) if whole else 0.0
+
+
+def rule_techniques(rule):
+    """The ATT&CK technique and subtechnique IDs a detection rule maps to."""
+    ids = set()
+    for threat in rule.get("threat") or []:
+        if threat.get("framework", "MITRE ATT&CK") != "MITRE ATT&CK":
+            continue
+        for technique in threat.get("technique") or []:
+            if technique.get("id"):
+                ids.add(technique["id"].upper())
+            for sub in technique.get("subtechnique") or []:
+                if sub.get("id"):
+                    ids.add(sub["id"].upper())
+    return ids
+
+
+def load_attack(es_url):
+    """(techniques, tactics) from kb-mitre-attack.
+
+    techniques maps ID -> {"name", "tactics", "parent"} (parent is None for
+    top-level techniques); tactics maps shortname -> display name.
+    """
+    techniques = {}
+    tactics = {}
+    resp = api_request(
+        "POST",
+        f"{es_url}/{MITRE_INDEX}/_search",
+        headers=es_headers(),
+        json={
+            "size": MITRE_MAX_DOCS,
+            "track_total_hits": True,
+            "_source": ["title", "category", "metadata.external_id", "metadata.tactics"],
+            "query": {"bool": {"filter": [
+                {"term": {"source": "mitre-attack"}},
+                {"terms": {"category": ["technique", "tactic"]}},
+            ]}},
+        },
+    )
+    resp.raise_for_status()
+    hits = resp.json()["hits"]
+    if hits["total"]["value"] > len(hits["hits"]):
+        print(f"[WARN] {MITRE_INDEX} holds {hits['total']['value']} techniques and tactics; "
+              f"only the first {len(hits['hits'])} were read", file=sys.stderr)
+    for hit in hits["hits"]:
+        source = hit["_source"]
+        metadata = source.get("metadata") or {}
+        external_id, name = _split_title(source.get("title"), hit["_id"])
+        external_id = (metadata.get("external_id") or external_id).upper()
+        if source.get("category") == "tactic":
+            tactics[_shortname(name)] = name
+        else:
+            techniques[external_id] = {
+                "name": name,
+                "tactics": metadata.get("tactics") or [],
+                "parent": external_id.split(".")[0] if "." in external_id else None,
+            }
+    for technique in techniques.values():
+        for shortname in technique["tactics"]:
+            tactics.setdefault(shortname, shortname.replace("-", " ").title())
+    return techniques, tactics
+
+
+class CoverageMatrix:
+    """Techniques x detection rules, one bitmap (a Python int) per technique.
+
+    Bit i of a technique's mask is set when rule i maps to it. enabled and
+    severity hold the masks of enabled rules and of rules per severity.
+    """
+
+    def __init__(self, techniques):
+        self.techniques = techniques
+        self.masks = {technique_id: 0 for technique_id in techniques}
+        self.subtechniques = {}
+        for technique_id, technique in techniques.items():
+            if technique["parent"] in techniques:
+                self.subtechniques.setdefault(technique["parent"], []).append(technique_id)
+        self.unknown = {}
+        self.enabled = 0
+        self.severity = {severity: 0 for severity in SEVERITIES}
+        self.rules = 0
+        self.mapped = 0
+        self.rules_updated_at = ""
+
+    def add_rule(self, rule):
+        bit = 1 << self.rules
+        self.rules += 1
+        if rule.get("enabled"):
+            self.enabled |= bit
+        severity = rule.get("severity")
+        if severity in self.severity:
+            self.severity[severity] |= bit
+        self.rules_updated_at = max(self.rules_updated_at, rule.get("updated_at") or "")
+        ids = rule_techniques(rule)
+        if ids:
+            self.mapped += 1
+        for technique_id in ids:
+            if technique_id in self.masks:
+                self.masks[technique_id] |= bit
+            else:
+                self.unknown[technique_id] = self.unknown.get(technique_id, 0) | bit
+
+    def technique_mask(self, technique_id):
+        """Rules covering a top-level technique: its own plus its subtechniques'."""
+        mask = self.masks[technique_id]
+        for sub_id in self.subtechniques.get(technique_id, ()):
+            mask |= self.masks[sub_id]
+        return mask
+
+    def report(self, tactics):
+        """The coverage report as a plain dict (see module docstring)."""
+        enabled = self.enabled
+        low_only = self.severity["low"]
+        top_level = sorted(technique_id for technique_id, technique in self.techniques.items()
+                           if technique["parent"] is None)
+        subs = [technique_id for technique_id, technique in self.techniques.items() if technique["parent"]]
+        covering = {technique_id: self.technique_mask(technique_id) for technique_id in top_level}
+        covered = {technique_id for technique_id, mask in covering.items() if mask & enabled}
+        covered_subs = {technique_id for technique_id in subs if self.masks[technique_id] & enabled}
+
+        def label(technique_id):
+            return f"{technique_id} {self.techniques[technique_id]['name']}"
+
+        order = {shortname: n for n, shortname in enumerate(TACTIC_ORDER)}
+        rows = []
+        for shortname in sorted(tactics, key=lambda s: (order.get(s, len(order)), s)):
+            in_tactic = [technique_id for technique_id in top_level
+                         if shortname in self.techniques[technique_id]["tactics"]]
+            if not in_tactic:
+                continue
+            tactic_covered = [technique_id for technique_id in in_tactic if technique_id in covered]
+            any_rule = [technique_id for technique_id in in_tactic if covering[technique_id]]
+            rows.append({
+                "tactic": tactics[shortname],
+                "shortname": shortname,
+                "total": len(in_tactic),
+                "covered": len(tactic_covered),
+                "covered_any": len(any_rule),
+                "pct": _pct(len(tactic_covered), len(in_tactic)),
+                "pct_any": _pct(len(any_rule), len(in_tactic)),
+                "no_rule": [label(t) for t in in_tactic if not covering[t]],
+                "disabled_only": [label(t) for t in in_tactic if covering[t] and not covering[t] & enabled],
+                "low_only": [label(t) for t in tactic_covered
+                             if not covering[t] & enabled & ~low_only],
+            })
+        any_covered = [technique_id for technique_id, mask in covering.items() if mask]
+        return {
+            "kind": "report",
+            "generated_at": _now(),
+            "rules_total": self.rules,
+            "rules_enabled": _popcount(self.enabled),
+            "rules_mapped": self.mapped,
+            "rules_by_severity": {severity: _popcount(mask & enabled) for severity, mask in self.severity.items()},
+            "rules_updated_at": self.rules_updated_at or None,
+            "techniques_total": len(top_level),
+            "techniques_covered": len(covered),
+            "techniques_covered_any": len(any_covered),
+            "subtechniques_total": len(subs),
+            "subtechniques_covered": len(covered_subs),
+            "coverage_pct": _pct(len(covered), len(top_level)),
+            "covered": sorted(covered | covered_subs),
+            "unknown_techniques": sorted(self.unknown),
+            "tactics": rows,
+        }
+
+
+def diff_reports(previous, current):
+    """What changed since the previous report: techniques and per-tactic percentages."""
+    if not previous:
+        return None
+    before = set(previous.get("covered") or [])
+    after = set(current["covered"])
+    before_pct = {row["shortname"]: row["pct"] for row in previous.get("tactics") or []}
+    return {
+        "previous_generated_at": previous.get("generated_at"),
+        "coverage_pct_change": round(current["coverage_pct"] - previous.get("coverage_pct", 0.0), 1),
+        "newly_covered": sorted(after - before),
+        "lost_coverage": sorted(before - after),
+        "tactics": {
+            row["tactic"]: round(row["pct"] - before_pct.get(row["shortname"], 0.0), 1)
+            for row in current["tactics"]
+            if round(row["pct"] - before_pct.get(row["shortname"], 0.0), 1)
+        },
+    }
+
+
+def render(report, tactic=None):
+    """Compact plain-text rendering: totals, per-tactic table, gaps and the diff."""
+    lines = [
+        "=== MITRE ATT&CK Coverage Report ===",
+        f"Generated: {report['generated_at']}",
+        f"Rules: {report['rules_total']} ({report['rules_enabled']} enabled, "
+        f"{report['rules_mapped']} mapped to ATT&CK)",
+        "Enabled by severity: " + ", ".join(f"{severity} {count}" for severity, count in report["rules_by_severity"].items()),
+        f"Techniques covered by enabled rules: {report['techniques_covered']}/{report['techniques_total']} "
+        f"({report['coverage_pct']}%), by any rule: {report['techniques_covered_any']}",
+        f"Subtechniques covered: {report['subtechniques_covered']}/{report['subtechniques_total']}",
+    ]
+    diff = report.get("diff")
+    if diff:
+        lines.append(f"Since {diff['previous_generated_at']}: {diff['coverage_pct_change']:+} points, "
+                     f"{len(diff['newly_covered'])} newly covered, {len(diff['lost_coverage'])} lost")
+        if diff["newly_covered"]:
+            lines.append(f"  Newly covered: {', '.join(diff['newly_covered'])}")
+        if diff["lost_coverage"]:
+            lines.append(f"  Lost coverage: {', '.join(diff['lost_coverage'])}")
+        if diff["tactics"]:
+            lines.append("  " + ", ".join(f"{name} {change:+}" for name, change in diff["tactics"].items()))
+    rows = report["tactics"]
+    if tactic:
+        rows = [row for row in rows if tactic.lower() in (row["tactic"].lower(), row["shortname"])]
+    lines += ["", "Tactic | Covered | % | Any rule %"]
+    lines += [f"{row['tactic']} | {row['covered']}/{row['total']} | {row['pct']} | {row['pct_any']}" for row in rows]
+    for row in rows:
+        if not (row["no_rule"] or row["disabled_only"] or row["low_only"]):
+            continue
+        lines += ["", f"{row['tactic']} gaps:"]
+        if row["no_rule"]:
+            lines.append(f"  No rule: {', '.join(row['no_rule'])}")
+        if row["disabled_only"]:
+            lines.append(f"  Only disabled rules (enable to cover): {', '.join(row['disabled_only'])}")
+        if row["low_only"]:
+            lines.append(f"  Only low-severity rules: {', '.join(row['low_only'])}")
+    if report["unknown_techniques"]:
+        lines += ["", f"Mapped IDs not in {MITRE_INDEX} (revoked, deprecated or not loaded): "
+                      f"{', '.join(report['unknown_techniques'])}"]
+    return "\n".join(lines)
+
+
+def latest_report(es_url):
+    """The most recent stored report, or None."""
+    resp = api_request(
+        "POST",
+        f"{es_url}/{COVERAGE_INDEX}/_search",
+        headers=es_headers(),
+        json={"size": 1, "_source": {"excludes": ["report"]},
+              "query": {"term": {"kind": "report"}}, "sort": [{"generated_at": "desc"}]},
+    )
+    if not resp.ok:
+        return None
+    hits = resp.json()["hits"]["hits"]
+    return hits[0]["_source"] if hits else None
+
+
+def build_report(es_url, page_size=RULES_PAGE_SIZE):
+    techniques, tactics = load_attack(es_url)
+    if not techniques:
+        raise SystemExit(f"ERROR: no ATT&CK techniques in {MITRE_INDEX}. Load them with "
+                         "`python scripts/setup.py --load-knowledge enterprise-attack.json`.")
+    matrix = CoverageMatrix(techniques)
+    for rule in iter_kibana_objects(RULES_PATH, page_size=page_size):
+        matrix.add_rule(rule)
+    report = matrix.report(tactics)
+    report["diff"] = diff_reports(latest_report(es_url), report)
+    report["report"] = render(report)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Elastic Security Agent Mesh MITRE ATT&CK coverage engine")
+    parser.add_argument("--tactic", help="Only print this tactic (name or shortname, e.g. 'Initial Access')")
+    parser.add_argument("--no-store", action="store_true", help=f"Do not store the report in {COVERAGE_INDEX}")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--page-size", type=int, default=RULES_PAGE_SIZE, metavar="N",
+                        help=f"Rules per _find page (default: {RULES_PAGE_SIZE})")
+    parser.add_argument("--max-rps", type=float, default=DEFAULT_MAX_RPS, metavar="RPS",
+                        help=f"Upper bound on API requests per second (default: {DEFAULT_MAX_RPS:g})")
+    args = parser.parse_args()
+
+    validate_env()
+    configure_api_client(args.max_rps, 1)
+    es_url = os.environ["ELASTIC_CLOUD_URL"].rstrip("/")
+    report = build_report(es_url, args.page_size)
+    if not args.no_store:
+        resp = api_request("POST", f"{es_url}/{COVERAGE_INDEX}/_doc", headers=es_headers(),
+                           params={"refresh": "true"}, json=report)
+        if not resp.ok:
+            print(f"[WARN] Could not store the report: {resp.status_code} — {resp.text[:200]}", file=sys.stderr)
+    print(json.dumps(report, indent=2) if args.json else render(report, args.tactic))
+
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,26 @@ Usage:
     python scripts/setup.py --delete-workflows # (see note: manual deletion required)
     python scripts/setup.py --delete-all       # Delete agents + tools, then full re-deploy (workflows: manual)
     python scripts/setup.py --validate         # Validate env vars without deploying
+    python scripts/setup.py --concurrency 8    # Parallelise API calls within each phase
+    python scripts/setup.py --plan             # Show the workflow/tool/agent diff without changing anything
+    python scripts/setup.py --apply            # Apply that diff with one call per change
+    python scripts/setup.py --force-workflows  # Re-import workflows even if unchanged
+    python scripts/setup.py --prune-workflows  # Also delete workflows removed from the repo
+    python scripts/setup.py --load-knowledge enterprise-attack.json  # Bulk-load JSON/JSONL/STIX into kb-*
+    python scripts/setup.py --rollover-indices # Dispatch/approval queues as ILM rollover aliases
+    python scripts/setup.py --redrive-dispatches [--redrive-agent ID] [--redrive-case ID]  # Re-queue dead-lettered dispatches
+    python scripts/setup.py --cache-stats      # Enrichment cache hit/miss counts
+
+Workflow imports are incremental: the post-replacement YAML of each file is
+hashed and recorded in the deploy-manifest index, and files whose hash and
+workflow ID are unchanged are skipped on the next run.
+
+Phases always run in dependency order (workflows → tools → agents → registry);
+--concurrency only parallelises calls inside a phase. All calls share a token
+bucket (--max-rps) that slows down on HTTP 429/503 and honours Retry-After,
+and reuse one keep-alive connection pool per host (see api_request()).
+Existing workflows, tools and agents are listed by streaming paginated
+results (--page-size), never by re-listing or probing objects one by one.
 
 Workflow placeholder tokens (replaced at import time with env var values):
     __ES_URL__            ← ELASTIC_CLOUD_URL
@@ -31,19 +51,30 @@ Workflow placeholder tokens (replaced at import time with env var values):
     __VT_API_KEY__        ← VIRUSTOTAL_API_KEY
     __ABUSEIPDB_API_KEY__ ← ABUSEIPDB_API_KEY
     __LLM_CONNECTOR_ID__  ← LLM_CONNECTOR_ID
+    __ROUTER_URL__        ← ROUTER_URL (optional, scripts/agent_router.py)
+    __ROUTER_TOKEN__      ← ROUTER_TOKEN (optional)
 """
 
 import argparse
+import hashlib
 import json
 import os
+import random
 import re
 import sys
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
+from urllib.parse import urlsplit
 
 try:
     import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.exceptions import NewConnectionError
 except ImportError:
     print("ERROR: 'requests' package required. Install with: pip install requests pyyaml")
     sys.exit(1)
@@ -87,6 +118,9 @@ WORKFLOW_DIRS = [
     "workflows/utilities",
 ]
 
+DEPLOY_MANIFEST_INDEX = "deploy-manifest"
+ENRICHMENT_CACHE_INDEX = "enrichment-cache"
+
 
 def validate_env():
     """Check that all required environment variables are set."""
@@ -131,25 +165,400 @@ def kibana_base_url():
     return base
 
 
-def index_exists(index_name):
-    url = f"{os.environ['ELASTIC_CLOUD_URL']}/{index_name}"
-    resp = requests.head(url, headers=es_headers(), timeout=15)
-    return resp.status_code == 200
+# ---------------------------------------------------------------------------
+# HTTP client: pooled sessions, throttling and concurrent execution
+# ---------------------------------------------------------------------------
+
+THROTTLE_STATUS_CODES = (429, 503)
+THROTTLE_MAX_RETRIES = 5
+TRANSPORT_MAX_RETRIES = 3
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_CAP = 20.0
+DEFAULT_MAX_RPS = 10.0
+CONNECT_TIMEOUT = 10
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE"}
+
+# (method or None for any, path regex, read timeout in seconds) — first match wins.
+ENDPOINT_TIMEOUTS = [
+    ("HEAD", re.compile(r".*"), 15),
+    ("DELETE", re.compile(r".*"), 15),
+    (None, re.compile(r"/_bulk$"), 120),
+    ("POST", re.compile(r"/_reindex$"), 600),
+    ("POST", re.compile(r"/_update_by_query$"), 600),
+    ("GET", re.compile(r"/api/agent_builder/tools/[^/]+$"), 10),
+    ("POST", re.compile(r"/api/agent_builder/converse$"), 600),
+    (None, re.compile(r"/api/(workflows|agent_builder)\b"), 30),
+]
+DEFAULT_READ_TIMEOUT = 30
 
 
-def create_index(index_name, mapping_body):
-    if index_exists(index_name):
-        print(f"  [skip] {index_name} already exists")
+class TokenBucket:
+    """Thread-safe token bucket that backs off when the server pushes back.
+
+    Each API call takes one token. Tokens refill at `rate` per second up to
+    `capacity`. A 429/503 halves the rate (down to `min_rate`) and, when the
+    server sends Retry-After, blocks every caller until that time has passed.
+    Each successful call nudges the rate back up towards `max_rate`.
+    """
+
+    def __init__(self, rate, capacity=None, min_rate=0.5):
+        self.max_rate = float(rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.rate = self.max_rate
+        self.capacity = float(capacity or max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + 0.1 * self.max_rate)
+
+    def on_throttle(self, retry_after=None):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            delay = retry_after if retry_after is not None else 1.0 / self.rate
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+
+
+RATE_LIMITER = TokenBucket(DEFAULT_MAX_RPS)
+POOL_SIZE = 10
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+def configure_api_client(max_rps, concurrency):
+    """Replace the shared limiter and size connection pools for `concurrency` workers."""
+    global RATE_LIMITER, POOL_SIZE
+    RATE_LIMITER = TokenBucket(max_rps, capacity=max(1, concurrency))
+    POOL_SIZE = max(10, concurrency)
+    with _SESSIONS_LOCK:
+        for session in _SESSIONS.values():
+            session.close()
+        _SESSIONS.clear()
+
+
+def get_session(url):
+    """Return the shared keep-alive session for the URL's scheme and host.
+
+    One pooled session per host means every call to Elasticsearch (or
+    Kibana) reuses an already-open TCP+TLS connection instead of
+    handshaking again.
+    """
+    parts = urlsplit(url)
+    key = f"{parts.scheme}://{parts.netloc}"
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=0)
+            session.mount(f"{parts.scheme}://", adapter)
+            _SESSIONS[key] = session
+        return session
+
+
+def endpoint_timeout(method, url):
+    """Return the (connect, read) timeout for a request from ENDPOINT_TIMEOUTS."""
+    path = urlsplit(url).path
+    for endpoint_method, pattern, read_timeout in ENDPOINT_TIMEOUTS:
+        if endpoint_method in (None, method) and pattern.search(path):
+            return (CONNECT_TIMEOUT, read_timeout)
+    return (CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+
+
+def _backoff_delay(attempt):
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2^attempt))."""
+    return random.uniform(0, min(RETRY_BACKOFF_CAP, RETRY_BACKOFF_BASE * (2 ** attempt)))
+
+
+def _retry_after_seconds(resp):
+    """Parse a Retry-After header (delta-seconds or HTTP-date) into seconds."""
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def _connect_failed(exc):
+    """True when a transport error happened before the request reached the server.
+
+    Only connect timeouts and failures to open the connection qualify. A
+    ConnectionError raised after the request was sent ("Connection aborted",
+    RemoteDisconnected, reset) may already have been acted on.
+    """
+    if isinstance(exc, requests.ConnectTimeout):
         return True
+    seen = set()
+    pending = [exc]
+    while pending:
+        err = pending.pop()
+        if err is None or id(err) in seen:
+            continue
+        seen.add(id(err))
+        if isinstance(err, NewConnectionError):
+            return True
+        pending.extend([getattr(err, "reason", None), err.__cause__, err.__context__])
+        pending.extend(arg for arg in getattr(err, "args", ()) if isinstance(arg, BaseException))
+    return False
+
+
+def api_request(method, url, **kwargs):
+    """Issue one HTTP request through the pooled session and shared rate limiter.
+
+    The timeout defaults to the ENDPOINT_TIMEOUTS entry for the URL.
+    429 and 503 responses throttle the limiter and are retried (honouring
+    Retry-After, otherwise jittered backoff) up to THROTTLE_MAX_RETRIES
+    times. Failures to connect are retried with jittered backoff up to
+    TRANSPORT_MAX_RETRIES times before the exception is raised. Any other
+    transport error (read timeout, connection dropped after sending) is
+    retried only for idempotent methods, since the server may already have
+    acted on a POST or PATCH. The last response is returned either way so
+    callers keep their existing status handling.
+    """
+    kwargs.setdefault("timeout", endpoint_timeout(method, url))
+    session = get_session(url)
+    transport_failures = 0
+    throttled = 0
+    while True:
+        RATE_LIMITER.acquire()
+        try:
+            resp = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            # Once the request is on the wire the server may have acted on it,
+            # so only replay it when doing so cannot create a duplicate.
+            replay_safe = _connect_failed(exc) or method.upper() in IDEMPOTENT_METHODS
+            if transport_failures >= TRANSPORT_MAX_RETRIES or not replay_safe:
+                raise
+            time.sleep(_backoff_delay(transport_failures))
+            transport_failures += 1
+            continue
+        if resp.status_code not in THROTTLE_STATUS_CODES:
+            RATE_LIMITER.on_success()
+            return resp
+        if throttled >= THROTTLE_MAX_RETRIES:
+            return resp
+        retry_after = _retry_after_seconds(resp)
+        RATE_LIMITER.on_throttle(retry_after if retry_after is not None else _backoff_delay(throttled))
+        throttled += 1
+
+
+def run_parallel(fn, items, concurrency=1):
+    """Yield fn(item) for each item, in input order, with bounded concurrency.
+
+    With concurrency <= 1 items run serially. Results are yielded as soon as
+    they are available in order, so callers can print progress while the
+    pool keeps working on later items. Items are consumed lazily — at most
+    2 × concurrency are submitted ahead of the caller — so `items` can be a
+    generator over a source too large to hold in memory.
+    """
+    if concurrency <= 1:
+        for item in items:
+            yield fn(item)
+        return
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = deque()
+        for item in items:
+            in_flight.append(pool.submit(fn, item))
+            if len(in_flight) >= 2 * concurrency:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+# Kibana list endpoints that take explicit paging parameters: path → (page param, page-size param).
+# Other endpoints are read as returned, following any `total` they report.
+PAGED_LIST_ENDPOINTS = {
+    "/api/workflows": ("page", "size"),
+    "/api/detection_engine/rules/_find": ("page", "per_page"),
+}
+LIST_PAGE_SIZE = 100
+LIST_ITEM_KEYS = ("data", "items", "results", "workflows", "tools", "agents")
+
+
+def _list_items(body):
+    """Extract the object list from a Kibana list response (list or wrapped)."""
+    if isinstance(body, list):
+        return body
+    if isinstance(body, dict):
+        for key in LIST_ITEM_KEYS:
+            if isinstance(body.get(key), list):
+                return body[key]
+    return []
+
+
+def iter_kibana_objects(path, page_size=None):
+    """Yield every object from a Kibana list endpoint, one page at a time.
+
+    Endpoints in PAGED_LIST_ENDPOINTS are requested `page_size` objects at
+    a time (default LIST_PAGE_SIZE) until a short page or the reported
+    `total` is reached. Other endpoints are read as returned, following the
+    page-size parameter they echo back if they report a `total`. Only one
+    page is held in memory at a time, so the cost is one request per page
+    however many objects the space holds. Raises requests.HTTPError if a
+    page cannot be fetched.
+    """
+    base_url = kibana_base_url()
+    headers = kibana_headers()
+    page_size = page_size or LIST_PAGE_SIZE
+    page = 1
+    if path in PAGED_LIST_ENDPOINTS:
+        page_key, size_key = PAGED_LIST_ENDPOINTS[path]
+        params = {page_key: page, size_key: page_size}
+    else:
+        page_key, size_key = "page", None
+        params = None
+    fetched = 0
+    while True:
+        resp = api_request("GET", f"{base_url}{path}", headers=headers, params=params)
+        resp.raise_for_status()
+        body = resp.json()
+        items = _list_items(body)
+        yield from items
+        fetched += len(items)
+        total = body.get("total") if isinstance(body, dict) else None
+        if not items or (isinstance(total, int) and fetched >= total):
+            return
+        if size_key is None:
+            if not isinstance(total, int):
+                return
+            size_key = next((k for k in ("size", "perPage", "per_page", "limit") if k in body), "perPage")
+            page_size = body.get(size_key) or len(items)
+        elif not isinstance(total, int) and len(items) < page_size:
+            return
+        page += 1
+        params = {page_key: page, size_key: page_size}
 
+
+def _put_index(index_name, mapping_body):
+    """PUT one index. Returns (outcome, message) with outcome created/exists/failed."""
     url = f"{os.environ['ELASTIC_CLOUD_URL']}/{index_name}"
-    resp = requests.put(url, headers=es_headers(), json=mapping_body, timeout=30)
+    resp = api_request("PUT", url, headers=es_headers(), json=mapping_body)
     if resp.ok:
-        print(f"  [created] {index_name}")
-        return True
-    else:
-        print(f"  [FAILED] {index_name}: {resp.status_code} — {resp.text[:200]}")
-        return False
+        return "created", f"[created] {index_name}"
+    if resp.status_code == 400 and "resource_already_exists_exception" in resp.text:
+        return "exists", f"[skip] {index_name} already exists"
+    return "failed", f"[FAILED] {index_name}: {resp.status_code} — {resp.text[:200]}"
+
+
+def create_index(index_name, mapping_body):
+    """Create an index unless it exists (one PUT; an existing index is a skip)."""
+    outcome, message = _put_index(index_name, mapping_body)
+    print(f"  {message}")
+    return outcome != "failed"
+
+
+def resolve_existing_indices(index_names):
+    """Resolve which of index_names exist, and their mappings, in one request.
+
+    Names may be concrete indices or aliases (the rollover layout). Returns
+    {name: {"mappings": mappings, "alias": bool}} for the names that exist —
+    for an alias, the mappings of its write index — or None if the lookup
+    itself failed.
+    """
+    url = f"{os.environ['ELASTIC_CLOUD_URL']}/{','.join(index_names)}"
+    resp = api_request(
+        "GET",
+        url,
+        headers=es_headers(),
+        params={
+            "ignore_unavailable": "true",
+            "allow_no_indices": "true",
+            "filter_path": "*.aliases,*.mappings",
+        },
+    )
+    if not resp.ok:
+        print(f"  [WARN] Could not resolve existing indices: {resp.status_code} — {resp.text[:200]}")
+        return None
+    wanted = set(index_names)
+    resolved = {}
+    for concrete, body in resp.json().items():
+        mappings = body.get("mappings", {})
+        if concrete in wanted:
+            resolved[concrete] = {"mappings": mappings, "alias": False}
+        for alias, alias_def in body.get("aliases", {}).items():
+            if alias in wanted and (alias not in resolved or alias_def.get("is_write_index")):
+                resolved[alias] = {"mappings": mappings, "alias": True}
+    return resolved
+
+
+def add_missing_fields(index_name, expected, actual):
+    """Add top-level fields the repo mapping defines but the live index lacks.
+
+    Adding a field is always allowed in place, so new fields in the mapping
+    functions reach existing deployments without a reindex. Returns
+    (added field names, message or None).
+    """
+    live = actual.get("properties", {})
+    missing = {field: spec for field, spec in expected.get("properties", {}).items() if field not in live}
+    if not missing:
+        return set(), None
+    url = f"{os.environ['ELASTIC_CLOUD_URL']}/{index_name}/_mapping"
+    resp = api_request("PUT", url, headers=es_headers(), json={"properties": missing})
+    if not resp.ok:
+        return set(), f"[WARN] could not add {', '.join(sorted(missing))}: {resp.status_code} — {resp.text[:150]}"
+    return set(missing), f"[updated] added {', '.join(sorted(missing))}"
+
+
+def mapping_drift(expected, actual, prefix=""):
+    """List differences between an expected and a live mapping.
+
+    Only fields the repo defines are compared (extra live fields, e.g. from
+    dynamic mapping, are not drift): missing fields, a different type, and a
+    different inference_id on semantic_text fields.
+    """
+    drift = []
+    actual_props = actual.get("properties", {})
+    for field, spec in expected.get("properties", {}).items():
+        path = f"{prefix}{field}"
+        live = actual_props.get(field)
+        if live is None:
+            drift.append(f"{path}: missing")
+            continue
+        expected_type = spec.get("type", "object")
+        live_type = live.get("type", "object")
+        if expected_type != live_type:
+            drift.append(f"{path}: {live_type} (expected {expected_type})")
+            continue
+        if "inference_id" in spec and live.get("inference_id") != spec["inference_id"]:
+            drift.append(f"{path}: inference_id {live.get('inference_id')} (expected {spec['inference_id']})")
+        if "properties" in spec:
+            drift.extend(mapping_drift(spec, live, f"{path}."))
+        for sub, sub_spec in spec.get("fields", {}).items():
+            live_sub = live.get("fields", {}).get(sub)
+            if live_sub is None:
+                drift.append(f"{path}.{sub}: missing")
+            elif live_sub.get("type") != sub_spec.get("type"):
+                drift.append(f"{path}.{sub}: {live_sub.get('type')} (expected {sub_spec.get('type')})")
+    return drift
 
 
 def knowledge_base_mapping():
@@ -205,6 +614,9 @@ def agent_registry_mapping():
 
 
 def investigation_contexts_mapping():
+    # evidence, actions_taken and pending_actions are read-only history from
+    # before investigation-evidence: new entries are appended there instead,
+    # so writing one never reindexes the context or its semantic_summary.
     inference_id = os.environ.get("INFERENCE_ENDPOINT_ID", ".multilingual-e5-small-elasticsearch")
     return {
         "settings": {"number_of_shards": 1, "number_of_replicas": 1},
@@ -264,6 +676,86 @@ def investigation_contexts_mapping():
     }
 
 
+EVIDENCE_INGEST_PIPELINE = "investigation-evidence-ingest"
+
+
+def evidence_ingest_pipeline():
+    # Stamps each evidence entry with the time it reached the cluster.
+    # timestamp is the writer's clock and can lag by more than any transform
+    # delay (agent clock skew, slow _bulk, retried writes), which would make
+    # the transform skip the entry for good.
+    return {
+        "description": "Stamp investigation-evidence entries with their ingest time",
+        "processors": [{"set": {"field": "ingested_at", "value": "{{{_ingest.timestamp}}}"}}],
+        "_meta": {"managed_by": "security-mesh"},
+    }
+
+
+def investigation_evidence_mapping():
+    # Append-only: one document per evidence entry (kind "evidence"), logged
+    # decision ("action_taken") or proposed action ("pending_action"),
+    # written with _doc or _bulk and never updated. investigation_id is the
+    # investigation context's document ID. Each kind keeps the field names
+    # it had as a nested entry; agent_id is the recommending agent for
+    # proposals. ingested_at is set by EVIDENCE_INGEST_PIPELINE, not by the
+    # writer, and is what the summary transform syncs on.
+    return {
+        "settings": {
+            "number_of_shards": 1,
+            "number_of_replicas": 1,
+            "index.default_pipeline": EVIDENCE_INGEST_PIPELINE,
+        },
+        "mappings": {
+            "properties": {
+                "investigation_id": {"type": "keyword"},
+                "ingested_at": {"type": "date"},
+                "kind": {"type": "keyword"},
+                "agent_id": {"type": "keyword"},
+                "timestamp": {"type": "date"},
+                "evidence_type": {"type": "keyword"},
+                "content": {"type": "text"},
+                "confidence": {"type": "float"},
+                "references": {"type": "keyword"},
+                "action_type": {"type": "keyword"},
+                "target": {"type": "text"},
+                "approved_by": {"type": "keyword"},
+                "result": {"type": "text"},
+                "risk_tier": {"type": "keyword"},
+                "justification": {"type": "text"},
+                "evidence_refs": {"type": "keyword"},
+            }
+        },
+    }
+
+
+def investigation_evidence_summary_mapping():
+    # Destination of the EVIDENCE_SUMMARY_TRANSFORM pivot: one document per
+    # investigation, recomputed only for investigations with new entries.
+    return {
+        "settings": {"number_of_shards": 1, "number_of_replicas": 1},
+        "mappings": {
+            "properties": {
+                "investigation_id": {"type": "keyword"},
+                "entries": {"type": "long"},
+                "evidence": {"type": "long"},
+                "actions_taken": {"type": "long"},
+                "pending_actions": {"type": "long"},
+                "agents": {"type": "long"},
+                "max_confidence": {"type": "float"},
+                "first_at": {"type": "date"},
+                "last_at": {"type": "date"},
+                "latest": {
+                    "properties": {
+                        "kind": {"type": "keyword"},
+                        "agent_id": {"type": "keyword"},
+                        "evidence_type": {"type": "keyword"},
+                    }
+                },
+            }
+        },
+    }
+
+
 def action_policies_mapping():
     return {
         "settings": {"number_of_shards": 1, "number_of_replicas": 1},
@@ -284,6 +776,8 @@ def action_policies_mapping():
                 "approval_channel": {"type": "keyword"},
                 "rollback_workflow": {"type": "keyword"},
                 "ttl_minutes": {"type": "integer"},
+                "max_targets": {"type": "integer"},
+                "max_hosts_per_action": {"type": "integer"},
                 "description": {"type": "text"},
             }
         },
@@ -291,8 +785,16 @@ def action_policies_mapping():
 
 
 def dispatch_requests_mapping():
+    # priority_rank (urgent 0, high 1, normal 2, low 3) is what the queue
+    # sorts on; the index is sorted the same way, so segments are laid out in
+    # pick order. Index sorting only applies to newly created indices.
     return {
-        "settings": {"number_of_shards": 1, "number_of_replicas": 1},
+        "settings": {
+            "number_of_shards": 1,
+            "number_of_replicas": 1,
+            "sort.field": ["priority_rank", "created_at"],
+            "sort.order": ["asc", "asc"],
+        },
         "mappings": {
             "properties": {
                 "dispatch_id": {"type": "keyword"},
@@ -302,11 +804,35 @@ def dispatch_requests_mapping():
                 "investigation_id": {"type": "keyword"},
                 "context": {"type": "text"},
                 "priority": {"type": "keyword"},
+                "priority_rank": {"type": "integer"},
                 "status": {"type": "keyword"},
                 "created_at": {"type": "date"},
                 "dispatched_at": {"type": "date"},
                 "completed_at": {"type": "date"},
                 "result_summary": {"type": "text"},
+                "lease_owner": {"type": "keyword"},
+                "lease_expires_at": {"type": "date"},
+                "attempts": {"type": "integer"},
+                "next_attempt_at": {"type": "date"},
+                "last_error": {"type": "text"},
+                "dead_lettered_at": {"type": "date"},
+                "redriven_at": {"type": "date"},
+                # Dispatch groups: children carry group_id/join_id/join_index;
+                # the join record (kind "join") collects their results.
+                "kind": {"type": "keyword"},
+                "group_id": {"type": "keyword"},
+                "join_id": {"type": "keyword"},
+                "join_index": {"type": "keyword"},
+                "expected_children": {"type": "integer"},
+                "results": {"type": "object", "enabled": False},
+                "deadline_at": {"type": "date"},
+                "released_at": {"type": "date"},
+                "join_reason": {"type": "keyword"},
+                # Coalescing: case_id:target_agent, shared by duplicates.
+                "dedupe_key": {"type": "keyword"},
+                "merged_count": {"type": "integer"},
+                "last_merged_at": {"type": "date"},
+                "superseded_by": {"type": "keyword"},
             }
         },
     }
@@ -332,36 +858,660 @@ def approval_requests_mapping():
                 "created_at": {"type": "date"},
                 "resolved_at": {"type": "date"},
                 "resolved_by": {"type": "keyword"},
+                "decision_comment_id": {"type": "keyword"},
                 "execution_result": {"type": "text"},
+                # bulk_operation approvals only: the exact request approved
+                # (endpoint IDs deduplicated, sorted and comma-joined), and
+                # the Bulk Contain Hosts run that used the approval up.
+                "bulk_operation": {"type": "keyword"},
+                "bulk_targets": {"type": "keyword"},
+                "bulk_target_count": {"type": "integer"},
+                "consumed_by": {"type": "keyword"},
+                "consumed_at": {"type": "date"},
             }
         },
     }
 
 
-def create_all_indices():
-    print("=== Creating Indices ===\n")
+def endpoint_action_results_mapping():
+    # One completion record per finished Elastic Defend response action,
+    # written by scripts/action_poller.py with the action ID as document ID.
+    # outputs keeps the per-endpoint output exactly as the action API returns
+    # it, so workflows read it with the same paths as a live status call.
+    # Bulk Contain Hosts also writes one kind "bulk_target" document per
+    # host (ID <operation>:<endpoint>), which the poller updates from that
+    # host's agent_state entry when the action covering its chunk finishes.
+    return {
+        "settings": {"number_of_shards": 1, "number_of_replicas": 1},
+        "mappings": {
+            "properties": {
+                "action_id": {"type": "keyword"},
+                "kind": {"type": "keyword"},
+                "bulk_operation_id": {"type": "keyword"},
+                "endpoint_id": {"type": "keyword"},
+                "approval_id": {"type": "keyword"},
+                "case_id": {"type": "keyword"},
+                "submitted_at": {"type": "date"},
+                "command": {"type": "keyword"},
+                "agent_ids": {"type": "keyword"},
+                "host_names": {"type": "keyword"},
+                "status": {"type": "keyword"},
+                "was_successful": {"type": "boolean"},
+                "is_expired": {"type": "boolean"},
+                "created_by": {"type": "keyword"},
+                "comment": {"type": "text"},
+                "started_at": {"type": "date"},
+                "completed_at": {"type": "date"},
+                "recorded_at": {"type": "date"},
+                "hosts": {"type": "object", "enabled": False},
+                "agent_state": {"type": "object", "enabled": False},
+                "outputs": {"type": "object", "enabled": False},
+                "errors": {"type": "text"},
+            }
+        },
+    }
+
+
+def enrichment_cache_mapping():
+    # One entry per external IOC lookup, shared by every agent's enrichment
+    # workflows. The document ID is <source>:<ioc type>:<value>, e.g.
+    # virustotal:file:<sha256>. response_json holds the provider's response
+    # verbatim. All timestamps are epoch milliseconds written by update
+    # scripts (ctx._now). Each workflow sets its own TTL in
+    # consts.cache_ttl_seconds: 7 days for file hashes, 1 day for domains,
+    # 12 hours for URLs and 6 hours for IP addresses. verdict is "found",
+    # "not_found" (a VirusTotal 404, cached for 1 hour) or "error" (a failed
+    # AbuseIPDB check, cached for 15 minutes). filling_until is a
+    # short lease held by the one workflow fetching a missing or stale
+    # entry. Concurrent lookups of the same IOC wait for that fetch instead
+    # of calling the API again. Cache hits are counted on one kind
+    # "hit_counter" document per source and IOC type (ID
+    # hits:<source>:<ioc type>), never on the entry itself.
+    return {
+        "settings": {"number_of_shards": 1, "number_of_replicas": 1},
+        "mappings": {
+            "properties": {
+                "kind": {"type": "keyword"},
+                "source": {"type": "keyword"},
+                "ioc_type": {"type": "keyword"},
+                "ioc_value": {"type": "keyword"},
+                "response_json": {"type": "text", "index": False},
+                "verdict": {"type": "keyword"},
+                "fetched_at": {"type": "date"},
+                "expires_at": {"type": "date"},
+                "filling_until": {"type": "date"},
+                "last_hit_at": {"type": "date"},
+                "hit_count": {"type": "long"},
+                "miss_count": {"type": "long"},
+            }
+        },
+    }
+
+
+def enrichment_batches_mapping():
+    # Batch Enrich IOCs writes one kind "request" document per batch (ID
+    # enb-<timestamp>) with the raw IOC list. scripts/enrichment_worker.py
+    # claims it under a lease, records progress on it, and creates a kind
+    # "result" document (ID <batch>:result) holding the rendered table and
+    # one row per unique IOC. The workflow waits for that document.
+    return {
+        "settings": {"number_of_shards": 1, "number_of_replicas": 1},
+        "mappings": {
+            "properties": {
+                "kind": {"type": "keyword"},
+                "batch_id": {"type": "keyword"},
+                "status": {"type": "keyword"},
+                "iocs": {"type": "text", "index": False},
+                "case_id": {"type": "keyword"},
+                "requested_by": {"type": "keyword"},
+                "worker": {"type": "keyword"},
+                "submitted_at": {"type": "date"},
+                "started_at": {"type": "date"},
+                "completed_at": {"type": "date"},
+                "lease_expires_at": {"type": "date"},
+                "total": {"type": "integer"},
+                "done": {"type": "integer"},
+                "from_cache": {"type": "integer"},
+                "fetched": {"type": "integer"},
+                "verdicts": {"type": "object", "enabled": False},
+                "table": {"type": "text", "index": False},
+                "results": {"type": "object", "enabled": False},
+            }
+        },
+    }
+
+
+def detection_feedback_rollup_mapping():
+    # One kind "daily" document per detection rule per UTC day (ID
+    # <rule uuid>:<YYYY-MM-DD>) with the day's alert total and TP/FP tag
+    # counts, plus one kind "checkpoint" document (ID "checkpoint") holding
+    # settled_through, the first day scripts/feedback_rollup.py still
+    # recounts. The feedback workflows aggregate these instead of raw alerts.
+    return {
+        "settings": {"number_of_shards": 1, "number_of_replicas": 1},
+        "mappings": {
+            "properties": {
+                "kind": {"type": "keyword"},
+                "rule_id": {"type": "keyword"},
+                "rule_name": {"type": "keyword"},
+                "day": {"type": "date", "format": "yyyy-MM-dd"},
+                "total": {"type": "long"},
+                "true_positives": {"type": "long"},
+                "false_positives": {"type": "long"},
+                "updated_at": {"type": "date"},
+                "settled_through": {"type": "date", "format": "yyyy-MM-dd"},
+                "last_counted_from": {"type": "date", "format": "yyyy-MM-dd"},
+                "last_rule_days": {"type": "long"},
+                "last_alerts": {"type": "long"},
+            }
+        },
+    }
+
+
+def mitre_coverage_mapping():
+    # One kind "report" document per scripts/mitre_coverage.py run. covered
+    # lists every technique and subtechnique an enabled rule maps to, which
+    # the next run diffs against. tactics (per-tactic counts, percentages and
+    # gap lists), diff and the rendered report are only ever read back whole.
+    return {
+        "settings": {"number_of_shards": 1, "number_of_replicas": 1},
+        "mappings": {
+            "properties": {
+                "kind": {"type": "keyword"},
+                "generated_at": {"type": "date"},
+                "rules_total": {"type": "integer"},
+                "rules_enabled": {"type": "integer"},
+                "rules_mapped": {"type": "integer"},
+                "rules_updated_at": {"type": "date"},
+                "rules_by_severity": {"type": "object", "enabled": False},
+                "techniques_total": {"type": "integer"},
+                "techniques_covered": {"type": "integer"},
+                "techniques_covered_any": {"type": "integer"},
+                "subtechniques_total": {"type": "integer"},
+                "subtechniques_covered": {"type": "integer"},
+                "coverage_pct": {"type": "float"},
+                "covered": {"type": "keyword"},
+                "unknown_techniques": {"type": "keyword"},
+                "tactics": {"type": "object", "enabled": False},
+                "diff": {"type": "object", "enabled": False},
+                "report": {"type": "text", "index": False},
+            }
+        },
+    }
 
-    print("Agent registry:")
-    create_index("agent-registry", agent_registry_mapping())
 
-    print("\nInvestigation contexts:")
-    create_index("investigation-contexts", investigation_contexts_mapping())
+def deploy_manifest_mapping():
+    return {
+        "settings": {"number_of_shards": 1, "number_of_replicas": 1},
+        "mappings": {
+            "properties": {
+                "space": {"type": "keyword"},
+                "path": {"type": "keyword"},
+                "workflow_id": {"type": "keyword"},
+                "workflow_name": {"type": "keyword"},
+                "content_hash": {"type": "keyword"},
+                "deployed_at": {"type": "date"},
+            }
+        },
+    }
 
-    print("\nAction policies:")
-    create_index("action-policies", action_policies_mapping())
 
-    print("\nDispatch requests:")
-    create_index("dispatch-requests", dispatch_requests_mapping())
+KB_INDEX_TEMPLATE = "security-mesh-kb"
 
-    print("\nApproval requests:")
-    create_index("approval-requests", approval_requests_mapping())
 
-    print("\nKnowledge bases:")
+def index_specs():
+    """Return the (section, index name, mapping body) triples setup provisions."""
     kb_mapping = knowledge_base_mapping()
-    for idx in KNOWLEDGE_BASE_INDICES:
-        create_index(idx, kb_mapping)
+    return [
+        ("Agent registry", "agent-registry", agent_registry_mapping()),
+        ("Investigation contexts", "investigation-contexts", investigation_contexts_mapping()),
+        ("Investigation evidence", "investigation-evidence", investigation_evidence_mapping()),
+        ("Investigation evidence", "investigation-evidence-summary", investigation_evidence_summary_mapping()),
+        ("Action policies", "action-policies", action_policies_mapping()),
+        ("Dispatch requests", "dispatch-requests", dispatch_requests_mapping()),
+        ("Approval requests", "approval-requests", approval_requests_mapping()),
+        ("Endpoint action results", "endpoint-action-results", endpoint_action_results_mapping()),
+        ("Enrichment cache", ENRICHMENT_CACHE_INDEX, enrichment_cache_mapping()),
+        ("Enrichment batches", "enrichment-batches", enrichment_batches_mapping()),
+        ("Detection feedback rollup", "detection-feedback-rollup", detection_feedback_rollup_mapping()),
+        ("MITRE coverage reports", "mitre-coverage", mitre_coverage_mapping()),
+        ("Deploy manifest", DEPLOY_MANIFEST_INDEX, deploy_manifest_mapping()),
+    ] + [("Knowledge bases", idx, kb_mapping) for idx in KNOWLEDGE_BASE_INDICES]
+
+
+def put_index_templates():
+    """Register the composable template that gives every kb-* index the knowledge base mapping.
+
+    Once it is in place, kb-* indices (including ones created later by the
+    Create Knowledge Index workflow or --load-knowledge) need no mapping in
+    their create request. Returns True if the template was stored.
+    """
+    template = {
+        "index_patterns": ["kb-*"],
+        "priority": 200,
+        "template": knowledge_base_mapping(),
+        "_meta": {"managed_by": "security-mesh"},
+    }
+    url = f"{os.environ['ELASTIC_CLOUD_URL']}/_index_template/{KB_INDEX_TEMPLATE}"
+    resp = api_request("PUT", url, headers=es_headers(), json=template)
+    if resp.ok:
+        print(f"  [applied] {KB_INDEX_TEMPLATE} (kb-*)")
+        return True
+    print(f"  [WARN] {KB_INDEX_TEMPLATE}: {resp.status_code} — {resp.text[:200]} (kb-* indices get explicit mappings)")
+    return False
+
+
+EVIDENCE_SUMMARY_TRANSFORM = "investigation-evidence-summary"
+# Synced on the ingest-time stamp, so the delay only has to cover refresh,
+# not how late a writer's own timestamp can be.
+EVIDENCE_SUMMARY_SYNC = {"time": {"field": "ingested_at", "delay": "10s"}}
+
+
+def put_ingest_pipelines():
+    """Register the evidence ingest pipeline. Returns True if it is in place.
+
+    Runs before the indices are created, since an index whose
+    default_pipeline does not exist rejects every write.
+    """
+    url = f"{os.environ['ELASTIC_CLOUD_URL']}/_ingest/pipeline/{EVIDENCE_INGEST_PIPELINE}"
+    resp = api_request("PUT", url, headers=es_headers(), json=evidence_ingest_pipeline())
+    if not resp.ok:
+        print(f"  [WARN] {EVIDENCE_INGEST_PIPELINE}: {resp.status_code} — {resp.text[:200]}")
+        return False
+    print(f"  [updated] {EVIDENCE_INGEST_PIPELINE}")
+    return True
+
+
+def set_default_pipeline():
+    """Point an existing investigation-evidence index at the ingest pipeline.
+
+    Indices created before the pipeline existed do not pick up the setting
+    from investigation_evidence_mapping(), and add_missing_fields only
+    covers mappings.
+    """
+    url = f"{os.environ['ELASTIC_CLOUD_URL']}/investigation-evidence/_settings"
+    resp = api_request("PUT", url, headers=es_headers(),
+                       json={"index.default_pipeline": EVIDENCE_INGEST_PIPELINE})
+    if not resp.ok and resp.status_code != 404:
+        print(f"  [WARN] investigation-evidence default pipeline: {resp.status_code} — {resp.text[:200]}")
+        return False
+    return True
+
+
+def evidence_summary_transform():
+    """Continuous pivot of investigation-evidence into one summary per investigation.
+
+    Each checkpoint only recomputes the investigations that gained entries
+    since the previous one, so the view stays current at a cost that
+    follows the write rate, not the total evidence held.
+    """
+    def count(kind):
+        return {"filter": {"term": {"kind": kind}}}
+
+    return {
+        "source": {"index": ["investigation-evidence"]},
+        "dest": {"index": "investigation-evidence-summary"},
+        "frequency": "5s",
+        "sync": EVIDENCE_SUMMARY_SYNC,
+        "pivot": {
+            "group_by": {"investigation_id": {"terms": {"field": "investigation_id"}}},
+            "aggregations": {
+                "entries": {"value_count": {"field": "kind"}},
+                "evidence": count("evidence"),
+                "actions_taken": count("action_taken"),
+                "pending_actions": count("pending_action"),
+                "agents": {"cardinality": {"field": "agent_id"}},
+                "max_confidence": {"max": {"field": "confidence"}},
+                "first_at": {"min": {"field": "timestamp"}},
+                "last_at": {"max": {"field": "timestamp"}},
+                "latest": {"top_metrics": {
+                    "metrics": [{"field": "kind"}, {"field": "agent_id"}, {"field": "evidence_type"}],
+                    "sort": {"timestamp": "desc"},
+                }},
+            },
+        },
+        "_meta": {"managed_by": "security-mesh"},
+    }
+
+
+def put_transforms():
+    """Create and start the evidence summary transform. Returns True if it is running.
+
+    An existing transform has its sync updated in place, so one created
+    when it still synced on the writer's timestamp moves to ingested_at.
+    """
+    if not set_default_pipeline():
+        return False
+    base = f"{os.environ['ELASTIC_CLOUD_URL']}/_transform/{EVIDENCE_SUMMARY_TRANSFORM}"
+    resp = api_request("PUT", base, headers=es_headers(), json=evidence_summary_transform())
+    if resp.ok:
+        print(f"  [created] {EVIDENCE_SUMMARY_TRANSFORM}")
+    elif resp.status_code == 409:
+        resp = api_request("POST", f"{base}/_update", headers=es_headers(),
+                           json={"sync": EVIDENCE_SUMMARY_SYNC})
+        if not resp.ok:
+            print(f"  [WARN] Could not update {EVIDENCE_SUMMARY_TRANSFORM}: {resp.status_code} — {resp.text[:200]}")
+            return False
+        print(f"  [skip] {EVIDENCE_SUMMARY_TRANSFORM} already exists (sync updated)")
+    else:
+        print(f"  [WARN] {EVIDENCE_SUMMARY_TRANSFORM}: {resp.status_code} — {resp.text[:200]}")
+        return False
+    resp = api_request("POST", f"{base}/_start", headers=es_headers())
+    if not resp.ok and resp.status_code != 409:
+        print(f"  [WARN] Could not start {EVIDENCE_SUMMARY_TRANSFORM}: {resp.status_code} — {resp.text[:200]}")
+        return False
+    return True
+
+
+# Queue-style indices that --rollover-indices provisions as ILM-managed
+# rollover aliases. investigation-contexts stays a plain index: cases read and
+# update their context document by ID for weeks, and single-document
+# operations through an alias only reach its current write index.
+ROLLOVER_INDICES = ("dispatch-requests", "approval-requests")
+OPERATIONAL_ILM_POLICY = "security-mesh-operational"
+ROLLOVER_MAX_AGE = "7d"
+ROLLOVER_MAX_PRIMARY_SHARD_SIZE = "10gb"
+DEFAULT_RETENTION_DAYS = 30
+
+
+def operational_ilm_policy(retention_days=DEFAULT_RETENTION_DAYS):
+    """ILM policy for rollover indices: roll weekly, deprioritise, then delete.
+
+    Warm only lowers recovery priority — no forcemerge or readonly — because
+    monitors may still update a late dispatch in an index that has rolled.
+    """
+    return {
+        "policy": {
+            "_meta": {"managed_by": "security-mesh"},
+            "phases": {
+                "hot": {
+                    "actions": {
+                        "rollover": {
+                            "max_age": ROLLOVER_MAX_AGE,
+                            "max_primary_shard_size": ROLLOVER_MAX_PRIMARY_SHARD_SIZE,
+                        },
+                        "set_priority": {"priority": 100},
+                    }
+                },
+                "warm": {
+                    "min_age": "1d",
+                    "actions": {"set_priority": {"priority": 50}},
+                },
+                "delete": {
+                    "min_age": f"{retention_days}d",
+                    "actions": {"delete": {}},
+                },
+            },
+        }
+    }
+
+
+def put_rollover_templates(specs, retention_days=DEFAULT_RETENTION_DAYS):
+    """Register the ILM policy and one index template per rollover alias.
+
+    Each template matches `<alias>-*`, carries the index's mapping and
+    points ILM at the alias. Returns True if everything was stored.
+    """
+    es_url = os.environ["ELASTIC_CLOUD_URL"]
+    resp = api_request(
+        "PUT",
+        f"{es_url}/_ilm/policy/{OPERATIONAL_ILM_POLICY}",
+        headers=es_headers(),
+        json=operational_ilm_policy(retention_days),
+    )
+    if not resp.ok:
+        print(f"  [FAILED] ILM policy {OPERATIONAL_ILM_POLICY}: {resp.status_code} — {resp.text[:200]}")
+        return False
+    print(f"  [applied] ILM policy {OPERATIONAL_ILM_POLICY} (rollover {ROLLOVER_MAX_AGE}, delete after {retention_days}d)")
+
+    ok = True
+    for _, name, mapping in specs:
+        if name not in ROLLOVER_INDICES:
+            continue
+        settings = {
+            **mapping.get("settings", {}),
+            "index.lifecycle.name": OPERATIONAL_ILM_POLICY,
+            "index.lifecycle.rollover_alias": name,
+        }
+        template = {
+            "index_patterns": [f"{name}-*"],
+            "priority": 200,
+            "template": {"settings": settings, "mappings": mapping.get("mappings", {})},
+            "_meta": {"managed_by": "security-mesh"},
+        }
+        resp = api_request("PUT", f"{es_url}/_index_template/security-mesh-{name}", headers=es_headers(), json=template)
+        if resp.ok:
+            print(f"  [applied] security-mesh-{name} ({name}-*)")
+        else:
+            print(f"  [FAILED] security-mesh-{name}: {resp.status_code} — {resp.text[:200]}")
+            ok = False
+    return ok
+
+
+def _migrate_to_rollover(name):
+    """Move a plain index behind a rollover alias of the same name.
+
+    Copies it into <name>-000001 (which the rollover template maps), checks
+    the document counts match, then atomically deletes the old index and
+    points the alias at the copy. Documents written between the copy and
+    the swap are lost, so run this while the monitors are idle.
+    Returns (outcome, lines).
+    """
+    es_url = os.environ["ELASTIC_CLOUD_URL"]
+    first = f"{name}-000001"
+    outcome, message = _put_index(first, {})
+    if outcome == "failed":
+        return "failed", [message]
+    resp = api_request(
+        "POST",
+        f"{es_url}/_reindex",
+        headers=es_headers(),
+        params={"wait_for_completion": "true", "refresh": "true"},
+        json={"source": {"index": name}, "dest": {"index": first, "op_type": "create"}, "conflicts": "proceed"},
+    )
+    if not resp.ok:
+        return "failed", [f"[FAILED] reindex {name} → {first}: {resp.status_code} — {resp.text[:200]}"]
+
+    counts = []
+    for index in (name, first):
+        count_resp = api_request("GET", f"{es_url}/{index}/_count", headers=es_headers())
+        counts.append(count_resp.json().get("count") if count_resp.ok else None)
+    if counts[0] is None or counts[0] != counts[1]:
+        return "failed", [f"[FAILED] {name}: copied {counts[1]} of {counts[0]} documents into {first} — left unchanged"]
+
+    resp = api_request(
+        "POST",
+        f"{es_url}/_aliases",
+        headers=es_headers(),
+        json={"actions": [
+            {"remove_index": {"index": name}},
+            {"add": {"index": first, "alias": name, "is_write_index": True}},
+        ]},
+    )
+    if not resp.ok:
+        return "failed", [f"[FAILED] alias swap for {name}: {resp.status_code} — {resp.text[:200]}"]
+    return "created", [f"[migrated] {name} → {first} ({counts[1]} docs, write alias {name})"]
+
+
+def _provision_rollover(name, state):
+    """Bootstrap or migrate one rollover alias. Returns (outcome, lines)."""
+    if state is None:
+        first = f"{name}-000001"
+        outcome, message = _put_index(first, {"aliases": {name: {"is_write_index": True}}})
+        if outcome == "created":
+            message = f"[created] {first} (write alias {name})"
+        return outcome, [message]
+    if state["alias"]:
+        return "exists", [f"[skip] {name} already a rollover alias"]
+    return _migrate_to_rollover(name)
+
+
+def create_all_indices(concurrency=1, rollover=False, retention_days=DEFAULT_RETENTION_DAYS):
+    """Provision every mesh index.
+
+    Registers the kb-* index template, resolves which indices exist with a
+    single request, creates the missing ones on up to `concurrency`
+    workers, and reports mapping drift on the existing ones (fields missing
+    or typed differently from the mapping functions above). Top-level
+    fields added to a mapping since the index was created are added in
+    place with PUT _mapping; other drift (type changes) is only reported,
+    since it needs a reindex.
+
+    With rollover, ROLLOVER_INDICES are provisioned as ILM-managed rollover
+    aliases (bootstrapped, or migrated from an existing plain index) so
+    monitor queries only ever scan the retention window.
+    """
+    print("=== Creating Indices ===\n")
+
+    specs = index_specs()
+
+    print("Index templates:")
+    kb_template = put_index_templates()
+    if rollover and not put_rollover_templates(specs, retention_days):
+        print("  [WARN] Rollover layout not provisioned — falling back to plain indices")
+        rollover = False
+
+    print("\nIngest pipelines:")
+    put_ingest_pipelines()
+
+    existing = resolve_existing_indices([name for _, name, _ in specs])
+
+    def provision(spec):
+        section, name, mapping = spec
+        state = existing.get(name) if existing is not None else None
+        if rollover and name in ROLLOVER_INDICES:
+            outcome, lines = _provision_rollover(name, state)
+            if outcome != "exists":
+                return outcome, lines, 0
+        elif state is None:
+            body = {} if kb_template and name.startswith("kb-") else mapping
+            outcome, message = _put_index(name, body)
+            return outcome, [message], 0
+        else:
+            lines = [f"[skip] {name} already exists"]
+        added, message = add_missing_fields(name, mapping.get("mappings", {}), state["mappings"])
+        if message:
+            lines.append(f"  {message}")
+        drift = [d for d in mapping_drift(mapping.get("mappings", {}), state["mappings"]) if d.split(":")[0] not in added]
+        return "exists", lines + [f"  [drift] {d}" for d in drift], len(drift)
+
+    counts = {"created": 0, "exists": 0, "failed": 0}
+    drifted = 0
+    current_section = None
+    for (section, _, _), (outcome, lines, drift_count) in zip(specs, run_parallel(provision, specs, concurrency)):
+        if section != current_section:
+            print(f"\n{section}:")
+            current_section = section
+        for line in lines:
+            print(f"  {line}")
+        counts[outcome] += 1
+        drifted += bool(drift_count)
+
+    print(f"\n  Total: {counts['created']} created, {counts['exists']} existing, {counts['failed']} failed")
+    if drifted:
+        print(f"  [WARN] {drifted} existing index(es) differ from the repo mappings (see [drift] above)")
+
+    print("\nTransforms:")
+    put_transforms()
+    print()
+
+
+# Statuses --redrive-dispatches returns to the queue: dead-lettered
+# dispatches, and "failed" ones written before retries existed.
+REDRIVE_STATUSES = ("dead_letter", "failed")
+
+
+def redrive_dispatches(target_agent=None, case_id=None):
+    """Put dead-lettered dispatches back in the queue with a single _update_by_query.
 
+    attempts, next_attempt_at and any lease are cleared, so each dispatch
+    gets the full retry budget again; last_error is kept for reference.
+    Optionally limited to one target agent and/or case. Returns the number
+    of dispatches re-queued.
+    """
+    print("=== Re-driving Dead-lettered Dispatches ===\n")
+    filters = [{"terms": {"status": list(REDRIVE_STATUSES)}}]
+    if target_agent:
+        filters.append({"term": {"target_agent": target_agent}})
+    if case_id:
+        filters.append({"term": {"case_id": case_id}})
+    script = (
+        "ctx._source.status = 'pending'; ctx._source.attempts = 0; ctx._source.redriven_at = params.now; "
+        "for (f in ['next_attempt_at', 'lease_owner', 'lease_expires_at', 'dead_lettered_at', 'completed_at']) "
+        "{ ctx._source.remove(f); }"
+    )
+    resp = api_request(
+        "POST",
+        f"{os.environ['ELASTIC_CLOUD_URL']}/dispatch-requests/_update_by_query",
+        headers=es_headers(),
+        params={"conflicts": "proceed", "refresh": "true"},
+        json={
+            "query": {"bool": {"filter": filters}},
+            "script": {
+                "source": script,
+                "params": {"now": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")},
+            },
+        },
+    )
+    if not resp.ok:
+        print(f"  [FAILED] {resp.status_code} — {resp.text[:200]}\n")
+        return 0
+    result = resp.json()
+    updated = result.get("updated", 0)
+    print(f"  [requeued] {updated} dispatch(es)")
+    if result.get("version_conflicts"):
+        print(f"  [skip] {result['version_conflicts']} changed while re-driving (left as they were)")
+    for failure in result.get("failures", [])[:5]:
+        print(f"  [FAILED] {failure.get('id')}: {failure.get('cause', {}).get('reason', failure)}")
     print()
+    return updated
+
+
+def print_cache_stats():
+    """Print enrichment-cache entries, hits and misses per source and IOC type.
+
+    A hit is a lookup answered from a fresh entry, including lookups that
+    waited for a concurrent fetch of the same IOC; hits are summed from the
+    hit_counter documents (and any hit_count left on older entries). A miss
+    is a paid call to the provider. Returns the overall hit rate as a fraction, or None if
+    the cache has not been used yet.
+    """
+    print("=== Enrichment Cache ===\n")
+    resp = api_request(
+        "POST",
+        f"{os.environ['ELASTIC_CLOUD_URL']}/{ENRICHMENT_CACHE_INDEX}/_search",
+        headers=es_headers(),
+        json={
+            "size": 0,
+            "aggs": {"by_source": {
+                "multi_terms": {"terms": [{"field": "source"}, {"field": "ioc_type"}], "size": 50},
+                "aggs": {
+                    "hits": {"sum": {"field": "hit_count"}},
+                    "misses": {"sum": {"field": "miss_count"}},
+                    "entries": {"filter": {"bool": {"must_not": [{"term": {"kind": "hit_counter"}}]}}},
+                    "fresh": {"filter": {"range": {"expires_at": {"gt": "now"}}}},
+                },
+            }},
+        },
+    )
+    if not resp.ok:
+        print(f"  [FAILED] {resp.status_code} — {resp.text[:200]}\n")
+        return None
+    total_hits = total_misses = 0
+    for bucket in resp.json().get("aggregations", {}).get("by_source", {}).get("buckets", []):
+        hits = int(bucket["hits"]["value"])
+        misses = int(bucket["misses"]["value"])
+        total_hits += hits
+        total_misses += misses
+        rate = f"{hits / (hits + misses):.0%}" if hits + misses else "—"
+        print(f"  [{bucket['key_as_string'].replace('|', ' ')}] {bucket['entries']['doc_count']} entries "
+              f"({bucket['fresh']['doc_count']} fresh), {hits} hits, {misses} misses, hit rate {rate}")
+    if not total_hits + total_misses:
+        print("  No cached lookups yet.\n")
+        return None
+    rate = total_hits / (total_hits + total_misses)
+    print(f"\n  Total: {total_hits} hits, {total_misses} misses, hit rate {rate:.0%}\n")
+    return rate
 
 
 def seed_action_policies():
@@ -482,6 +1632,8 @@ def seed_action_policies():
             "requires_approval": True,
             "approval_channel": "cases",
             "ttl_minutes": 60,
+            "max_targets": 100,
+            "max_hosts_per_action": 25,
             "description": "Bulk operations affecting multiple hosts or rules",
         },
     ]
@@ -493,11 +1645,11 @@ def seed_action_policies():
         bulk_body += json.dumps({"index": {"_id": doc_id}}) + "\n"
         bulk_body += json.dumps(policy) + "\n"
 
-    resp = requests.post(
+    resp = api_request(
+        "POST",
         url,
         headers={**es_headers(), "Content-Type": "application/x-ndjson"},
         data=bulk_body,
-        timeout=30,
     )
     if resp.ok:
         result = resp.json()
@@ -517,16 +1669,11 @@ def seed_operational_knowledge():
 
     These documents teach agents to recognise known false positive patterns,
     operational artifacts, and baseline behaviours that would otherwise trigger
-    alert spirals or misclassification.
+    alert spirals or misclassification. They are written in a single _bulk
+    request.
     """
     print("=== Seeding Operational Knowledge ===\n")
 
-    es_url = os.environ.get("ELASTIC_CLOUD_URL", "").strip()
-    api_key = os.environ.get("ES_API_KEY", "").strip()
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"ApiKey {api_key}",
-    }
     now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
     documents = [
@@ -672,31 +1819,641 @@ def seed_operational_knowledge():
         },
     ]
 
-    for doc in documents:
-        url = f"{es_url}/{doc['index']}/_doc/{doc['id']}"
-        resp = requests.put(url, headers=headers, json=doc["body"])
-        if resp.status_code in (200, 201):
-            result = resp.json().get("result", "unknown")
-            print(f"  [OK] {doc['index']}/{doc['id']} ({result})")
-        else:
-            print(f"  [FAILED] {doc['index']}/{doc['id']}: {resp.status_code} — {resp.text[:200]}")
+    bulk_ingest(
+        ((doc["index"], doc["id"], doc["body"]) for doc in documents),
+        report_items=True,
+    )
 
     print()
 
 
-def build_replacements():
-    """Build the token → value map for injecting secrets into workflow YAML."""
-    return {
-        "__ES_URL__": os.environ.get("ELASTIC_CLOUD_URL", "").strip(),
-        "__ES_API_KEY__": os.environ.get("ES_API_KEY", "").strip(),
-        "__KIBANA_URL__": os.environ.get("KIBANA_URL", "").strip(),
-        "__KIBANA_API_KEY__": os.environ.get("KIBANA_API_KEY", "").strip(),
-        "__KIBANA_SPACE__": os.environ.get("KIBANA_SPACE", "default").strip(),
-        "__VT_API_KEY__": os.environ.get("VIRUSTOTAL_API_KEY", "").strip(),
-        "__ABUSEIPDB_API_KEY__": os.environ.get("ABUSEIPDB_API_KEY", "").strip(),
-        "__LLM_CONNECTOR_ID__": os.environ.get("LLM_CONNECTOR_ID", "").strip(),
-    }
-
+# ---------------------------------------------------------------------------
+# Knowledge loading: streaming JSON/JSONL/STIX files into kb-* via _bulk
+# ---------------------------------------------------------------------------
+
+KNOWLEDGE_FILE_SUFFIXES = (".json", ".jsonl", ".ndjson")
+JSON_READ_CHUNK = 64 * 1024
+BULK_MAX_BYTES = 5 * 1024 * 1024
+BULK_MAX_DOCS = 1000
+BULK_ITEM_MAX_RETRIES = 3
+BULK_RETRY_STATUS_CODES = (408, 429, 502, 503, 504)
+BULK_BACKPRESSURE_ERRORS = ("es_rejected_execution_exception", "circuit_breaking_exception")
+BULK_MIN_DOCS = 10
+SEMANTIC_BULK_START_DOCS = 50
+BULK_TARGET_LATENCY = 10.0
+BULK_CONCURRENCY_STEP_AFTER = 3
+STIX_DEFAULT_INDEX = "kb-mitre-attack"
+
+# STIX object type → knowledge base category. Other types (relationships,
+# identities, marking definitions, matrices) are skipped.
+STIX_KNOWLEDGE_TYPES = {
+    "attack-pattern": "technique",
+    "x-mitre-tactic": "tactic",
+    "intrusion-set": "group",
+    "campaign": "campaign",
+    "malware": "software",
+    "tool": "software",
+    "course-of-action": "mitigation",
+    "x-mitre-data-source": "data-source",
+}
+
+
+class _JsonStream:
+    """Incremental reader for one JSON document in a text file.
+
+    Holds at most the unread part of the current JSON_READ_CHUNK window plus
+    the value being decoded, so a multi-GB array or STIX bundle can be
+    walked element by element.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        chunk = self.f.read(JSON_READ_CHUNK)
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        if not chunk:
+            self.eof = True
+
+    def peek(self):
+        """Return the next non-whitespace character ("" at end of file)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos + 1]
+            self._fill()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"expected {char!r} at offset {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self._fill()
+                continue
+            # A number at the very end of the buffer may continue in the next chunk.
+            if end == len(self.buf) and not self.eof:
+                self._fill()
+                continue
+            self.pos = end
+            return obj
+
+    def array(self):
+        """Yield the elements of the JSON array starting at the cursor."""
+        self.expect("[")
+        while True:
+            char = self.peek()
+            if char == "]":
+                self.pos += 1
+                return
+            if char == ",":
+                self.pos += 1
+                continue
+            if not char:
+                raise ValueError("unterminated array")
+            yield self.value()
+
+
+def _iter_json_file(f):
+    """Yield records from a .json file without loading it whole.
+
+    A top-level array yields its elements; an object with an `objects`
+    array (a STIX bundle) yields those objects; any other object is yielded
+    as a single record.
+    """
+    stream = _JsonStream(f)
+    first = stream.peek()
+    if first == "[":
+        yield from stream.array()
+        return
+    if first != "{":
+        raise ValueError("expected a JSON array or object")
+    stream.expect("{")
+    record = {}
+    is_bundle = False
+    while True:
+        char = stream.peek()
+        if char == "}":
+            break
+        if char == ",":
+            stream.pos += 1
+            continue
+        key = stream.value()
+        stream.expect(":")
+        if key == "objects" and stream.peek() == "[":
+            is_bundle = True
+            yield from stream.array()
+        else:
+            record[key] = stream.value()
+    if not is_bundle:
+        yield record
+
+
+def iter_knowledge_files(path):
+    """Yield knowledge source files under path (a file or a directory)."""
+    path = Path(path)
+    if path.is_file():
+        yield path
+        return
+    for file_path in sorted(path.rglob("*")):
+        if file_path.is_file() and file_path.suffix.lower() in KNOWLEDGE_FILE_SUFFIXES:
+            yield file_path
+
+
+def iter_knowledge_records(path):
+    """Yield (source, record) for every record in the knowledge files under path.
+
+    .jsonl/.ndjson files are read line by line; .json files are streamed
+    with _iter_json_file(). Unparseable lines and files are reported and
+    skipped.
+    """
+    for file_path in iter_knowledge_files(path):
+        print(f"  Reading {file_path}")
+        with open(file_path, encoding="utf-8") as f:
+            if file_path.suffix.lower() in (".jsonl", ".ndjson"):
+                for line_no, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        yield f"{file_path.name}:{line_no}", json.loads(line)
+                    except json.JSONDecodeError as exc:
+                        print(f"    [WARN] {file_path.name}:{line_no}: {exc}")
+                continue
+            try:
+                for n, record in enumerate(_iter_json_file(f), 1):
+                    yield f"{file_path.name}#{n}", record
+            except ValueError as exc:
+                print(f"    [WARN] {file_path.name}: {exc} — rest of file skipped")
+
+
+def _stix_external_id(obj):
+    for ref in obj.get("external_references", []):
+        if ref.get("source_name") in ("mitre-attack", "mitre-mobile-attack", "mitre-ics-attack") and ref.get("external_id"):
+            return ref["external_id"], ref.get("url", "")
+    return "", ""
+
+
+def stix_to_knowledge(obj, now):
+    """Convert a STIX 2.x object to a (doc_id, knowledge document) pair.
+
+    Returns None for object types outside STIX_KNOWLEDGE_TYPES and for
+    revoked or deprecated objects.
+    """
+    category = STIX_KNOWLEDGE_TYPES.get(obj.get("type"))
+    if not category or obj.get("revoked") or obj.get("x_mitre_deprecated"):
+        return None
+    external_id, url = _stix_external_id(obj)
+    name = obj.get("name", "")
+    description = obj.get("description", "")
+    tactics = [p["phase_name"] for p in obj.get("kill_chain_phases", []) if p.get("phase_name")]
+    platforms = obj.get("x_mitre_platforms", [])
+    title = f"{external_id}: {name}" if external_id else name
+    summary = f"MITRE ATT&CK {category} {title}."
+    if tactics:
+        summary += f" Tactics: {', '.join(tactics)}."
+    if description:
+        summary += f" {description}"
+    doc = {
+        "title": title,
+        "content": description,
+        "semantic_summary": summary,
+        "category": category,
+        "source": "mitre-attack",
+        "tags": sorted(set(tactics + platforms + ([external_id] if external_id else []))),
+        "created_at": obj.get("created", now),
+        "updated_at": obj.get("modified", now),
+        "metadata": {
+            "external_id": external_id,
+            "stix_id": obj.get("id", ""),
+            "stix_type": obj.get("type", ""),
+            "tactics": tactics,
+            "platforms": platforms,
+            "is_subtechnique": bool(obj.get("x_mitre_is_subtechnique", False)),
+            "url": url,
+        },
+    }
+    return external_id or obj.get("id"), doc
+
+
+def knowledge_action(record, default_index, now):
+    """Resolve one source record to (index, doc_id, document), or None to skip.
+
+    Records may be STIX objects, {"index", "id", "body"} envelopes (the
+    seed_operational_knowledge() shape) or plain knowledge documents with
+    optional `_index`/`_id` keys. The index is taken from the record, then
+    default_index, then (for STIX) STIX_DEFAULT_INDEX.
+    """
+    if not isinstance(record, dict):
+        return None
+    stix_type = record.get("type")
+    if isinstance(stix_type, str) and str(record.get("id", "")).startswith(f"{stix_type}--"):
+        converted = stix_to_knowledge(record, now)
+        if converted is None:
+            return None
+        doc_id, doc = converted
+        return default_index or STIX_DEFAULT_INDEX, doc_id, doc
+    if isinstance(record.get("body"), dict):
+        doc = dict(record["body"])
+        index = record.get("index") or default_index
+        doc_id = record.get("id")
+    else:
+        doc = dict(record)
+        index = doc.pop("_index", None) or default_index
+        doc_id = doc.pop("_id", None)
+    doc.setdefault("created_at", now)
+    doc.setdefault("updated_at", now)
+    return index, doc_id, doc
+
+
+class BulkController:
+    """Adapts _bulk chunk size and concurrency to how fast the cluster ingests.
+
+    semantic_text fields run inference on the ML node for every document,
+    so ingest speed is bounded by its inference queue rather than by
+    Elasticsearch. After each chunk the controller:
+      - halves the docs per chunk and the concurrency when the chunk was
+        throttled (429, es_rejected_execution_exception, inference timeouts);
+      - shrinks the docs per chunk when it took longer than target_latency;
+      - otherwise grows the docs per chunk by a quarter and, after a run of
+        fast chunks, allows one more concurrent request.
+    Workers call acquire()/release() around each request so the in-flight
+    count never exceeds the current limit.
+    """
+
+    def __init__(self, max_docs, max_concurrency, target_latency=None):
+        self.max_docs = max_docs
+        self.max_concurrency = max(1, max_concurrency)
+        self.target_latency = target_latency or BULK_TARGET_LATENCY
+        self.docs = max_docs
+        self.concurrency = self.max_concurrency
+        self.in_flight = 0
+        self.fast_streak = 0
+        self.semantic = False
+        self.latencies = []
+        self.throttled = 0
+        self.cond = threading.Condition()
+
+    def use_semantic_start(self):
+        """Restart from a small chunk and half concurrency for inference-bound indices."""
+        with self.cond:
+            if self.semantic:
+                return
+            self.semantic = True
+            self.docs = min(self.docs, SEMANTIC_BULK_START_DOCS)
+            self.concurrency = max(1, self.max_concurrency // 2)
+
+    def chunk_docs(self):
+        with self.cond:
+            return self.docs
+
+    def acquire(self):
+        with self.cond:
+            while self.in_flight >= self.concurrency:
+                self.cond.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    def record(self, docs, latency, throttled):
+        with self.cond:
+            self.latencies.append(latency)
+            if throttled:
+                self.throttled += 1
+                self.fast_streak = 0
+                self.docs = max(BULK_MIN_DOCS, self.docs // 2)
+                self.concurrency = max(1, self.concurrency // 2)
+            elif latency > self.target_latency:
+                self.fast_streak = 0
+                self.docs = max(BULK_MIN_DOCS, int(self.docs * 0.75))
+            elif docs >= self.docs // 2:
+                # Only full-ish chunks are evidence the current size is fine.
+                self.docs = min(self.max_docs, max(self.docs + 1, int(self.docs * 1.25)))
+                self.fast_streak += 1
+                if self.fast_streak >= BULK_CONCURRENCY_STEP_AFTER and self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+                    self.fast_streak = 0
+            self.cond.notify_all()
+
+    def p95_latency(self):
+        with self.cond:
+            if not self.latencies:
+                return 0.0
+            ordered = sorted(self.latencies)
+            return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+
+def index_has_semantic_text(index):
+    """Return True if the index mapping contains a semantic_text field."""
+    resp = api_request("GET", f"{os.environ['ELASTIC_CLOUD_URL']}/{index}/_mapping", headers=es_headers())
+    if not resp.ok:
+        return False
+
+    def walk(properties):
+        for field in properties.values():
+            if field.get("type") == "semantic_text":
+                return True
+            if walk(field.get("properties", {})) or walk(field.get("fields", {})):
+                return True
+        return False
+
+    return any(walk(body.get("mappings", {}).get("properties", {})) for body in resp.json().values())
+
+
+def iter_bulk_chunks(actions, max_bytes=None, max_docs=None):
+    """Group (index, doc_id, document) actions into _bulk chunks.
+
+    Each chunk is a list of (index, doc_id, ndjson_bytes) items whose
+    combined size stays under max_bytes (a single oversized document still
+    gets a chunk of its own) and whose length stays under max_docs.
+    max_docs may be a callable, read once per chunk, so a BulkController
+    can resize chunks while the source is being streamed.
+    """
+    max_bytes = max_bytes or BULK_MAX_BYTES
+    docs_limit = max_docs if callable(max_docs) else (lambda: max_docs or BULK_MAX_DOCS)
+    chunk = []
+    size = 0
+    limit = 0
+    for index, doc_id, doc in actions:
+        meta = {"_index": index}
+        if doc_id:
+            meta["_id"] = str(doc_id)
+        payload = (json.dumps({"index": meta}) + "\n" + json.dumps(doc) + "\n").encode("utf-8")
+        if chunk and (size + len(payload) > max_bytes or len(chunk) >= limit):
+            yield chunk
+            chunk = []
+            size = 0
+        if not chunk:
+            limit = docs_limit()
+        chunk.append((index, doc_id, payload))
+        size += len(payload)
+    if chunk:
+        yield chunk
+
+
+def _is_backpressure(status, error):
+    """True for item errors that mean "slow down" rather than "bad document"."""
+    error_type = error.get("type", "")
+    reason = str(error.get("reason", "")).lower()
+    caused_by = error.get("caused_by") or {}
+    return (
+        status in BULK_RETRY_STATUS_CODES
+        or error_type in BULK_BACKPRESSURE_ERRORS
+        or caused_by.get("type") in BULK_BACKPRESSURE_ERRORS
+        or (error_type in ("inference_exception", "status_exception") and ("timed out" in reason or "timeout" in reason))
+    )
+
+
+def _post_bulk(items, controller=None):
+    """POST one _bulk request. Returns (results, failures, retry) for its items."""
+    url = f"{os.environ['ELASTIC_CLOUD_URL']}/_bulk"
+    headers = {**es_headers(), "Content-Type": "application/x-ndjson"}
+    results = []
+    failures = []
+    retry = []
+    if controller:
+        controller.acquire()
+    sent_at = time.monotonic()
+    try:
+        resp = api_request("POST", url, headers=headers, data=b"".join(item[2] for item in items))
+    except requests.RequestException as exc:
+        resp = None
+        retry = [(item, f"transport error: {exc}") for item in items]
+    finally:
+        if controller:
+            controller.release()
+    latency = time.monotonic() - sent_at
+    if resp is not None and resp.ok:
+        for item, outcome in zip(items, resp.json().get("items", [])):
+            status_info = next(iter(outcome.values()), {})
+            status = status_info.get("status", 0)
+            if "error" not in status_info:
+                results.append((item[0], item[1], status_info.get("result", "unknown")))
+                continue
+            error = status_info["error"]
+            reason = f"{status} {error.get('type', '')}: {error.get('reason', '')}"[:300]
+            if _is_backpressure(status, error):
+                retry.append((item, reason))
+            else:
+                failures.append((item[0], item[1], reason))
+    elif resp is not None:
+        reason = f"{resp.status_code}: {resp.text[:200]}"
+        if resp.status_code in BULK_RETRY_STATUS_CODES:
+            retry = [(item, reason) for item in items]
+        else:
+            failures = [(item[0], item[1], reason) for item in items]
+    if controller:
+        controller.record(len(items), latency, bool(retry))
+    return results, failures, retry
+
+
+def send_bulk_chunk(chunk, controller=None):
+    """Send one chunk to _bulk, resending only the items that failed transiently.
+
+    Items rejected with backpressure (429, 5xx, es_rejected_execution_exception,
+    inference timeouts) are resent with jittered backoff up to
+    BULK_ITEM_MAX_RETRIES times, split into requests no larger than the
+    controller's current chunk size; a whole-request failure counts as every
+    item failing. Each request's latency and backpressure are reported to
+    controller, which also bounds how many requests are in flight. Returns
+    (results, failures, elapsed) where results is a list of
+    (index, doc_id, result) and failures a list of (index, doc_id, reason).
+    """
+    results = []
+    failures = []
+    pending = chunk
+    started = time.monotonic()
+    for attempt in range(BULK_ITEM_MAX_RETRIES + 1):
+        step = controller.chunk_docs() if controller and attempt else len(pending)
+        retry = []
+        for start in range(0, len(pending), max(1, step)):
+            ok, failed, again = _post_bulk(pending[start:start + step], controller)
+            results.extend(ok)
+            failures.extend(failed)
+            retry.extend(again)
+        if not retry:
+            break
+        if attempt == BULK_ITEM_MAX_RETRIES:
+            failures.extend((item[0], item[1], reason) for item, reason in retry)
+            break
+        RATE_LIMITER.on_throttle(_backoff_delay(attempt))
+        pending = [item for item, _ in retry]
+    return results, failures, time.monotonic() - started
+
+
+def _bulk_meta(index, doc_id, body):
+    meta = {"_index": index, "_id": doc_id}
+    if body.get("seq_no") is not None:
+        meta["if_seq_no"] = body["seq_no"]
+        meta["if_primary_term"] = body["primary_term"]
+    return meta
+
+
+def bulk_write(lines):
+    """Send (index, doc_id, action, body) lines as one _bulk batch.
+
+    body["source"] is the action's document (or update body); body["seq_no"]
+    and body["primary_term"], when set, make the action conditional.
+    Returns ({doc_id: result}, {doc_id: reason}). Transient item failures
+    are resent by send_bulk_chunk; a 409 comes back as a failure.
+    """
+    items = []
+    for index, doc_id, action, body in lines:
+        payload = (json.dumps({action: _bulk_meta(index, doc_id, body)}) + "\n"
+                   + json.dumps(body["source"]) + "\n").encode("utf-8")
+        items.append((index, doc_id, payload))
+    if not items:
+        return {}, {}
+    results, failures, _ = send_bulk_chunk(items)
+    return ({doc_id: result for _, doc_id, result in results},
+            {doc_id: reason for _, doc_id, reason in failures})
+
+
+def bulk_ingest(actions, concurrency=1, max_bytes=None, max_docs=None, report_items=False, controller=None):
+    """Stream actions into Elasticsearch through concurrent, adaptive _bulk requests.
+
+    actions is any iterable of (index, doc_id, document) — typically a
+    generator — consumed lazily, so only the chunks in flight are held in
+    memory. A BulkController (created here unless the caller passes one)
+    sizes each chunk and caps in-flight requests. Prints per-chunk progress
+    with running throughput (or one line per document when report_items is
+    set) and returns {"indexed", "failed", "bytes", "seconds",
+    "p95_latency", "throttled"}.
+    """
+    controller = controller or BulkController(max_docs or BULK_MAX_DOCS, concurrency)
+    stats = {"indexed": 0, "failed": 0, "bytes": 0, "seconds": 0.0}
+    started = time.monotonic()
+    max_failure_lines = 20
+    failure_lines = 0
+
+    def send(chunk):
+        return chunk, send_bulk_chunk(chunk, controller)
+
+    chunks = iter_bulk_chunks(actions, max_bytes, controller.chunk_docs)
+    for chunk, (results, failures, elapsed) in run_parallel(send, chunks, concurrency):
+        chunk_bytes = sum(len(item[2]) for item in chunk)
+        stats["indexed"] += len(results)
+        stats["failed"] += len(failures)
+        stats["bytes"] += chunk_bytes
+        total_elapsed = max(time.monotonic() - started, 1e-6)
+        if report_items:
+            for index, doc_id, result in results:
+                print(f"  [OK] {index}/{doc_id} ({result})")
+        else:
+            print(
+                f"  [bulk] {len(chunk)} docs, {chunk_bytes / 1048576:.1f} MB in {elapsed:.1f}s — "
+                f"{stats['indexed']} indexed, {stats['indexed'] / total_elapsed:.0f} docs/s "
+                f"(next: {controller.docs} docs × {controller.concurrency})"
+            )
+        for index, doc_id, reason in failures:
+            if failure_lines < max_failure_lines:
+                print(f"  [FAILED] {index}/{doc_id or '(auto id)'}: {reason}")
+            failure_lines += 1
+    if failure_lines > max_failure_lines:
+        print(f"  ... {failure_lines - max_failure_lines} more failures not shown")
+    stats["seconds"] = time.monotonic() - started
+    stats["p95_latency"] = controller.p95_latency()
+    stats["throttled"] = controller.throttled
+    return stats
+
+
+def print_bulk_summary(stats, skipped=0):
+    seconds = max(stats["seconds"], 1e-6)
+    line = f"\n  Total: {stats['indexed']} indexed, {stats['failed']} failed"
+    if skipped:
+        line += f", {skipped} skipped"
+    print(
+        f"{line} in {stats['seconds']:.1f}s ({stats['indexed'] / seconds:.0f} docs/s, "
+        f"{stats['bytes'] / 1048576 / seconds:.1f} MB/s, p95 bulk latency {stats['p95_latency']:.2f}s, "
+        f"{stats['throttled']} throttled)"
+    )
+
+
+def load_knowledge(path, default_index=None, concurrency=1, max_bytes=None):
+    """Bulk-load knowledge documents from JSON/JSONL/STIX files into kb-* indices.
+
+    Streams records from path (a file or directory), resolves each to a
+    knowledge base index with knowledge_action(), creates missing kb-*
+    indices on first use, and sends the documents through bulk_ingest().
+    Indices with semantic_text fields switch the BulkController to small
+    starting chunks, since each document costs an inference call.
+    Records targeting indices outside KNOWLEDGE_BASE_INDICES are skipped.
+    """
+    print("=== Loading Knowledge ===\n")
+
+    if not Path(path).exists():
+        print(f"  [FAILED] {path} does not exist\n")
+        return
+    if default_index and default_index not in KNOWLEDGE_BASE_INDICES:
+        print(f"  [FAILED] {default_index} is not a knowledge base index ({', '.join(KNOWLEDGE_BASE_INDICES)})\n")
+        return
+
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    ready_indices = set()
+    skipped = {"unsupported": 0, "no index": 0, "unknown index": 0}
+    controller = BulkController(BULK_MAX_DOCS, concurrency)
+
+    def actions():
+        for source, record in iter_knowledge_records(path):
+            action = knowledge_action(record, default_index, now)
+            if action is None:
+                skipped["unsupported"] += 1
+                continue
+            index = action[0]
+            if not index:
+                skipped["no index"] += 1
+                continue
+            if index not in KNOWLEDGE_BASE_INDICES:
+                if skipped["unknown index"] == 0:
+                    print(f"    [WARN] {source}: {index} is not a knowledge base index — skipping such records")
+                skipped["unknown index"] += 1
+                continue
+            if index not in ready_indices:
+                create_index(index, knowledge_base_mapping())
+                if index_has_semantic_text(index):
+                    controller.use_semantic_start()
+                ready_indices.add(index)
+            yield action
+
+    stats = bulk_ingest(actions(), concurrency, max_bytes, controller=controller)
+    skipped_total = sum(skipped.values())
+    print_bulk_summary(stats, skipped_total)
+    if skipped_total:
+        print("  Skipped: " + ", ".join(f"{n} {reason}" for reason, n in skipped.items() if n))
+    print()
+
+
+def build_replacements():
+    """Build the token → value map for injecting secrets into workflow YAML."""
+    return {
+        "__ES_URL__": os.environ.get("ELASTIC_CLOUD_URL", "").strip(),
+        "__ES_API_KEY__": os.environ.get("ES_API_KEY", "").strip(),
+        "__KIBANA_URL__": os.environ.get("KIBANA_URL", "").strip(),
+        "__KIBANA_API_KEY__": os.environ.get("KIBANA_API_KEY", "").strip(),
+        "__KIBANA_SPACE__": os.environ.get("KIBANA_SPACE", "default").strip(),
+        "__VT_API_KEY__": os.environ.get("VIRUSTOTAL_API_KEY", "").strip(),
+        "__ABUSEIPDB_API_KEY__": os.environ.get("ABUSEIPDB_API_KEY", "").strip(),
+        "__LLM_CONNECTOR_ID__": os.environ.get("LLM_CONNECTOR_ID", "").strip(),
+        "__ROUTER_URL__": os.environ.get("ROUTER_URL", "").strip().rstrip("/"),
+        "__ROUTER_TOKEN__": os.environ.get("ROUTER_TOKEN", "").strip(),
+    }
+
 
 def apply_replacements(yaml_content, replacements):
     """Replace placeholder tokens in YAML content with real values."""
@@ -728,13 +2485,13 @@ def _get_deployed_workflow_names():
     return names
 
 
-def delete_workflows():
+def delete_workflows(concurrency=1):
     """Delete only mesh-deployed workflows from Kibana.
 
-    Builds the expected workflow name set from repo YAML files, then
-    deletes only matching workflows — leaving other workflows untouched.
-    Handles pagination by repeating the list+delete cycle until no
-    matching workflows remain.
+    Builds the expected workflow name set from repo YAML files, streams
+    every page of the workflow list once to collect matching IDs, then
+    deletes only those — leaving other workflows untouched. Deletes run on
+    up to `concurrency` workers.
     """
     print("=== Deleting Mesh Workflows ===\n")
 
@@ -748,66 +2505,205 @@ def delete_workflows():
     total_skipped = 0
     total_errors = 0
 
-    while True:
-        resp = requests.get(
-            f"{base_url}/api/workflows",
-            headers=headers,
-            timeout=30,
-        )
-
-        if not resp.ok:
-            print(f"  [FAILED] Could not list workflows: {resp.status_code}")
-            print(f"  {resp.text[:300]}")
-            return
-
-        workflows = resp.json()
-        if not isinstance(workflows, list):
-            workflows = workflows.get("data", workflows.get("items", []))
-
-        if not workflows:
-            break
-
-        deleted_this_round = 0
-        for wf in workflows:
+    # Collect first, delete after: deleting while paging would shift later
+    # pages and skip workflows.
+    targets = []
+    try:
+        for wf in iter_kibana_objects("/api/workflows"):
             wf_id = wf.get("id", "")
             wf_name = wf.get("name", wf_id)
             if not wf_id:
                 continue
-
             if wf_name not in our_names:
                 total_skipped += 1
                 continue
+            targets.append((wf_id, wf_name))
+    except requests.HTTPError as exc:
+        print(f"  [FAILED] Could not list workflows: {exc.response.status_code}")
+        print(f"  {exc.response.text[:300]}")
+        return
 
-            del_resp = requests.delete(
-                f"{base_url}/api/workflows/{wf_id}",
-                headers=headers,
-                timeout=15,
-            )
-            if del_resp.ok or del_resp.status_code == 204:
-                print(f"  [deleted] {wf_name}")
-                total_deleted += 1
-                deleted_this_round += 1
-            else:
-                print(f"  [FAILED] {wf_name}: {del_resp.status_code}")
-                total_errors += 1
-
-            time.sleep(0.1)
+    def delete_one(target):
+        wf_id, wf_name = target
+        del_resp = api_request(
+            "DELETE",
+            f"{base_url}/api/workflows/{wf_id}",
+            headers=headers,
+        )
+        return wf_name, del_resp
 
-        if deleted_this_round == 0:
-            break
+    for wf_name, del_resp in run_parallel(delete_one, targets, concurrency):
+        if del_resp.ok or del_resp.status_code == 204:
+            print(f"  [deleted] {wf_name}")
+            total_deleted += 1
+        else:
+            print(f"  [FAILED] {wf_name}: {del_resp.status_code}")
+            total_errors += 1
 
     print(f"\n  Deleted {total_deleted} mesh workflows, skipped {total_skipped} other workflows ({total_errors} errors)\n")
 
 
-def import_workflows():
+def _manifest_space():
+    return os.environ.get("KIBANA_SPACE", "").strip() or "default"
+
+
+def load_deploy_manifest():
+    """Load the workflow deploy manifest for the current Kibana space.
+
+    Returns {repo-relative path: manifest entry}, or None when the
+    deploy-manifest index does not exist yet.
+    """
+    url = f"{os.environ['ELASTIC_CLOUD_URL']}/{DEPLOY_MANIFEST_INDEX}/_search"
+    resp = api_request(
+        "POST",
+        url,
+        headers=es_headers(),
+        json={"size": 10000, "query": {"term": {"space": _manifest_space()}}},
+    )
+    if resp.status_code == 404:
+        return None
+    if not resp.ok:
+        print(f"  [WARN] Could not read deploy manifest: {resp.status_code} — full import")
+        return {}
+    hits = resp.json().get("hits", {}).get("hits", [])
+    return {hit["_source"]["path"]: hit["_source"] for hit in hits if hit.get("_source", {}).get("path")}
+
+
+def save_deploy_manifest(entries, removed_paths=()):
+    """Upsert manifest entries and drop entries for removed workflow files."""
+    space = _manifest_space()
+    bulk_body = ""
+    for entry in entries:
+        bulk_body += json.dumps({"index": {"_id": f"{space}:{entry['path']}"}}) + "\n"
+        bulk_body += json.dumps({**entry, "space": space}) + "\n"
+    for path in removed_paths:
+        bulk_body += json.dumps({"delete": {"_id": f"{space}:{path}"}}) + "\n"
+    if not bulk_body:
+        return
+
+    resp = api_request(
+        "POST",
+        f"{os.environ['ELASTIC_CLOUD_URL']}/{DEPLOY_MANIFEST_INDEX}/_bulk",
+        headers={**es_headers(), "Content-Type": "application/x-ndjson"},
+        data=bulk_body,
+    )
+    if not resp.ok:
+        print(f"  [WARN] Could not update deploy manifest: {resp.status_code} — {resp.text[:200]}")
+    elif resp.json().get("errors"):
+        print("  [WARN] Some deploy manifest entries failed to save; they will be redeployed next run")
+
+
+def load_workflow_files(replacements):
+    """Read every workflow under WORKFLOW_DIRS with placeholders applied.
+
+    Returns a list of dicts (dir, file, path, name, content, hash) in
+    deploy order, where path is repo-relative and hash is the SHA-256 of
+    the post-replacement YAML.
+    """
+    workflows = []
+    for workflow_dir in WORKFLOW_DIRS:
+        dir_path = REPO_ROOT / workflow_dir
+        if not dir_path.exists():
+            continue
+        for yaml_file in sorted(dir_path.glob("*.yaml")):
+            with open(yaml_file) as f:
+                yaml_content = apply_replacements(f.read(), replacements)
+            try:
+                name = (yaml.safe_load(yaml_content) or {}).get("name", yaml_file.stem)
+            except yaml.YAMLError:
+                name = yaml_file.stem
+            workflows.append({
+                "dir": workflow_dir,
+                "file": yaml_file,
+                "path": yaml_file.relative_to(REPO_ROOT).as_posix(),
+                "name": name,
+                "content": yaml_content,
+                "hash": hashlib.sha256(yaml_content.encode("utf-8")).hexdigest(),
+            })
+    return workflows
+
+
+def _manifest_entry(workflow, wf_id, name):
+    return {
+        "path": workflow["path"],
+        "workflow_id": wf_id,
+        "workflow_name": name,
+        "content_hash": workflow["hash"],
+        "deployed_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }
+
+
+def _import_workflow_file(yaml_file, yaml_content, known_id, base_url, headers):
+    """Create or update one workflow in Kibana.
+
+    When the manifest already knows the workflow ID the YAML is PUT straight
+    to it; otherwise (or if that ID has gone) it is POSTed, falling back to
+    PUT when Kibana reports it already exists.
+
+    Returns (outcome, name, workflow_id, message) where outcome is one of
+    "imported", "updated", "skipped" or "failed".
+    """
+    if known_id:
+        put_resp = api_request(
+            "PUT",
+            f"{base_url}/api/workflows/{known_id}",
+            headers=headers,
+            json={"yaml": yaml_content},
+        )
+        if put_resp.ok:
+            name = put_resp.json().get("name", yaml_file.stem)
+            return "updated", name, known_id, f"[updated] {name}"
+        if put_resp.status_code != 404:
+            return "failed", yaml_file.stem, "", f"[FAILED update] {yaml_file.name}: {put_resp.status_code}"
+
+    resp = api_request(
+        "POST",
+        f"{base_url}/api/workflows",
+        headers=headers,
+        json={"yaml": yaml_content},
+    )
+
+    if resp.ok:
+        data = resp.json()
+        name = data.get("name", yaml_file.stem)
+        return "imported", name, data.get("id", ""), f"[imported] {name}"
+
+    if resp.status_code == 409:
+        wf_id = resp.json().get("id", "")
+        if not wf_id:
+            return "skipped", yaml_file.stem, "", f"[skip] {yaml_file.name} (exists, no id returned)"
+        put_resp = api_request(
+            "PUT",
+            f"{base_url}/api/workflows/{wf_id}",
+            headers=headers,
+            json={"yaml": yaml_content},
+        )
+        if put_resp.ok:
+            name = put_resp.json().get("name", yaml_file.stem)
+            return "updated", name, wf_id, f"[updated] {name}"
+        return "failed", yaml_file.stem, "", f"[FAILED update] {yaml_file.name}: {put_resp.status_code}"
+
+    return "failed", yaml_file.stem, "", f"[FAILED] {yaml_file.name}: {resp.status_code}"
+
+
+def import_workflows(concurrency=1, force=False, prune=False):
     """Import all workflow YAML files into Kibana.
 
     For each file the script:
       1. Replaces placeholder tokens (__ES_URL__, __VT_API_KEY__, etc.)
          with real values from environment variables.
-      2. POSTs the YAML to create the workflow.
-      3. If the workflow already exists (409) it PUTs to update it instead,
-         so re-running the script always converges to the repo state.
+      2. Hashes the result and compares it with the deploy manifest
+         (the deploy-manifest index). Files whose hash matches and whose
+         workflow still exists in Kibana are skipped.
+      3. PUTs changed files to their known workflow ID, or POSTs new ones
+         (falling back to PUT on 409), so re-running the script always
+         converges to the repo state.
+
+    force ignores the manifest and redeploys every file. prune deletes
+    workflows whose source file has been removed from the repo.
+
+    Files are imported on up to `concurrency` workers; output is still
+    printed in directory order.
 
     Returns a dict mapping workflow_name → workflow_id for use by
     create_tools().
@@ -825,109 +2721,93 @@ def import_workflows():
         print(f"    {token}: {status}")
     print()
 
-    success = 0
-    updated = 0
-    failed = 0
-
-    for workflow_dir in WORKFLOW_DIRS:
-        dir_path = REPO_ROOT / workflow_dir
-        if not dir_path.exists():
-            continue
-
-        yaml_files = sorted(dir_path.glob("*.yaml"))
-        if not yaml_files:
-            continue
-
-        print(f"  {workflow_dir}/")
-        for yaml_file in yaml_files:
-            with open(yaml_file) as f:
-                yaml_content = f.read()
-
-            yaml_content = apply_replacements(yaml_content, replacements)
-
-            resp = requests.post(
-                f"{base_url}/api/workflows",
-                headers=headers,
-                json={"yaml": yaml_content},
-                timeout=30,
-            )
-
-            if resp.ok:
-                data = resp.json()
-                name = data.get("name", yaml_file.stem)
-                wf_id = data.get("id", "")
-                if wf_id:
-                    name_to_id[name] = wf_id
-                print(f"    [imported] {name}")
-                success += 1
-            elif resp.status_code == 409:
-                wf_id = resp.json().get("id", "")
-                if wf_id:
-                    put_resp = requests.put(
-                        f"{base_url}/api/workflows/{wf_id}",
-                        headers=headers,
-                        json={"yaml": yaml_content},
-                        timeout=30,
-                    )
-                    if put_resp.ok:
-                        name = put_resp.json().get("name", yaml_file.stem)
-                        name_to_id[name] = wf_id
-                        print(f"    [updated] {name}")
-                        updated += 1
-                    else:
-                        print(f"    [FAILED update] {yaml_file.name}: {put_resp.status_code}")
-                        failed += 1
-                else:
-                    print(f"    [skip] {yaml_file.name} (exists, no id returned)")
-                    updated += 1
+    manifest = load_deploy_manifest()
+    if manifest is None:
+        create_index(DEPLOY_MANIFEST_INDEX, deploy_manifest_mapping())
+        manifest = {}
+    if force:
+        print("  Deploy manifest ignored (--force-workflows)\n")
+    live_ids = set(fetch_existing_workflow_ids().values()) if manifest else set()
+
+    jobs = load_workflow_files(replacements)
+
+    def import_one(job):
+        entry = manifest.get(job["path"], {})
+        known_id = entry.get("workflow_id", "")
+        if not force and entry.get("content_hash") == job["hash"] and known_id in live_ids:
+            name = entry.get("workflow_name", job["file"].stem)
+            return job, ("unchanged", name, known_id, f"[unchanged] {name}")
+        return job, _import_workflow_file(job["file"], job["content"], known_id, base_url, headers)
+
+    manifest_updates = []
+    counts = {"imported": 0, "updated": 0, "unchanged": 0, "skipped": 0, "failed": 0}
+    current_dir = None
+    for job, (outcome, name, wf_id, message) in run_parallel(import_one, jobs, concurrency):
+        if job["dir"] != current_dir:
+            print(f"  {job['dir']}/")
+            current_dir = job["dir"]
+        print(f"    {message}")
+        counts[outcome] += 1
+        if wf_id:
+            name_to_id[name] = wf_id
+        if outcome in ("imported", "updated"):
+            manifest_updates.append(_manifest_entry(job, wf_id, name))
+
+    repo_paths = {job["path"] for job in jobs}
+    removed = sorted(path for path in manifest if path not in repo_paths)
+    pruned = []
+    if removed and prune:
+        print("\n  Pruning workflows removed from the repo:")
+        for path in removed:
+            wf_id = manifest[path].get("workflow_id", "")
+            del_resp = api_request("DELETE", f"{base_url}/api/workflows/{wf_id}", headers=headers)
+            if del_resp.ok or del_resp.status_code == 404:
+                print(f"    [pruned] {manifest[path].get('workflow_name', path)}")
+                pruned.append(path)
             else:
-                print(f"    [FAILED] {yaml_file.name}: {resp.status_code}")
-                failed += 1
-
-            time.sleep(0.3)
-
-    print(f"\n  Total: {success} imported, {updated} updated, {failed} failed")
+                print(f"    [FAILED prune] {path}: {del_resp.status_code}")
+    elif removed:
+        print(f"\n  {len(removed)} deployed workflow(s) no longer in the repo (re-run with --prune-workflows to delete):")
+        for path in removed:
+            print(f"    - {manifest[path].get('workflow_name', path)} ({path})")
+
+    save_deploy_manifest(manifest_updates, pruned)
+
+    success = counts["imported"]
+    updated = counts["updated"] + counts["skipped"]
+    unchanged = counts["unchanged"]
+    failed = counts["failed"]
+    print(f"\n  Total: {success} imported, {updated} updated, {unchanged} unchanged, {failed} failed")
     print(f"  Captured {len(name_to_id)} workflow name→ID mappings\n")
     return name_to_id
 
 
 def fetch_existing_workflow_ids():
     """Fetch name→ID mapping for already-imported workflows in Kibana."""
-    base_url = kibana_base_url()
-    headers = kibana_headers()
-    resp = requests.get(f"{base_url}/api/workflows", headers=headers, timeout=30)
-    if not resp.ok:
-        print(f"  [WARN] Could not list workflows: {resp.status_code}")
+    try:
+        return {
+            wf.get("name", ""): wf["id"]
+            for wf in iter_kibana_objects("/api/workflows")
+            if wf.get("id")
+        }
+    except requests.HTTPError as exc:
+        print(f"  [WARN] Could not list workflows: {exc.response.status_code}")
         return {}
-    workflows = resp.json()
-    if isinstance(workflows, dict):
-        workflows = workflows.get("data", workflows.get("items", []))
-    return {wf.get("name", ""): wf.get("id", "") for wf in workflows if wf.get("id")}
 
 
 def fetch_existing_tool_ids():
     """Fetch name→ID mapping for already-created tools in Agent Builder."""
-    base_url = kibana_base_url()
-    headers = kibana_headers()
-    resp = requests.get(f"{base_url}/api/agent_builder/tools", headers=headers, timeout=30)
-    if not resp.ok:
-        print(f"  [WARN] Could not list tools: {resp.status_code}")
+    try:
+        live_ids = {t["id"] for t in iter_kibana_objects("/api/agent_builder/tools") if t.get("id")}
+    except requests.HTTPError as exc:
+        print(f"  [WARN] Could not list tools: {exc.response.status_code}")
         return {}
-    tools = resp.json()
-    if isinstance(tools, dict):
-        tools = tools.get("data", tools.get("items", []))
-    id_to_desc = {}
-    for t in tools:
-        tid = t.get("id", "")
-        desc = t.get("description", "")
-        if tid:
-            id_to_desc[tid] = desc
     agent_defs = load_agent_definitions()
     name_to_id = {}
     for agent_def in agent_defs:
         for tool in agent_def.get("tools", []):
             expected_id = slugify(tool["name"])
-            if expected_id in id_to_desc:
+            if expected_id in live_ids:
                 name_to_id[tool["name"]] = expected_id
     return name_to_id
 
@@ -980,11 +2860,111 @@ def _resolve_workflow_id(tool_name, tool_def, workflow_name_to_id):
     return None
 
 
-def create_tools(workflow_name_to_id):
+def _tool_payload(tool_name, tool_def, wf_id=None):
+    """Build the Agent Builder create payload for an index_search or workflow tool."""
+    tool_id = slugify(tool_name)
+    if tool_def.get("type", "workflow") == "index_search":
+        index_name = tool_def.get("index", "")
+        return {
+            "id": tool_id,
+            "type": "index_search",
+            "name": tool_name,
+            "description": tool_def.get("description", f"Search {index_name}"),
+            "tags": ["security-mesh"],
+            "configuration": {
+                "index_pattern": index_name,
+                "max_rows": 10,
+            },
+        }
+    return {
+        "id": tool_id,
+        "type": "workflow",
+        "description": tool_def.get("description", ""),
+        "tags": ["security-mesh"],
+        "configuration": {
+            "workflow_id": wf_id,
+        },
+    }
+
+
+def _manual_tool_lines(tool_name, tool_def, resp):
+    tool_id = slugify(tool_name)
+    return [
+        f"[MANUAL]  {tool_name} — index_search tools require UI creation",
+        f"          API response: {resp.status_code} — {resp.text[:300]}",
+        f"          Create manually: Agent Builder > Tools > New tool",
+        f"          Type: Index Search | Index: {tool_def.get('index', '')} | ID: {tool_id}",
+    ]
+
+
+def _create_tool(tool_name, tool_def, workflow_name_to_id, base_url, headers):
+    """Create (or update) one Agent Builder tool.
+
+    Returns (outcome, tool_id, lines) where outcome is one of "builtin",
+    "created", "updated", "skipped" or "failed", tool_id is None when the
+    tool could not be resolved, and lines are the messages to print.
+    """
+    tool_id = slugify(tool_name)
+    tool_type = tool_def.get("type", "workflow")
+
+    if tool_type == "builtin":
+        builtin_id = tool_def.get("tool_id", "")
+        if builtin_id:
+            return "builtin", builtin_id, [f"[builtin] {tool_name} → {builtin_id}"]
+        return "builtin", None, []
+
+    if tool_type == "index_search":
+        resp = api_request(
+            "POST",
+            f"{base_url}/api/agent_builder/tools",
+            headers=headers,
+            json=_tool_payload(tool_name, tool_def),
+        )
+        if resp.ok:
+            return "created", tool_id, [f"[created] {tool_name} ({tool_id})"]
+        if resp.status_code in (400, 409) and "already exists" in resp.text:
+            return "skipped", tool_id, [f"[exists]  {tool_name} ({tool_id})"]
+        return "failed", None, _manual_tool_lines(tool_name, tool_def, resp)
+
+    wf_id = _resolve_workflow_id(tool_name, tool_def, workflow_name_to_id)
+    if not wf_id:
+        return "failed", None, [f"[SKIP] {tool_name} — no matching workflow ID found"]
+    payload = _tool_payload(tool_name, tool_def, wf_id)
+
+    resp = api_request(
+        "POST",
+        f"{base_url}/api/agent_builder/tools",
+        headers=headers,
+        json=payload,
+    )
+
+    if resp.ok:
+        return "created", tool_id, [f"[created] {tool_name} ({tool_id})"]
+    if resp.status_code in (400, 409) and "already exists" in resp.text:
+        put_resp = api_request(
+            "PUT",
+            f"{base_url}/api/agent_builder/tools/{tool_id}",
+            headers=headers,
+            json={k: v for k, v in payload.items() if k not in ("id", "type")},
+        )
+        if put_resp.ok:
+            return "updated", tool_id, [f"[updated] {tool_name} ({tool_id})"]
+        return "failed", None, [
+            f"[FAILED update] {tool_name}: {put_resp.status_code}",
+            f"          {put_resp.text[:500]}",
+        ]
+    return "failed", None, [
+        f"[FAILED]  {tool_name}: {resp.status_code}",
+        f"          {resp.text[:500]}",
+    ]
+
+
+def create_tools(workflow_name_to_id, concurrency=1):
     """Create all tools in Agent Builder via API.
 
     Reads agent definitions to discover which tools are needed, creates
     workflow tools (linked to imported workflow IDs) and index_search tools.
+    Tools are created on up to `concurrency` workers.
     Returns a dict mapping tool_display_name → tool_id.
     """
     print("=== Creating Tools in Agent Builder ===\n")
@@ -1003,107 +2983,23 @@ def create_tools(workflow_name_to_id):
 
     print(f"  Found {len(tools_seen)} unique tools across {len(agent_defs)} agents\n")
 
-    tool_name_to_id = {}
-    created = 0
-    updated = 0
-    skipped = 0
-    failed = 0
-
-    for tool_name, tool_def in tools_seen.items():
-        tool_id = slugify(tool_name)
-        tool_type = tool_def.get("type", "workflow")
-
-        if tool_type == "builtin":
-            builtin_id = tool_def.get("tool_id", "")
-            if builtin_id:
-                tool_name_to_id[tool_name] = builtin_id
-                print(f"    [builtin] {tool_name} → {builtin_id}")
-            continue
-
-        if tool_type == "index_search":
-            index_name = tool_def.get("index", "")
-            payload = {
-                "id": tool_id,
-                "type": "index_search",
-                "name": tool_name,
-                "description": tool_def.get("description", f"Search {index_name}"),
-                "tags": ["security-mesh"],
-                "configuration": {
-                    "index_pattern": index_name,
-                    "max_rows": 10,
-                },
-            }
-            resp = requests.post(
-                f"{base_url}/api/agent_builder/tools",
-                headers=headers,
-                json=payload,
-                timeout=30,
-            )
-            if resp.ok:
-                print(f"    [created] {tool_name} ({tool_id})")
-                tool_name_to_id[tool_name] = tool_id
-                created += 1
-            elif resp.status_code in (400, 409) and "already exists" in resp.text:
-                print(f"    [exists]  {tool_name} ({tool_id})")
-                tool_name_to_id[tool_name] = tool_id
-                skipped += 1
-            else:
-                print(f"    [MANUAL]  {tool_name} — index_search tools require UI creation")
-                print(f"              API response: {resp.status_code} — {resp.text[:300]}")
-                print(f"              Create manually: Agent Builder > Tools > New tool")
-                print(f"              Type: Index Search | Index: {index_name} | ID: {tool_id}")
-                failed += 1
-            time.sleep(0.2)
-            continue
-        else:
-            wf_id = _resolve_workflow_id(tool_name, tool_def, workflow_name_to_id)
-            if not wf_id:
-                print(f"    [SKIP] {tool_name} — no matching workflow ID found")
-                failed += 1
-                continue
-            payload = {
-                "id": tool_id,
-                "type": "workflow",
-                "description": tool_def.get("description", ""),
-                "tags": ["security-mesh"],
-                "configuration": {
-                    "workflow_id": wf_id,
-                },
-            }
-
-        resp = requests.post(
-            f"{base_url}/api/agent_builder/tools",
-            headers=headers,
-            json=payload,
-            timeout=30,
-        )
+    def create_one(item):
+        tool_name, tool_def = item
+        return tool_name, _create_tool(tool_name, tool_def, workflow_name_to_id, base_url, headers)
 
-        if resp.ok:
-            print(f"    [created] {tool_name} ({tool_id})")
+    tool_name_to_id = {}
+    counts = {"builtin": 0, "created": 0, "updated": 0, "skipped": 0, "failed": 0}
+    for tool_name, (outcome, tool_id, lines) in run_parallel(create_one, list(tools_seen.items()), concurrency):
+        for line in lines:
+            print(f"    {line}")
+        counts[outcome] += 1
+        if tool_id:
             tool_name_to_id[tool_name] = tool_id
-            created += 1
-        elif resp.status_code in (400, 409) and "already exists" in resp.text:
-            put_resp = requests.put(
-                f"{base_url}/api/agent_builder/tools/{tool_id}",
-                headers=headers,
-                json={k: v for k, v in payload.items() if k not in ("id", "type")},
-                timeout=30,
-            )
-            if put_resp.ok:
-                print(f"    [updated] {tool_name} ({tool_id})")
-                tool_name_to_id[tool_name] = tool_id
-                updated += 1
-            else:
-                print(f"    [FAILED update] {tool_name}: {put_resp.status_code}")
-                print(f"              {put_resp.text[:500]}")
-                failed += 1
-        else:
-            print(f"    [FAILED]  {tool_name}: {resp.status_code}")
-            print(f"              {resp.text[:500]}")
-            failed += 1
-
-        time.sleep(0.2)
 
+    created = counts["created"]
+    updated = counts["updated"]
+    skipped = counts["skipped"]
+    failed = counts["failed"]
     print(f"\n  Total: {created} created, {updated} updated, {skipped} existing, {failed} failed\n")
     return tool_name_to_id
 
@@ -1111,12 +3007,27 @@ def create_tools(workflow_name_to_id):
 MANUALLY_CREATED_TOOLS = {"security-mesh.agent-registry"}
 
 
-def delete_tools():
+def _delete_resources(base_url, resource, ids, headers, concurrency=1):
+    """DELETE /api/agent_builder/{resource}/{id} for each id.
+
+    Yields (id, response) in input order as deletions complete.
+    """
+    def delete_one(resource_id):
+        return resource_id, api_request(
+            "DELETE",
+            f"{base_url}/api/agent_builder/{resource}/{resource_id}",
+            headers=headers,
+        )
+
+    yield from run_parallel(delete_one, ids, concurrency)
+
+
+def delete_tools(concurrency=1):
     """Delete all security-mesh tools from Agent Builder.
 
-    Uses a two-pass strategy:
-      1. Compute expected tool IDs from agent definitions and delete by ID.
-      2. List tools from the API and delete any remaining security-mesh.* tools.
+    Streams the tool list once and deletes every security-mesh.* tool it
+    finds. If the list cannot be read, falls back to deleting the tool IDs
+    expected from the agent definitions.
 
     Tools in MANUALLY_CREATED_TOOLS are preserved (they require UI creation
     and would be lost on redeploy).
@@ -1126,25 +3037,28 @@ def delete_tools():
     base_url = kibana_base_url()
     headers = kibana_headers()
 
-    agent_defs = load_agent_definitions()
-    expected_ids = set()
-    for agent_def in agent_defs:
-        for tool in agent_def.get("tools", []):
-            if tool.get("type") == "builtin":
-                continue
-            expected_ids.add(slugify(tool["name"]))
+    try:
+        target_ids = sorted(
+            t["id"] for t in iter_kibana_objects("/api/agent_builder/tools")
+            if isinstance(t, dict) and t.get("id", "").startswith("security-mesh")
+        )
+        source = "listed"
+    except requests.HTTPError as exc:
+        print(f"  [WARN] Could not list tools: {exc.response.status_code} — deleting expected IDs instead")
+        target_ids = set()
+        for agent_def in load_agent_definitions():
+            for tool in agent_def.get("tools", []):
+                if tool.get("type") != "builtin":
+                    target_ids.add(slugify(tool["name"]))
+        target_ids = sorted(target_ids)
+        source = "expected"
+    target_ids = [t for t in target_ids if t not in MANUALLY_CREATED_TOOLS]
 
     deleted = 0
     errors = 0
 
-    expected_ids -= MANUALLY_CREATED_TOOLS
-    print(f"  Pass 1: deleting {len(expected_ids)} known tool IDs (preserving {len(MANUALLY_CREATED_TOOLS)} manual tools)...")
-    for tool_id in sorted(expected_ids):
-        del_resp = requests.delete(
-            f"{base_url}/api/agent_builder/tools/{tool_id}",
-            headers=headers,
-            timeout=15,
-        )
+    print(f"  Deleting {len(target_ids)} {source} tool IDs (preserving {len(MANUALLY_CREATED_TOOLS)} manual tools)...")
+    for tool_id, del_resp in _delete_resources(base_url, "tools", target_ids, headers, concurrency):
         if del_resp.ok or del_resp.status_code == 204:
             print(f"    [deleted] {tool_id}")
             deleted += 1
@@ -1153,46 +3067,108 @@ def delete_tools():
         else:
             print(f"    [FAILED] {tool_id}: {del_resp.status_code} — {del_resp.text[:200]}")
             errors += 1
-        time.sleep(0.1)
-
-    print(f"\n  Pass 2: checking for any remaining security-mesh tools via API...")
-    resp = requests.get(f"{base_url}/api/agent_builder/tools", headers=headers, timeout=30)
-    if resp.ok:
-        body = resp.json()
-        tools_list = body if isinstance(body, list) else []
-        if isinstance(body, dict):
-            for key in ("data", "items", "tools", "results"):
-                if key in body and isinstance(body[key], list):
-                    tools_list = body[key]
-                    break
-        remaining = [
-            t for t in tools_list
-            if isinstance(t, dict)
-            and t.get("id", "").startswith("security-mesh")
-            and t.get("id", "") not in MANUALLY_CREATED_TOOLS
-        ]
-        for tool in remaining:
-            tool_id = tool.get("id", "")
-            del_resp = requests.delete(
-                f"{base_url}/api/agent_builder/tools/{tool_id}",
-                headers=headers,
-                timeout=15,
-            )
-            if del_resp.ok or del_resp.status_code == 204:
-                print(f"    [deleted] {tool_id}")
-                deleted += 1
-            time.sleep(0.1)
-    else:
-        print(f"    [WARN] Could not list tools: {resp.status_code}")
 
     print(f"\n  Deleted {deleted} tools ({errors} errors)\n")
 
 
-def create_agents(tool_name_to_id):
+def _agent_payload(agent_def, tool_ids):
+    """Build the Agent Builder create payload for an agent definition."""
+    return {
+        "id": slugify(agent_def["agent_name"]),
+        "name": agent_def["agent_name"],
+        "description": agent_def.get("description", "").strip(),
+        "labels": ["security-mesh"],
+        "configuration": {
+            "instructions": agent_def.get("system_instructions", ""),
+            "tools": [{"tool_ids": tool_ids}] if tool_ids else [],
+        },
+    }
+
+
+def _create_agent(agent_def, tool_name_to_id, live_tool_ids, base_url, headers):
+    """Create (or update) one Agent Builder agent.
+
+    Tools missing from tool_name_to_id are resolved against live_tool_ids
+    (the tool IDs already present in Agent Builder) by their computed ID.
+
+    Returns (outcome, agent_id, lines) where outcome is one of "created",
+    "updated" or "failed" and lines are the messages to print.
+    """
+    agent_name = agent_def["agent_name"]
+    agent_id = slugify(agent_name)
+    lines = []
+
+    tool_ids = []
+    builtin_tools = []
+    skipped_tools = []
+    fallback_tools = []
+    for tool in agent_def.get("tools", []):
+        if tool.get("type") == "builtin":
+            builtin_id = tool.get("tool_id", "")
+            if builtin_id:
+                tool_ids.append(builtin_id)
+                builtin_tools.append(f"{tool['name']} → {builtin_id}")
+            continue
+
+        tid = tool_name_to_id.get(tool["name"])
+        if tid:
+            tool_ids.append(tid)
+        elif slugify(tool["name"]) in live_tool_ids:
+            tool_ids.append(slugify(tool["name"]))
+            fallback_tools.append(tool["name"])
+        else:
+            skipped_tools.append(tool["name"])
+
+    if builtin_tools:
+        lines.append(f"[builtin] {agent_name}: {len(builtin_tools)} platform tool(s):")
+        for bt in builtin_tools:
+            lines.append(f"          - {bt}")
+    if fallback_tools:
+        lines.append(f"[info] {agent_name}: {len(fallback_tools)} tool(s) resolved via fallback:")
+        for ft in fallback_tools:
+            lines.append(f"       - {ft} → {slugify(ft)}")
+    if skipped_tools:
+        lines.append(f"[warn] {agent_name}: {len(skipped_tools)} tool(s) not found, skipped:")
+        for st in skipped_tools:
+            lines.append(f"       - {st} (create manually in Agent Builder)")
+
+    payload = _agent_payload(agent_def, tool_ids)
+
+    resp = api_request(
+        "POST",
+        f"{base_url}/api/agent_builder/agents",
+        headers=headers,
+        json=payload,
+    )
+
+    if resp.ok:
+        returned_id = resp.json().get("id", agent_id)
+        lines.append(f"[created] {agent_name} ({returned_id}) — {len(tool_ids)} tools")
+        return "created", returned_id, lines
+    if resp.status_code in (400, 409) and "already exists" in resp.text:
+        put_resp = api_request(
+            "PUT",
+            f"{base_url}/api/agent_builder/agents/{agent_id}",
+            headers=headers,
+            json={k: v for k, v in payload.items() if k != "id"},
+        )
+        if put_resp.ok:
+            lines.append(f"[updated] {agent_name} ({agent_id}) — {len(tool_ids)} tools")
+            return "updated", agent_id, lines
+        lines.append(f"[FAILED update] {agent_name}: {put_resp.status_code}")
+        lines.append(f"          {put_resp.text[:500]}")
+        return "failed", None, lines
+    lines.append(f"[FAILED]  {agent_name}: {resp.status_code}")
+    lines.append(f"          {resp.text[:500]}")
+    return "failed", None, lines
+
+
+def create_agents(tool_name_to_id, concurrency=1):
     """Create all agents in Agent Builder via API.
 
     Reads agent definitions, maps their tool lists to tool IDs, and
     creates each agent with system instructions and tool assignments.
+    Agents are created on up to `concurrency` workers.
     Returns a dict mapping agent_name → agent_builder_id.
     """
     print("=== Creating Agents in Agent Builder ===\n")
@@ -1201,137 +3177,73 @@ def create_agents(tool_name_to_id):
     headers = kibana_headers()
     agent_defs = load_agent_definitions()
 
-    agent_name_to_id = {}
-    created = 0
-    updated = 0
-    skipped = 0
-    failed = 0
-
-    for agent_def in agent_defs:
-        agent_name = agent_def["agent_name"]
-        agent_id = slugify(agent_name)
-
-        tool_ids = []
-        builtin_tools = []
-        skipped_tools = []
-        fallback_tools = []
-        for tool in agent_def.get("tools", []):
-            if tool.get("type") == "builtin":
-                builtin_id = tool.get("tool_id", "")
-                if builtin_id:
-                    tool_ids.append(builtin_id)
-                    builtin_tools.append(f"{tool['name']} → {builtin_id}")
-                continue
-
-            tid = tool_name_to_id.get(tool["name"])
-            if tid:
-                tool_ids.append(tid)
-            else:
-                computed_id = slugify(tool["name"])
-                check = requests.get(
-                    f"{base_url}/api/agent_builder/tools/{computed_id}",
-                    headers=headers,
-                    timeout=10,
-                )
-                if check.ok:
-                    tool_ids.append(computed_id)
-                    fallback_tools.append(tool["name"])
-                else:
-                    skipped_tools.append(tool["name"])
-
-        if builtin_tools:
-            print(f"    [builtin] {agent_name}: {len(builtin_tools)} platform tool(s):")
-            for bt in builtin_tools:
-                print(f"              - {bt}")
-        if fallback_tools:
-            print(f"    [info] {agent_name}: {len(fallback_tools)} tool(s) resolved via fallback:")
-            for ft in fallback_tools:
-                print(f"           - {ft} → {slugify(ft)}")
-        if skipped_tools:
-            print(f"    [warn] {agent_name}: {len(skipped_tools)} tool(s) not found, skipped:")
-            for st in skipped_tools:
-                print(f"           - {st} (create manually in Agent Builder)")
-
-        payload = {
-            "id": agent_id,
-            "name": agent_name,
-            "description": agent_def.get("description", "").strip(),
-            "labels": ["security-mesh"],
-            "configuration": {
-                "instructions": agent_def.get("system_instructions", ""),
-                "tools": [{"tool_ids": tool_ids}] if tool_ids else [],
-            },
-        }
-
-        resp = requests.post(
-            f"{base_url}/api/agent_builder/agents",
-            headers=headers,
-            json=payload,
-            timeout=30,
-        )
-
-        if resp.ok:
-            returned_id = resp.json().get("id", agent_id)
-            print(f"    [created] {agent_name} ({returned_id}) — {len(tool_ids)} tools")
-            agent_name_to_id[agent_name] = returned_id
-            created += 1
-        elif resp.status_code in (400, 409) and "already exists" in resp.text:
-            put_resp = requests.put(
-                f"{base_url}/api/agent_builder/agents/{agent_id}",
-                headers=headers,
-                json={k: v for k, v in payload.items() if k != "id"},
-                timeout=30,
-            )
-            if put_resp.ok:
-                print(f"    [updated] {agent_name} ({agent_id}) — {len(tool_ids)} tools")
-                agent_name_to_id[agent_name] = agent_id
-                updated += 1
-            else:
-                print(f"    [FAILED update] {agent_name}: {put_resp.status_code}")
-                print(f"              {put_resp.text[:500]}")
-                failed += 1
-        else:
-            print(f"    [FAILED]  {agent_name}: {resp.status_code}")
-            print(f"              {resp.text[:500]}")
-            failed += 1
+    # Tools not created in this run are looked up in one streamed listing
+    # rather than a GET per missing tool per agent.
+    live_tool_ids = set()
+    unresolved = any(
+        tool.get("type") != "builtin" and tool["name"] not in tool_name_to_id
+        for agent_def in agent_defs
+        for tool in agent_def.get("tools", [])
+    )
+    if unresolved:
+        try:
+            live_tool_ids = {t["id"] for t in iter_kibana_objects("/api/agent_builder/tools") if t.get("id")}
+        except requests.HTTPError as exc:
+            print(f"  [WARN] Could not list tools: {exc.response.status_code}")
 
-        time.sleep(0.3)
+    def create_one(agent_def):
+        return agent_def["agent_name"], _create_agent(agent_def, tool_name_to_id, live_tool_ids, base_url, headers)
 
-    print(f"\n  Total: {created} created, {updated} updated, {skipped} existing, {failed} failed\n")
+    agent_name_to_id = {}
+    counts = {"created": 0, "updated": 0, "failed": 0}
+    for agent_name, (outcome, agent_id, lines) in run_parallel(create_one, agent_defs, concurrency):
+        for line in lines:
+            print(f"    {line}")
+        counts[outcome] += 1
+        if agent_id:
+            agent_name_to_id[agent_name] = agent_id
+
+    created = counts["created"]
+    updated = counts["updated"]
+    failed = counts["failed"]
+    print(f"\n  Total: {created} created, {updated} updated, {failed} failed\n")
     return agent_name_to_id
 
 
-def delete_agents():
+def delete_agents(concurrency=1):
     """Delete all security-mesh agents from Agent Builder.
 
-    Uses a two-pass strategy:
-      1. Compute expected agent IDs from definitions and delete by ID.
-         Also tries the hyphen variant (security-mesh-xxx) for legacy agents.
-      2. List agents from the API and delete any remaining security-mesh agents.
+    Streams the agent list once and deletes every security-mesh agent it
+    finds (dot IDs and the legacy hyphen variant, security-mesh-xxx). If the
+    list cannot be read, falls back to deleting both ID variants expected
+    from the agent definitions.
     """
     print("=== Deleting Security Mesh Agents ===\n")
 
     base_url = kibana_base_url()
     headers = kibana_headers()
 
-    agent_defs = load_agent_definitions()
-    expected_ids = set()
-    for agent_def in agent_defs:
-        dot_id = slugify(agent_def["agent_name"])
-        expected_ids.add(dot_id)
-        hyphen_id = dot_id.replace("security-mesh.", "security-mesh-", 1)
-        expected_ids.add(hyphen_id)
+    try:
+        target_ids = sorted(
+            a["id"] for a in iter_kibana_objects("/api/agent_builder/agents")
+            if isinstance(a, dict) and a.get("id", "").startswith(("security-mesh.", "security-mesh-"))
+        )
+        source = "listed"
+    except requests.HTTPError as exc:
+        print(f"  [WARN] Could not list agents: {exc.response.status_code} — deleting expected IDs instead")
+        target_ids = set()
+        for agent_def in load_agent_definitions():
+            dot_id = slugify(agent_def["agent_name"])
+            target_ids.add(dot_id)
+            target_ids.add(dot_id.replace("security-mesh.", "security-mesh-", 1))
+        target_ids = sorted(target_ids)
+        source = "expected"
 
     deleted = 0
     errors = 0
 
-    print(f"  Pass 1: deleting {len(expected_ids)} known agent IDs (dot + hyphen variants)...")
-    for agent_id in sorted(expected_ids):
-        del_resp = requests.delete(
-            f"{base_url}/api/agent_builder/agents/{agent_id}",
-            headers=headers,
-            timeout=15,
-        )
+    print(f"  Deleting {len(target_ids)} {source} agent IDs...")
+    for agent_id, del_resp in _delete_resources(base_url, "agents", target_ids, headers, concurrency):
         if del_resp.ok or del_resp.status_code == 204:
             print(f"    [deleted] {agent_id}")
             deleted += 1
@@ -1340,36 +3252,6 @@ def delete_agents():
         else:
             print(f"    [FAILED] {agent_id}: {del_resp.status_code} — {del_resp.text[:200]}")
             errors += 1
-        time.sleep(0.1)
-
-    print(f"\n  Pass 2: checking for any remaining security-mesh agents via API...")
-    resp = requests.get(f"{base_url}/api/agent_builder/agents", headers=headers, timeout=30)
-    if resp.ok:
-        body = resp.json()
-        agents_list = body if isinstance(body, list) else []
-        if isinstance(body, dict):
-            for key in ("data", "items", "agents", "results"):
-                if key in body and isinstance(body[key], list):
-                    agents_list = body[key]
-                    break
-        remaining = [
-            a for a in agents_list
-            if isinstance(a, dict)
-            and (a.get("id", "").startswith("security-mesh.") or a.get("id", "").startswith("security-mesh-"))
-        ]
-        for agent in remaining:
-            agent_id = agent.get("id", "")
-            del_resp = requests.delete(
-                f"{base_url}/api/agent_builder/agents/{agent_id}",
-                headers=headers,
-                timeout=15,
-            )
-            if del_resp.ok or del_resp.status_code == 204:
-                print(f"    [deleted] {agent_id}")
-                deleted += 1
-            time.sleep(0.1)
-    else:
-        print(f"    [WARN] Could not list agents: {resp.status_code}")
 
     print(f"\n  Deleted {deleted} agents ({errors} errors)\n")
 
@@ -1381,8 +3263,7 @@ def register_agents_in_mesh(agent_name_to_builder_id):
     agent_defs = load_agent_definitions()
     now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
-    bulk_body = ""
-    count = 0
+    actions = []
     for agent_def in agent_defs:
         reg = agent_def.get("registry_entry")
         if not reg:
@@ -1405,38 +3286,341 @@ def register_agents_in_mesh(agent_name_to_builder_id):
             "created_at": now,
             "updated_at": now,
         }
+        actions.append(("agent-registry", doc_id, doc))
 
-        bulk_body += json.dumps({"index": {"_id": doc_id}}) + "\n"
-        bulk_body += json.dumps(doc) + "\n"
-        count += 1
-
-    if not bulk_body:
+    if not actions:
         print("  No registry entries found.\n")
         return
 
-    url = f"{os.environ['ELASTIC_CLOUD_URL']}/agent-registry/_bulk"
-    resp = requests.post(
-        url,
-        headers={**es_headers(), "Content-Type": "application/x-ndjson"},
-        data=bulk_body,
-        timeout=30,
-    )
+    # semantic_description is a semantic_text field: start small and let
+    # the controller grow the batch as inference keeps up.
+    controller = BulkController(BULK_MAX_DOCS, 1)
+    controller.use_semantic_start()
+    stats = bulk_ingest(actions, controller=controller)
+    print(f"  Registered {stats['indexed']}/{len(actions)} agents in mesh")
+
+    print()
+
+
+# ---------------------------------------------------------------------------
+# Plan / apply: one listing pass, then only the calls the diff requires
+# ---------------------------------------------------------------------------
+
+def _is_subset(desired, live):
+    """True when every key in `desired` has the same value in `live` (recursing into dicts)."""
+    if isinstance(desired, dict):
+        return isinstance(live, dict) and all(_is_subset(v, live.get(k)) for k, v in desired.items())
+    return desired == live
+
+
+def plan_workflows(desired, live_workflows, manifest):
+    """Diff repo workflow files against Kibana.
+
+    A workflow is matched by its manifest ID first, then by name. It is
+    unchanged when Kibana's stored YAML equals the rendered file or, if the
+    listing omits YAML, when the manifest hash matches. Manifest entries
+    whose file has left the repo become deletes.
+    """
+    live_by_id = {wf.get("id"): wf for wf in live_workflows if wf.get("id")}
+    live_by_name = {}
+    for wf in live_workflows:
+        live_by_name.setdefault(wf.get("name", ""), wf)
+
+    actions = []
+    for wf in desired:
+        entry = manifest.get(wf["path"], {})
+        live = live_by_id.get(entry.get("workflow_id")) or live_by_name.get(wf["name"])
+        if live is None:
+            actions.append({"action": "create", "name": wf["name"], "id": "", "workflow": wf})
+            continue
+        if "yaml" in live:
+            unchanged = live["yaml"] == wf["content"]
+        else:
+            unchanged = entry.get("content_hash") == wf["hash"] and entry.get("workflow_id") == live["id"]
+        actions.append({
+            "action": "noop" if unchanged else "update",
+            "name": wf["name"],
+            "id": live["id"],
+            "workflow": wf,
+        })
+
+    repo_paths = {wf["path"] for wf in desired}
+    for path, entry in sorted(manifest.items()):
+        if path not in repo_paths and entry.get("workflow_id") in live_by_id:
+            actions.append({
+                "action": "delete",
+                "name": entry.get("workflow_name", path),
+                "id": entry["workflow_id"],
+                "path": path,
+            })
+    return actions
+
+
+def _unique_tools(agent_defs):
+    tools_seen = {}
+    for agent_def in agent_defs:
+        for tool in agent_def.get("tools", []):
+            tools_seen.setdefault(tool["name"], tool)
+    return tools_seen
+
+
+def plan_tools(tools_seen, live_tools, workflow_name_to_id):
+    """Diff the tools the agent definitions need against Agent Builder.
+
+    Tools whose workflow cannot be resolved are reported as "skip". Any
+    security-mesh.* tool that is no longer defined (and is not in
+    MANUALLY_CREATED_TOOLS) becomes a delete.
+    """
+    actions = []
+    desired_ids = set()
+    for tool_name, tool_def in tools_seen.items():
+        tool_type = tool_def.get("type", "workflow")
+        if tool_type == "builtin":
+            continue
+        tool_id = slugify(tool_name)
+        desired_ids.add(tool_id)
+        live = live_tools.get(tool_id)
+        if tool_type == "index_search":
+            action = "noop" if live else "create"
+            actions.append({"action": action, "name": tool_name, "id": tool_id, "tool_def": tool_def,
+                            "payload": _tool_payload(tool_name, tool_def)})
+            continue
+        wf_id = _resolve_workflow_id(tool_name, tool_def, workflow_name_to_id)
+        if not wf_id:
+            actions.append({"action": "skip", "name": tool_name, "id": tool_id, "tool_def": tool_def,
+                            "reason": "no matching workflow"})
+            continue
+        payload = _tool_payload(tool_name, tool_def, wf_id)
+        if live is None:
+            action = "create"
+        else:
+            comparable = {k: v for k, v in payload.items() if k not in ("id", "type")}
+            action = "noop" if _is_subset(comparable, live) else "update"
+        actions.append({"action": action, "name": tool_name, "id": tool_id, "tool_def": tool_def,
+                        "payload": payload})
+
+    for tool_id in sorted(live_tools):
+        if (tool_id.startswith("security-mesh.") and tool_id not in desired_ids
+                and tool_id not in MANUALLY_CREATED_TOOLS):
+            actions.append({"action": "delete", "name": tool_id, "id": tool_id})
+    return actions
+
+
+def plan_agents(agent_defs, live_agents, available_tool_ids):
+    """Diff agent definitions against Agent Builder.
+
+    Tool references resolve against `available_tool_ids` (tools that exist
+    or will exist), replacing the per-tool GET fallback in create_agents().
+    Any security-mesh agent that is no longer defined becomes a delete.
+    """
+    actions = []
+    desired_ids = set()
+    for agent_def in agent_defs:
+        agent_id = slugify(agent_def["agent_name"])
+        desired_ids.add(agent_id)
+        tool_ids = []
+        missing = []
+        for tool in agent_def.get("tools", []):
+            if tool.get("type") == "builtin":
+                if tool.get("tool_id"):
+                    tool_ids.append(tool["tool_id"])
+                continue
+            tool_id = slugify(tool["name"])
+            if tool_id in available_tool_ids:
+                tool_ids.append(tool_id)
+            else:
+                missing.append(tool["name"])
+        payload = _agent_payload(agent_def, tool_ids)
+        live = live_agents.get(agent_id)
+        if live is None:
+            action = "create"
+        else:
+            comparable = {k: v for k, v in payload.items() if k != "id"}
+            action = "noop" if _is_subset(comparable, live) else "update"
+        actions.append({"action": action, "name": agent_def["agent_name"], "id": agent_id,
+                        "payload": payload, "missing_tools": missing})
+
+    for agent_id in sorted(live_agents):
+        if agent_id.startswith(("security-mesh.", "security-mesh-")) and agent_id not in desired_ids:
+            actions.append({"action": "delete", "name": agent_id, "id": agent_id})
+    return actions
 
-    if resp.ok:
-        result = resp.json()
-        errors = sum(1 for item in result.get("items", []) if item.get("index", {}).get("error"))
-        print(f"  Registered {count - errors}/{count} agents in mesh")
-        if errors:
-            for item in result.get("items", []):
-                err = item.get("index", {}).get("error")
-                if err:
-                    print(f"    [error] {err.get('reason', '')[:150]}")
-    else:
-        print(f"  [FAILED] {resp.status_code} — {resp.text[:200]}")
 
+PLAN_SYMBOLS = {"create": "+", "update": "~", "delete": "-", "skip": "!"}
+
+
+def print_plan_section(title, actions):
+    counts = {}
+    for a in actions:
+        counts[a["action"]] = counts.get(a["action"], 0) + 1
+    print(f"  {title}: {counts.get('create', 0)} to create, {counts.get('update', 0)} to update, "
+          f"{counts.get('delete', 0)} to delete, {counts.get('noop', 0)} unchanged"
+          + (f", {counts['skip']} skipped" if counts.get("skip") else ""))
+    for a in actions:
+        if a["action"] == "noop":
+            continue
+        detail = f" ({a['reason']})" if a.get("reason") else ""
+        print(f"    {PLAN_SYMBOLS[a['action']]} {a['action']:<6} {a['name']}{detail}")
+        for tool_name in a.get("missing_tools", []):
+            print(f"               tool not found: {tool_name}")
     print()
 
 
+def _count_changes(actions):
+    return sum(1 for a in actions if a["action"] in ("create", "update", "delete"))
+
+
+def plan_deployment(apply=False, concurrency=1):
+    """Compute (and optionally apply) the workflow/tool/agent diff.
+
+    Lists workflows, tools and agents once each, builds the desired state
+    from WORKFLOW_DIRS and load_agent_definitions(), and prints a
+    create/update/delete diff. With apply=True it then issues exactly one
+    call per change — POST for creates, PUT for updates, DELETE for
+    deletes — in dependency order (workflows → tools → agents → registry).
+    """
+    print("=== Deployment Plan ===\n")
+
+    try:
+        live_workflows = list(iter_kibana_objects("/api/workflows"))
+        live_tools = {t["id"]: t for t in iter_kibana_objects("/api/agent_builder/tools") if t.get("id")}
+        live_agents = {a["id"]: a for a in iter_kibana_objects("/api/agent_builder/agents") if a.get("id")}
+    except requests.HTTPError as exc:
+        print(f"  [FAILED] Could not list current state: {exc}\n")
+        return
+
+    manifest = load_deploy_manifest()
+    manifest_exists = manifest is not None
+    manifest = manifest or {}
+    replacements = build_replacements()
+    desired_workflows = load_workflow_files(replacements)
+    agent_defs = load_agent_definitions()
+    tools_seen = _unique_tools(agent_defs)
+
+    wf_actions = plan_workflows(desired_workflows, live_workflows, manifest)
+    projected_wf_map = {wf.get("name", ""): wf.get("id") for wf in live_workflows if wf.get("id")}
+    for a in wf_actions:
+        if a["action"] == "create":
+            projected_wf_map[a["name"]] = "(new)"
+    tool_actions = plan_tools(tools_seen, live_tools, projected_wf_map)
+    projected_tool_ids = (set(live_tools) | {a["id"] for a in tool_actions if a["action"] == "create"}) \
+        - {a["id"] for a in tool_actions if a["action"] == "delete"}
+    agent_actions = plan_agents(agent_defs, live_agents, projected_tool_ids)
+
+    print_plan_section("Workflows", wf_actions)
+    print_plan_section("Tools", tool_actions)
+    print_plan_section("Agents", agent_actions)
+
+    if not apply:
+        total = _count_changes(wf_actions) + _count_changes(tool_actions) + _count_changes(agent_actions)
+        print(f"  {total} change(s) planned. Re-run with --apply to execute.\n")
+        return
+
+    base_url = kibana_base_url()
+    headers = kibana_headers()
+
+    print("=== Applying Plan ===\n")
+    if not manifest_exists:
+        create_index(DEPLOY_MANIFEST_INDEX, deploy_manifest_mapping())
+
+    # Workflows
+    wf_map = {wf.get("name", ""): wf.get("id") for wf in live_workflows if wf.get("id")}
+    manifest_updates = []
+    removed_paths = []
+
+    def apply_workflow(a):
+        if a["action"] == "delete":
+            resp = api_request("DELETE", f"{base_url}/api/workflows/{a['id']}", headers=headers)
+            ok = resp.ok or resp.status_code == 404
+            return a, ("deleted" if ok else "failed", a["name"], "",
+                       f"[deleted] {a['name']}" if ok else f"[FAILED delete] {a['name']}: {resp.status_code}")
+        if a["action"] == "noop":
+            return a, ("unchanged", a["name"], a["id"], None)
+        wf = a["workflow"]
+        return a, _import_workflow_file(wf["file"], wf["content"], a["id"], base_url, headers)
+
+    print("  Workflows:")
+    for a, (outcome, name, wf_id, message) in run_parallel(apply_workflow, wf_actions, concurrency):
+        if message:
+            print(f"    {message}")
+        if outcome == "deleted":
+            removed_paths.append(a["path"])
+        elif wf_id:
+            wf_map[name] = wf_id
+            if outcome in ("imported", "updated", "unchanged"):
+                manifest_updates.append(_manifest_entry(a["workflow"], wf_id, name))
+    save_deploy_manifest(manifest_updates, removed_paths)
+
+    # Tools — re-planned against the real workflow IDs
+    tool_actions = plan_tools(tools_seen, live_tools, wf_map)
+    existing_tool_ids = set(live_tools)
+
+    def apply_tool(a):
+        if a["action"] == "delete":
+            resp = api_request("DELETE", f"{base_url}/api/agent_builder/tools/{a['id']}", headers=headers)
+            return a, resp.ok or resp.status_code == 404, resp
+        if a["action"] == "create":
+            resp = api_request("POST", f"{base_url}/api/agent_builder/tools", headers=headers, json=a["payload"])
+            return a, resp.ok, resp
+        if a["action"] == "update":
+            body = {k: v for k, v in a["payload"].items() if k not in ("id", "type")}
+            resp = api_request("PUT", f"{base_url}/api/agent_builder/tools/{a['id']}", headers=headers, json=body)
+            return a, resp.ok, resp
+        return a, True, None
+
+    print("\n  Tools:")
+    for a, ok, resp in run_parallel(apply_tool, tool_actions, concurrency):
+        if a["action"] == "skip":
+            print(f"    [SKIP] {a['name']} — {a['reason']}")
+            continue
+        if resp is None:
+            continue
+        if ok and a["action"] == "delete":
+            existing_tool_ids.discard(a["id"])
+            print(f"    [deleted] {a['id']}")
+        elif ok:
+            existing_tool_ids.add(a["id"])
+            print(f"    [{a['action']}d] {a['name']} ({a['id']})")
+        elif a.get("tool_def", {}).get("type") == "index_search":
+            for line in _manual_tool_lines(a["name"], a["tool_def"], resp):
+                print(f"    {line}")
+        else:
+            print(f"    [FAILED {a['action']}] {a['name']}: {resp.status_code} — {resp.text[:300]}")
+
+    # Agents — re-planned against the tools that now exist
+    agent_actions = plan_agents(agent_defs, live_agents, existing_tool_ids)
+    agent_map = {}
+
+    def apply_agent(a):
+        if a["action"] == "delete":
+            resp = api_request("DELETE", f"{base_url}/api/agent_builder/agents/{a['id']}", headers=headers)
+            return a, resp.ok or resp.status_code == 404, resp
+        if a["action"] == "create":
+            resp = api_request("POST", f"{base_url}/api/agent_builder/agents", headers=headers, json=a["payload"])
+            return a, resp.ok, resp
+        if a["action"] == "update":
+            body = {k: v for k, v in a["payload"].items() if k != "id"}
+            resp = api_request("PUT", f"{base_url}/api/agent_builder/agents/{a['id']}", headers=headers, json=body)
+            return a, resp.ok, resp
+        return a, True, None
+
+    print("\n  Agents:")
+    for a, ok, resp in run_parallel(apply_agent, agent_actions, concurrency):
+        if a["action"] != "delete" and ok:
+            agent_map[a["name"]] = a["id"]
+        if resp is None:
+            continue
+        if ok and a["action"] == "delete":
+            print(f"    [deleted] {a['id']}")
+        elif ok:
+            print(f"    [{a['action']}d] {a['name']} ({a['id']})")
+        else:
+            print(f"    [FAILED {a['action']}] {a['name']}: {resp.status_code} — {resp.text[:300]}")
+    print()
+
+    register_agents_in_mesh(agent_map)
+
+
 def print_manual_steps():
     """Print steps that must be done manually."""
     print("=== Manual Steps (Pre-requisites) ===\n")
@@ -1457,6 +3641,7 @@ def print_manual_steps():
 
 
 def main():
+    global LIST_PAGE_SIZE
     parser = argparse.ArgumentParser(description="Elastic Security Agent Mesh setup")
     parser.add_argument("--validate", action="store_true", help="Validate env vars only")
     parser.add_argument("--indices-only", action="store_true", help="Only create indices")
@@ -1468,11 +3653,61 @@ def main():
                         help="Only create agents (requires tools already created)")
     parser.add_argument("--seed-knowledge", action="store_true",
                         help="Only seed operational knowledge (false positive patterns, playbooks)")
+    parser.add_argument("--load-knowledge", metavar="PATH",
+                        help="Bulk-load knowledge documents from a JSON/JSONL/STIX file or directory into kb-* indices")
+    parser.add_argument("--knowledge-index", metavar="INDEX",
+                        help="Target kb-* index for --load-knowledge records that don't name one "
+                             f"(STIX objects default to {STIX_DEFAULT_INDEX})")
+    parser.add_argument("--bulk-mb", type=float, default=BULK_MAX_BYTES / 1048576, metavar="MB",
+                        help=f"Maximum _bulk request size for --load-knowledge (default: {BULK_MAX_BYTES // 1048576})")
+    parser.add_argument("--redrive-dispatches", action="store_true",
+                        help="Return dead-lettered (and legacy failed) dispatches to the queue with fresh retries")
+    parser.add_argument("--redrive-agent", metavar="AGENT_ID",
+                        help="With --redrive-dispatches, only re-drive dispatches for this target agent")
+    parser.add_argument("--redrive-case", metavar="CASE_ID",
+                        help="With --redrive-dispatches, only re-drive dispatches for this case")
+    parser.add_argument("--cache-stats", action="store_true",
+                        help="Show enrichment cache hit/miss counts per source and IOC type")
     parser.add_argument("--delete-workflows", action="store_true",
                         help="Delete all workflows from Kibana before importing")
     parser.add_argument("--delete-all", action="store_true",
                         help="Delete all mesh agents, tools, and workflows, then re-deploy")
+    parser.add_argument("--plan", action="store_true",
+                        help="List workflows, tools and agents once and print the create/update/delete diff")
+    parser.add_argument("--apply", action="store_true",
+                        help="Compute the plan, then execute only the calls it requires")
+    parser.add_argument("--force-workflows", action="store_true",
+                        help="Re-import every workflow, ignoring the deploy manifest")
+    parser.add_argument("--prune-workflows", action="store_true",
+                        help="Delete deployed workflows whose YAML file was removed from the repo")
+    parser.add_argument("--rollover-indices", action="store_true",
+                        help="Provision dispatch-requests and approval-requests as ILM-managed rollover aliases "
+                             "(migrates existing plain indices)")
+    parser.add_argument("--retention-days", type=int, default=DEFAULT_RETENTION_DAYS, metavar="DAYS",
+                        help=f"With --rollover-indices, delete rolled-over indices after DAYS (default: {DEFAULT_RETENTION_DAYS})")
+    parser.add_argument("--concurrency", type=int, default=1, metavar="N",
+                        help="Run up to N API calls in parallel within each phase (default: 1)")
+    parser.add_argument("--max-rps", type=float, default=DEFAULT_MAX_RPS, metavar="RPS",
+                        help=f"Upper bound on API requests per second (default: {DEFAULT_MAX_RPS:g}); "
+                             "backs off automatically on 429/503")
+    parser.add_argument("--page-size", type=int, default=LIST_PAGE_SIZE, metavar="N",
+                        help=f"Objects per page when listing workflows, tools and agents (default: {LIST_PAGE_SIZE})")
     args = parser.parse_args()
+    if args.retention_days < 1:
+        parser.error("--retention-days must be at least 1")
+    if (args.redrive_agent or args.redrive_case) and not args.redrive_dispatches:
+        parser.error("--redrive-agent and --redrive-case require --redrive-dispatches")
+    if args.bulk_mb <= 0:
+        parser.error("--bulk-mb must be positive")
+    if args.page_size < 1:
+        parser.error("--page-size must be at least 1")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.max_rps <= 0:
+        parser.error("--max-rps must be positive")
+    configure_api_client(args.max_rps, args.concurrency)
+    LIST_PAGE_SIZE = args.page_size
+    concurrency = args.concurrency
 
     print()
     print("=" * 60)
@@ -1486,19 +3721,23 @@ def main():
         print("Validation complete.")
         return
 
+    if args.plan or args.apply:
+        plan_deployment(apply=args.apply, concurrency=concurrency)
+        return
+
     if args.delete_all:
-        delete_agents()
-        delete_tools()
+        delete_agents(concurrency)
+        delete_tools(concurrency)
         print("\n  NOTE: Workflows must be deleted manually in Kibana before re-deploying.")
         print("  Filter by the 'agent-mesh' tag, select all, and delete.\n")
         print("  Waiting 15s for deletions to propagate...\n")
         time.sleep(15)
-        create_all_indices()
+        create_all_indices(concurrency, args.rollover_indices, args.retention_days)
         seed_action_policies()
         seed_operational_knowledge()
-        wf_map = import_workflows()
-        tool_map = create_tools(wf_map)
-        agent_map = create_agents(tool_map)
+        wf_map = import_workflows(concurrency, args.force_workflows, args.prune_workflows)
+        tool_map = create_tools(wf_map, concurrency)
+        agent_map = create_agents(tool_map, concurrency)
         register_agents_in_mesh(agent_map)
         print_manual_steps()
         print("=" * 60)
@@ -1515,11 +3754,11 @@ def main():
         return
 
     if args.indices_only:
-        create_all_indices()
+        create_all_indices(concurrency, args.rollover_indices, args.retention_days)
         return
 
     if args.workflows_only:
-        import_workflows()
+        import_workflows(concurrency, args.force_workflows, args.prune_workflows)
         return
 
     if args.seed_policies:
@@ -1530,23 +3769,35 @@ def main():
         seed_operational_knowledge()
         return
 
+    if args.redrive_dispatches:
+        redrive_dispatches(args.redrive_agent, args.redrive_case)
+        return
+
+    if args.cache_stats:
+        print_cache_stats()
+        return
+
+    if args.load_knowledge:
+        load_knowledge(args.load_knowledge, args.knowledge_index, concurrency, int(args.bulk_mb * 1048576))
+        return
+
     if args.tools_only:
         wf_map = fetch_existing_workflow_ids()
-        create_tools(wf_map)
+        create_tools(wf_map, concurrency)
         return
 
     if args.agents_only:
         tool_map = fetch_existing_tool_ids()
-        agent_map = create_agents(tool_map)
+        agent_map = create_agents(tool_map, concurrency)
         register_agents_in_mesh(agent_map)
         return
 
-    create_all_indices()
+    create_all_indices(concurrency, args.rollover_indices, args.retention_days)
     seed_action_policies()
     seed_operational_knowledge()
-    wf_map = import_workflows()
-    tool_map = create_tools(wf_map)
-    agent_map = create_agents(tool_map)
+    wf_map = import_workflows(concurrency, args.force_workflows, args.prune_workflows)
+    tool_map = create_tools(wf_map, concurrency)
+    agent_map = create_agents(tool_map, concurrency)
     register_agents_in_mesh(agent_map)
     print_manual_steps()
 
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+import setup  # noqa: E402
+from fake_elastic import FakeElastic, serve  # noqa: E402
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    """A FakeElastic served locally, with the mesh environment pointed at it."""
+    fake = FakeElastic()
+    server, url = serve(fake)
+    for name in ("ELASTIC_CLOUD_URL", "KIBANA_URL"):
+        monkeypatch.setenv(name, url)
+    for name in ("ES_API_KEY", "KIBANA_API_KEY", "LLM_CONNECTOR_ID"):
+        monkeypatch.setenv(name, "test")
+    monkeypatch.delenv("KIBANA_SPACE", raising=False)
+    setup.configure_api_client(max_rps=1000, concurrency=8)
+    yield fake
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,233 @@
+"""
+Minimal in-memory Elasticsearch/Kibana for the worker tests.
+
+Serves the handful of endpoints the dispatch worker talks to, on a local
+ThreadingHTTPServer:
+
+    POST /<index>/_search            bool/term/terms/range/ids/exists queries,
+                                     sort, collapse with inner_hits
+    POST /<index>/_update/<id>       if_seq_no/if_primary_term, LEASE_SCRIPT
+                                     and RETRY_SCRIPT, partial "doc" updates
+    POST /<index>/_update_by_query   accepted, updates nothing
+    POST /api/agent_builder/converse answered by FakeElastic.converse
+    POST /api/cases/<id>/comments    recorded in FakeElastic.comments
+
+Painless is not run: the worker's scripts are recognised by their source
+and applied in Python, with ctx._now taken from the local clock. The
+_script sort of queue_sort() is approximated by priority_rank alone (no
+aging).
+"""
+
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from dispatch_worker import LEASE_SCRIPT, PRIORITY_RANK, RETRY_SCRIPT
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def _millis(value):
+    """A date value (epoch millis, ISO 8601 or "now") as epoch millis."""
+    if value == "now":
+        return _now_ms()
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() * 1000)
+
+
+def matches(query, doc_id, source):
+    """Evaluate the subset of the query DSL the workers use against one document."""
+    if not query or "match_all" in query:
+        return True
+    if "bool" in query:
+        clause = query["bool"]
+        if not all(matches(q, doc_id, source) for key in ("filter", "must") for q in clause.get(key, [])):
+            return False
+        if any(matches(q, doc_id, source) for q in clause.get("must_not", [])):
+            return False
+        should = clause.get("should", [])
+        if should:
+            needed = clause.get("minimum_should_match", 1)
+            return sum(matches(q, doc_id, source) for q in should) >= needed
+        return True
+    if "term" in query:
+        (field, value), = query["term"].items()
+        return source.get(field) == value
+    if "terms" in query:
+        (field, values), = query["terms"].items()
+        return source.get(field) in values
+    if "ids" in query:
+        return doc_id in query["ids"]["values"]
+    if "exists" in query:
+        return source.get(query["exists"]["field"]) is not None
+    if "range" in query:
+        (field, bounds), = query["range"].items()
+        if source.get(field) is None:
+            return False
+        value = _millis(source[field])
+        checks = {"gt": value.__gt__, "gte": value.__ge__, "lt": value.__lt__, "lte": value.__le__}
+        return all(checks[op](_millis(bound)) for op, bound in bounds.items())
+    raise ValueError(f"query not supported by the fake: {query}")
+
+
+def _sort_values(sort, source):
+    values = []
+    for clause in sort or []:
+        (key, spec), = clause.items()
+        if key == "_script":
+            values.append(source.get("priority_rank", PRIORITY_RANK.get(source.get("priority"), 2)))
+        else:
+            values.append(source.get(key) or "")
+    return values
+
+
+class FakeElastic:
+    """In-memory indices plus a converse stub, served over HTTP by serve()."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.indices = {}
+        self.seq_no = 0
+        self.comments = []
+        self.converse_calls = []
+        self.converse = lambda body: (200, {"response": {"message": f"handled by {body.get('agent_id')}"}})
+
+    def put(self, index, doc_id, source):
+        with self.lock:
+            self.seq_no += 1
+            self.indices.setdefault(index, {})[doc_id] = {"_source": dict(source), "_seq_no": self.seq_no}
+
+    def get(self, index, doc_id):
+        with self.lock:
+            return dict(self.indices[index][doc_id]["_source"])
+
+    def search(self, index, body):
+        with self.lock:
+            docs = [(doc_id, dict(doc["_source"]), doc["_seq_no"])
+                    for doc_id, doc in self.indices.get(index, {}).items()]
+        hits = []
+        for doc_id, source, seq_no in docs:
+            if matches(body.get("query"), doc_id, source):
+                hits.append({"_index": index, "_id": doc_id, "_source": source, "_seq_no": seq_no,
+                             "_primary_term": 1, "sort": _sort_values(body.get("sort"), source)})
+        hits.sort(key=lambda hit: hit["sort"])
+        collapse = body.get("collapse")
+        if collapse:
+            inner = collapse["inner_hits"]
+            groups = {}
+            for hit in hits:
+                groups.setdefault(hit["_source"].get(collapse["field"]), []).append(hit)
+            hits = [
+                {**group[0], "inner_hits": {inner["name"]: {"hits": {"hits": group[:inner.get("size", 3)]}}}}
+                for group in groups.values()
+            ]
+        hits = hits[:body.get("size", 10)]
+        for hit in hits:
+            if body.get("_source") is False:
+                hit.pop("_source")
+            if not body.get("seq_no_primary_term"):
+                hit.pop("_seq_no")
+                hit.pop("_primary_term")
+        return 200, {"hits": {"total": {"value": len(hits), "relation": "eq"}, "hits": hits}}
+
+    def update(self, index, doc_id, params, body):
+        with self.lock:
+            doc = self.indices.get(index, {}).get(doc_id)
+            if doc is None:
+                return 404, {"error": {"type": "document_missing_exception"}}
+            if "if_seq_no" in params and int(params["if_seq_no"]) != doc["_seq_no"]:
+                return 409, {"error": {"type": "version_conflict_engine_exception"}}
+            source = doc["_source"]
+            if "doc" in body:
+                source.update(body["doc"])
+            else:
+                script = body["script"]
+                if script["source"] == LEASE_SCRIPT:
+                    _lease(source, script["params"])
+                elif script["source"] == RETRY_SCRIPT:
+                    _retry(source, script["params"])
+                else:
+                    return 400, {"error": {"type": "script_not_supported_by_fake"}}
+            self.seq_no += 1
+            doc["_seq_no"] = self.seq_no
+            fields = params.get("_source", "").split(",")
+            return 200, {
+                "_index": index,
+                "_id": doc_id,
+                "result": "updated",
+                "_seq_no": doc["_seq_no"],
+                "_primary_term": 1,
+                "get": {"_source": {f: source[f] for f in fields if f in source}},
+            }
+
+    def handle(self, method, path, params, body):
+        parts = path.strip("/").split("/")
+        if parts[:2] == ["api", "agent_builder"] and parts[2:] == ["converse"]:
+            self.converse_calls.append(body)
+            return self.converse(body)
+        if parts[:2] == ["api", "cases"] and parts[3:] == ["comments"]:
+            self.comments.append((parts[2], body.get("comment")))
+            return 200, {}
+        if method == "POST" and len(parts) == 2 and parts[1] == "_search":
+            return self.search(parts[0], body)
+        if method == "POST" and len(parts) == 3 and parts[1] == "_update":
+            return self.update(parts[0], parts[2], params, body)
+        if method == "POST" and len(parts) == 2 and parts[1] == "_update_by_query":
+            return 200, {"updated": 0}
+        return 404, {"error": f"no fake for {method} {path}"}
+
+
+def _lease(source, params):
+    source.update(params["doc"])
+    if params["lease_ms"] > 0:
+        source["lease_expires_at"] = _now_ms() + params["lease_ms"]
+    else:
+        source.pop("lease_expires_at", None)
+
+
+def _retry(source, params):
+    attempts = int(source.get("attempts") or 0) + 1
+    source.update({"attempts": attempts, "last_error": params["error"]})
+    source.pop("lease_expires_at", None)
+    if attempts >= params["max_attempts"]:
+        source.update({"status": "dead_letter", "dead_lettered_at": params["now"], "completed_at": params["now"]})
+        source.pop("next_attempt_at", None)
+    else:
+        delay = min(params["max_ms"], params["base_ms"] << min(attempts - 1, 20))
+        source.update({"status": "pending", "next_attempt_at": _now_ms() + delay})
+
+
+def serve(fake):
+    """Start serving fake on a free local port. Returns (server, base URL)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def _respond(self):
+            url = urlsplit(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            status, payload = fake.handle(self.command, url.path, params, body)
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PUT = _respond
+
+        def log_message(self, *_):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
@@ -0,0 +1,32 @@
+from approval_processor import find_decision
+
+APPROVAL = {"approval_id": "apr-100", "created_at": "2026-01-01T10:00:00Z"}
+
+
+def comment(text, at="2026-01-01T11:00:00Z"):
+    return {"comment": text, "created_at": at}
+
+
+def test_find_decision_returns_the_newest_human_decision():
+    comments = [comment("DENIED, too risky", "2026-01-01T12:00:00Z"), comment("APPROVED")]
+    decision, decided_by = find_decision(comments, APPROVAL)
+    assert decision == "denied"
+    assert decided_by is comments[0]
+
+
+def test_find_decision_ignores_comments_older_than_the_approval():
+    assert find_decision([comment("APPROVED", "2026-01-01T09:00:00Z")], APPROVAL) is None
+
+
+def test_find_decision_skips_the_mesh_own_comments():
+    comments = [comment("## Human Approval Required\n\nReply APPROVED or DENIED")]
+    assert find_decision(comments, APPROVAL) is None
+
+
+def test_find_decision_only_applies_named_ids_to_those_approvals():
+    assert find_decision([comment("APPROVED apr-200")], APPROVAL) is None
+    assert find_decision([comment("APPROVED apr-100 and apr-200")], APPROVAL)[0] == "approved"
+
+
+def test_find_decision_needs_the_whole_word():
+    assert find_decision([comment("this is DISAPPROVED for now")], APPROVAL) is None
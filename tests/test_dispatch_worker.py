@@ -0,0 +1,139 @@
+import time
+
+from dispatch_worker import DISPATCH_INDEX, DispatchWorker, fair_order
+
+
+def dispatch(fake, dispatch_id, agent="agent-a", priority="normal", created_at="2026-01-01T00:00:00Z", **fields):
+    rank = {"urgent": 0, "high": 1, "normal": 2, "low": 3}[priority]
+    fake.put(DISPATCH_INDEX, dispatch_id, {
+        "dispatch_id": dispatch_id,
+        "target_agent": agent,
+        "priority": priority,
+        "priority_rank": rank,
+        "status": "pending",
+        "context": f"context of {dispatch_id}",
+        "created_at": created_at,
+        **fields,
+    })
+
+
+def hit(agent, rank, created_at):
+    return {"_id": f"{agent}-{created_at}", "_source": {"target_agent": agent}, "sort": [rank, created_at]}
+
+
+def ids(hits):
+    return [h["_id"] for h in hits]
+
+
+# ---------------------------------------------------------------------------
+# fair_order
+# ---------------------------------------------------------------------------
+
+def test_fair_order_puts_lower_rank_first():
+    hits = [hit("a", 2, "t1"), hit("b", 0, "t2"), hit("c", 1, "t3")]
+    assert ids(fair_order(hits)) == ["b-t2", "c-t3", "a-t1"]
+
+
+def test_fair_order_alternates_agents_within_a_rank():
+    hits = [hit("a", 2, "t1"), hit("a", 2, "t2"), hit("a", 2, "t3"), hit("b", 2, "t4")]
+    assert ids(fair_order(hits)) == ["a-t1", "b-t4", "a-t2", "a-t3"]
+
+
+def test_fair_order_puts_busy_agents_behind_idle_ones():
+    hits = [hit("a", 2, "t1"), hit("b", 2, "t2")]
+    assert ids(fair_order(hits, running={"a": 1})) == ["b-t2", "a-t1"]
+
+
+def test_fair_order_never_lifts_a_busy_agent_above_a_lower_rank():
+    hits = [hit("a", 0, "t1"), hit("b", 2, "t2")]
+    assert ids(fair_order(hits, running={"a": 5})) == ["a-t1", "b-t2"]
+
+
+# ---------------------------------------------------------------------------
+# Claiming and leases, against the fake cluster
+# ---------------------------------------------------------------------------
+
+def test_fetch_pending_returns_claimable_dispatches_in_pick_order(fake):
+    dispatch(fake, "d1", priority="low")
+    dispatch(fake, "d2", agent="agent-b", priority="urgent")
+    dispatch(fake, "d3", status="completed")
+    worker = DispatchWorker()
+    assert ids(worker.fetch_pending(10)) == ["d2", "d1"]
+
+
+def test_only_one_worker_wins_a_claim(fake):
+    dispatch(fake, "d1")
+    first, second = DispatchWorker(), DispatchWorker()
+    hit_first, = first.fetch_pending(10)
+    hit_second, = second.fetch_pending(10)
+    assert first.claim(hit_first) is not None
+    assert second.claim(hit_second) is None
+    source = fake.get(DISPATCH_INDEX, "d1")
+    assert source["status"] == "dispatched"
+    assert source["lease_owner"] == first.owner
+
+
+def test_run_once_completes_every_dispatch(fake):
+    for n in range(5):
+        dispatch(fake, f"d{n}", agent=f"agent-{n % 2}")
+    counts = DispatchWorker(max_workers=4).run(once=True)
+    assert counts["completed"] == 5
+    assert len(fake.converse_calls) == 5
+    for n in range(5):
+        source = fake.get(DISPATCH_INDEX, f"d{n}")
+        assert source["status"] == "completed"
+        assert "lease_expires_at" not in source
+
+
+def test_leased_dispatch_is_not_claimable_until_the_lease_expires(fake):
+    dispatch(fake, "d1")
+    crashed, survivor = DispatchWorker(lease_seconds=0.3), DispatchWorker()
+    crashed_hit, = crashed.fetch_pending(10)
+    assert crashed.claim(crashed_hit) is not None
+    assert survivor.fetch_pending(10) == []
+    time.sleep(0.4)
+    reclaim, = survivor.fetch_pending(10)
+    assert reclaim["_source"]["status"] == "dispatched"
+    assert survivor.run(once=True)["completed"] == 1
+    assert fake.get(DISPATCH_INDEX, "d1")["status"] == "completed"
+    assert len(fake.converse_calls) == 1
+
+
+def test_renewed_lease_is_not_reclaimed(fake):
+    dispatch(fake, "d1")
+    holder, other = DispatchWorker(lease_seconds=0.3), DispatchWorker()
+    lease = holder.claim(holder.fetch_pending(10)[0])
+    holder.in_flight["d1"] = lease
+    for _ in range(3):
+        time.sleep(0.15)
+        holder.renew_leases()
+        assert other.fetch_pending(10) == []
+    assert not lease.get("lost")
+
+
+def test_reclaimed_dispatch_leaves_the_old_lease_lost(fake):
+    dispatch(fake, "d1")
+    crashed, survivor = DispatchWorker(lease_seconds=0.2), DispatchWorker()
+    lease = crashed.claim(crashed.fetch_pending(10)[0])
+    crashed.in_flight["d1"] = lease
+    time.sleep(0.3)
+    assert survivor.claim(survivor.fetch_pending(10)[0]) is not None
+    crashed.renew_leases()
+    assert lease["lost"]
+    assert fake.get(DISPATCH_INDEX, "d1")["lease_owner"] == survivor.owner
+
+
+def test_failed_call_is_retried_later_then_dead_lettered(fake):
+    dispatch(fake, "d1", case_id="case-1")
+    fake.converse = lambda body: (500, {"error": "boom"})
+    worker = DispatchWorker(max_attempts=2)
+    assert worker.run(once=True)["retried"] == 1
+    source = fake.get(DISPATCH_INDEX, "d1")
+    assert source["status"] == "pending"
+    assert source["attempts"] == 1
+    assert worker.fetch_pending(10) == []
+
+    fake.put(DISPATCH_INDEX, "d1", {**source, "next_attempt_at": 0})
+    assert worker.run(once=True)["dead_lettered"] == 1
+    assert fake.get(DISPATCH_INDEX, "d1")["status"] == "dead_letter"
+    assert fake.comments and fake.comments[0][0] == "case-1"
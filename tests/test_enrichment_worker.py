@@ -0,0 +1,33 @@
+import pytest
+
+from enrichment_worker import classify, parse_iocs
+
+
+@pytest.mark.parametrize("token, expected", [
+    ("8.8.8.8", ("ip", "8.8.8.8")),
+    ("2001:DB8::1", ("ip", "2001:db8::1")),
+    ("8[.]8[.]8[.]8", ("ip", "8.8.8.8")),
+    ("hxxps://evil[.]example/payload", ("url", "https://evil.example/payload")),
+    ("Evil.Example.COM.", ("domain", "evil.example.com")),
+    ("'d41d8cd98f00b204e9800998ecf8427e'", ("file", "d41d8cd98f00b204e9800998ecf8427e")),
+    ("E3B0C44298FC1C149AFBF4C8996FB92427AE41E4649B934CA495991B7852B855",
+     ("file", "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855")),
+])
+def test_classify_normalises_iocs(token, expected):
+    assert classify(token) == expected
+
+
+@pytest.mark.parametrize("token", ["", "hello", "999.1.1.1x", "deadbeef", "localhost"])
+def test_classify_rejects_non_iocs(token):
+    assert classify(token) is None
+
+
+def test_parse_iocs_dedupes_in_input_order_and_reports_rejects():
+    iocs, rejected = parse_iocs("8.8.8.8, evil[.]example\n8[.]8[.]8[.]8; not-an-ioc | EVIL.example")
+    assert iocs == [("ip", "8.8.8.8"), ("domain", "evil.example")]
+    assert rejected == ["not-an-ioc"]
+
+
+def test_parse_iocs_handles_empty_input():
+    assert parse_iocs(None) == ([], [])
+    assert parse_iocs("  \n ") == ([], [])
@@ -0,0 +1,78 @@
+from mitre_coverage import CoverageMatrix, diff_reports
+
+TECHNIQUES = {
+    "T1059": {"name": "Command and Scripting Interpreter", "tactics": ["execution"], "parent": None},
+    "T1059.001": {"name": "PowerShell", "tactics": ["execution"], "parent": "T1059"},
+    "T1078": {"name": "Valid Accounts", "tactics": ["initial-access", "persistence"], "parent": None},
+    "T1190": {"name": "Exploit Public-Facing Application", "tactics": ["initial-access"], "parent": None},
+}
+TACTICS = {"execution": "Execution", "initial-access": "Initial Access", "persistence": "Persistence"}
+
+
+def rule(*technique_ids, enabled=True, severity="high", updated_at="2026-01-01T00:00:00Z"):
+    techniques = [{"id": t} for t in technique_ids if "." not in t]
+    for sub in (t for t in technique_ids if "." in t):
+        techniques.append({"id": sub.split(".")[0], "subtechnique": [{"id": sub}]})
+    return {
+        "enabled": enabled,
+        "severity": severity,
+        "updated_at": updated_at,
+        "threat": [{"framework": "MITRE ATT&CK", "technique": techniques}],
+    }
+
+
+def build(*rules):
+    matrix = CoverageMatrix(TECHNIQUES)
+    for r in rules:
+        matrix.add_rule(r)
+    return matrix.report(TACTICS)
+
+
+def tactic(report, shortname):
+    return next(row for row in report["tactics"] if row["shortname"] == shortname)
+
+
+def test_subtechnique_rule_covers_its_parent():
+    report = build(rule("T1059.001"))
+    assert report["covered"] == ["T1059", "T1059.001"]
+    assert report["techniques_covered"] == 1
+    assert report["subtechniques_covered"] == 1
+
+
+def test_disabled_rules_count_only_as_any_coverage():
+    report = build(rule("T1078", enabled=False))
+    assert report["techniques_covered"] == 0
+    assert report["techniques_covered_any"] == 1
+    assert tactic(report, "persistence")["disabled_only"] == ["T1078 Valid Accounts"]
+
+
+def test_tactic_rows_follow_matrix_order_and_list_gaps():
+    report = build(rule("T1078", severity="low"), rule("T1059"))
+    assert [row["shortname"] for row in report["tactics"]] == ["initial-access", "execution", "persistence"]
+    initial = tactic(report, "initial-access")
+    assert (initial["covered"], initial["total"], initial["pct"]) == (1, 2, 50.0)
+    assert initial["no_rule"] == ["T1190 Exploit Public-Facing Application"]
+    assert initial["low_only"] == ["T1078 Valid Accounts"]
+    assert report["coverage_pct"] == round(2 * 100 / 3, 1)
+
+
+def test_unknown_techniques_and_severity_counts():
+    report = build(rule("T9999", severity="critical"), rule("T1190", enabled=False, severity="critical"))
+    assert report["unknown_techniques"] == ["T9999"]
+    assert report["rules_total"] == 2
+    assert report["rules_enabled"] == 1
+    assert report["rules_by_severity"]["critical"] == 1
+
+
+def test_diff_reports_lists_gained_and_lost_coverage():
+    previous = build(rule("T1078"))
+    current = build(rule("T1190"), rule("T1059"))
+    diff = diff_reports(previous, current)
+    assert diff["newly_covered"] == ["T1059", "T1190"]
+    assert diff["lost_coverage"] == ["T1078"]
+    assert diff["coverage_pct_change"] == round(current["coverage_pct"] - previous["coverage_pct"], 1)
+    assert diff["tactics"] == {"Execution": 100.0, "Persistence": -100.0}
+
+
+def test_diff_reports_without_a_previous_report():
+    assert diff_reports(None, build()) is None
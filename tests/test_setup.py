@@ -0,0 +1,83 @@
+import io
+import json
+
+import pytest
+
+import setup
+from setup import _JsonStream, mapping_drift
+
+
+# ---------------------------------------------------------------------------
+# _JsonStream
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # Values and numbers straddle chunk boundaries on every read.
+    monkeypatch.setattr(setup, "JSON_READ_CHUNK", 7)
+
+
+def test_json_stream_walks_an_array(small_chunks):
+    items = [{"id": n, "name": f"item {n}", "tags": ["a", "b"]} for n in range(20)]
+    stream = _JsonStream(io.StringIO(json.dumps(items, indent=2)))
+    assert list(stream.array()) == items
+    assert stream.peek() == ""
+
+
+def test_json_stream_does_not_split_a_number_at_a_chunk_boundary(small_chunks):
+    stream = _JsonStream(io.StringIO("[1234567890123, 42]"))
+    assert list(stream.array()) == [1234567890123, 42]
+
+
+def test_json_stream_reads_an_array_inside_an_object(small_chunks):
+    stream = _JsonStream(io.StringIO('{"type": "bundle", "objects": [{"id": 1}, {"id": 2}]}'))
+    stream.expect("{")
+    assert stream.value() == "type"
+    stream.expect(":")
+    assert stream.value() == "bundle"
+    stream.expect(",")
+    assert stream.value() == "objects"
+    stream.expect(":")
+    assert list(stream.array()) == [{"id": 1}, {"id": 2}]
+    stream.expect("}")
+
+
+def test_json_stream_rejects_an_unterminated_array(small_chunks):
+    stream = _JsonStream(io.StringIO('[{"id": 1}, '))
+    with pytest.raises(ValueError):
+        list(stream.array())
+
+
+def test_json_stream_expect_reports_the_wrong_character():
+    with pytest.raises(ValueError, match="expected '\\['"):
+        list(_JsonStream(io.StringIO('{"a": 1}')).array())
+
+
+# ---------------------------------------------------------------------------
+# mapping_drift
+# ---------------------------------------------------------------------------
+
+def test_mapping_drift_ignores_matching_and_extra_live_fields():
+    expected = {"properties": {"status": {"type": "keyword"}}}
+    actual = {"properties": {"status": {"type": "keyword"}, "dynamic_field": {"type": "text"}}}
+    assert mapping_drift(expected, actual) == []
+
+
+def test_mapping_drift_reports_missing_and_retyped_fields():
+    expected = {"properties": {"status": {"type": "keyword"}, "created_at": {"type": "date"}}}
+    actual = {"properties": {"status": {"type": "text"}}}
+    assert mapping_drift(expected, actual) == ["status: text (expected keyword)", "created_at: missing"]
+
+
+def test_mapping_drift_recurses_into_objects_and_multi_fields():
+    expected = {"properties": {
+        "rule": {"properties": {"name": {"type": "text", "fields": {"raw": {"type": "keyword"}}}}},
+    }}
+    actual = {"properties": {"rule": {"properties": {"name": {"type": "text", "fields": {}}}}}}
+    assert mapping_drift(expected, actual) == ["rule.name.raw: missing"]
+
+
+def test_mapping_drift_reports_a_different_inference_endpoint():
+    expected = {"properties": {"summary": {"type": "semantic_text", "inference_id": "e5"}}}
+    actual = {"properties": {"summary": {"type": "semantic_text", "inference_id": "elser"}}}
+    assert mapping_drift(expected, actual) == ["summary: inference_id elser (expected e5)"]